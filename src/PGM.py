@@ -1,5 +1,9 @@
 from multiprocessing.sharedctypes import Value
 import os
+import io
+import copy
+import heapq
+import json
 import itertools
 from platform import node
 import random
@@ -8,6 +12,10 @@ import math
 import sys
 from unicodedata import numeric
 
+import numpy as np
+
+from elim_order import moral_graph, elim_order
+
 # sys.setrecursionlimit(5000)
 
 
@@ -46,16 +54,99 @@ class Node:
         self.cared = True
 
 
-class gNode:
+def read_uai_numbers(filename):
+    '''
+    read a uai file as a token stream, in any layout of whitespace
+    return (the type in the first token, float64 array of all the numbers after it)
+    '''
+    with open(filename, 'rb') as f:
+        m = re.match(rb'\s*(\S+)', f.read(4096))
+        if m is None:
+            raise ValueError('Empty uai file', filename)
+        kind = m.group(1).decode()
+        # parsed from the file, without a copy of its text; sep=' ' matches any run of whitespace
+        f.seek(m.end())
+        numbers = np.fromfile(f, sep=' ')
+    return kind, numbers
+
+
+def read_uai_tables(numbers, pos, num_tables):
+    '''
+    numbers[pos]: the size of the first table, followed by its values and the next table
+    return (list of 1D views of the tables, the position after them)
+    '''
+    tables = []
+    for i in range(num_tables):
+        if pos >= len(numbers):
+            raise ValueError('Missing table', i)
+        num_vals = int(numbers[pos])
+        pos += 1
+        if pos + num_vals > len(numbers):
+            raise ValueError('Truncated table', i)
+        tables.append(numbers[pos:pos+num_vals])
+        pos += num_vals
+    return tables, pos
+
+
+class TableView:
+    '''
+    a (state_comb x num_states) cpt over a slice of the numbers read from a file,
+    the rows are converted to lists of floats when first accessed and kept,
+    so the element loops of the encoders (n.cpt[j][i]) convert each row once
+    '''
+
+    def __init__(self, vals, num_states):
+        self.table = vals.reshape(-1, num_states)
+        self.rows = [None] * len(self.table)
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, i):
+        row = self.rows[i]
+        if row is None:
+            row = self.table[i].tolist()
+            self.rows[i] = row
+        return row
+
+    def __iter__(self):
+        for i in range(len(self.table)):
+            yield self[i]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.array(self.table, dtype=dtype, copy=copy)
+
+
+SNAPSHOT_VERSION = 2
+
+
+def snapshot_sources(filename):
     '''
-    node for graph operation
+    the files a network is read from, the .id and .pvo files of an ID in uai format
     '''
+    sources = [filename]
+    name, ext = os.path.splitext(filename)
+    if ext == '.uai':
+        for f in [filename.replace('.uai', '.id'), filename.replace('.uai', '.pvo')]:
+            if os.path.isfile(f):
+                sources.append(f)
+    return sources
 
-    def __init__(self, node):
-        self.id = node.id
-        self.parents = [n.id for n in node.parents if n.depend]
-        self.children = [n.id for n in node.children if n.depend]
-        self.neighbors = self.parents + self.children
+
+def snapshot_stamp(sources):
+    '''
+    (file name, size, mtime in ns) of each source, a snapshot is reused only if they all match,
+    an older mtime after cp -p, tar or rsync -a is a change as well
+    return None if a source is not readable
+    '''
+    stamp = []
+    try:
+        for f in sources:
+            st = os.stat(f)
+            stamp.append([os.path.basename(f), st.st_size, st.st_mtime_ns])
+    except OSError:
+        return None
+    return stamp
 
 
 evid_query = ['PE', 'MPE', 'MAP', 'MEU']
@@ -76,6 +167,7 @@ class Network:
         self.copy_nodes = []
 
         self.minfill_order = []
+        self.induced_width = 0
 
         # for MEU in ID
         self.max_dec_level = 0
@@ -96,30 +188,57 @@ class Network:
         self.dec = []       # d variable for SDP (node_id, state)
         self.unobserved = []    # H variables for SDP (node_id)
 
-    def read(self, filename, evid_file='', query_file='', sdp_file=''):
+        # the edges out of the evidence removed by relevance.py (evid_id, child_id, state)
+        self.removed_edges = []
+        # the evidence nodes conditioned by evidence.py (node_id, state) and their constant factor
+        self.collapsed_evids = []
+        self.evid_factor = 1.0
+
+    def read(self, filename, evid_file='', query_file='', sdp_file='', snapshot=False):
+        self.read_network(filename, snapshot)
+        self.read_query(filename, evid_file, query_file, sdp_file)
+
+    def read_network(self, filename, snapshot=False):
+        '''
+        snapshot: reuse and write the binary snapshot <filename>.npz of the network (opt-in, encode.py --snapshot)
+        '''
         name, ext = os.path.splitext(filename)
+
+        # reuse the binary snapshot of the network if the sources are the ones it was saved from,
+        # stamped before reading so a source changed meanwhile does not match
+        stamp = snapshot_stamp(snapshot_sources(filename)) if snapshot else None
+        snapshot_file = filename + '.npz'
+        if stamp is None or not self.load_snapshot(snapshot_file, stamp):
+            if ext == '.uai':
+                self.read_uai(filename)
+            elif ext == '.erg':
+                self.read_erg(filename)
+            elif ext == '.bif':
+                self.read_bif_bn(filename)
+            elif ext == '.dne':
+                self.read_dne_bn(filename)
+            elif ext == '.limid':
+                self.read_limid(filename)
+            elif ext == '.cpt':
+                self.read_cpt(filename)
+            if stamp is not None and len(self.nodes) > 0:
+                self.save_snapshot(snapshot_file, stamp)
+
+    def read_query(self, filename, evid_file='', query_file='', sdp_file=''):
+        '''
+        filename: the network file, the default query files are named after it
+        '''
         if len(evid_file) == 0:
             evid_file = filename + '.evid'
         if len(query_file) == 0:
             map_file = filename + '.map'
             query_file = filename + '.query'
+        else:
+            map_file = query_file
         if len(sdp_file) == 0:
             sdp_file = filename + '.sdp'
             query_file = filename + '.query'
 
-        if ext == '.uai':
-            self.read_uai(filename)
-        elif ext == '.erg':
-            self.read_erg(filename)
-        elif ext == '.bif':
-            self.read_bif_bn(filename)
-        elif ext == '.dne':
-            self.read_dne_bn(filename)
-        elif ext == '.limid':
-            self.read_limid(filename)
-        elif ext == '.cpt':
-            self.read_cpt(filename)
-
         if self.query in evid_query:
             if os.path.isfile(evid_file):
                 self.read_evid(evid_file)
@@ -141,16 +260,157 @@ class Network:
                 self.read_sdp(query_file)
                 print('Find sdp file', query_file)
 
+    def copy(self):
+        '''
+        a copy to be queried, pruned and encoded on its own,
+        the nodes are copied and the tables are shared
+        '''
+        net = copy.copy(self)
+        old2new = {}
+        for n in self.nodes + self.utils + list(self.id2node.values()) + \
+                list(self.name2node.values()) + list(self.id2util.values()):
+            if n not in old2new:
+                old2new[n] = copy.copy(n)
+        for n in old2new.values():
+            n.parents = [old2new[p] for p in n.parents]
+            n.children = [old2new[c] for c in n.children]
+
+        net.nodes = [old2new[n] for n in self.nodes]
+        net.utils = [old2new[n] for n in self.utils]
+        net.id2node = {id: old2new[n] for id, n in self.id2node.items()}
+        net.name2node = {name: old2new[n] for name, n in self.name2node.items()}
+        net.id2util = {id: old2new[n] for id, n in self.id2util.items()}
+        net.copy_nodes = [old2new[n] for n in self.copy_nodes]
+        net.level2dec = {l: [old2new[n] for n in nodes] for l, nodes in self.level2dec.items()}
+        if self.super_util is not None:
+            net.super_util = old2new[self.super_util]
+        net.minfill_order = self.minfill_order.copy()
+        net.evids = self.evids.copy()
+        net.query_var = self.query_var.copy()
+        net.dec = self.dec.copy()
+        net.unobserved = self.unobserved.copy()
+        net.removed_edges = self.removed_edges.copy()
+        net.collapsed_evids = self.collapsed_evids.copy()
+        return net
+
+    def save_snapshot(self, snapshot, stamp):
+        '''
+        save the network just read (nodes, parents, children and tables) as .npz,
+        the snapshot is skipped if it cannot be written
+        stamp: the snapshot_stamp of the sources read
+        '''
+        all_nodes = self.nodes + self.utils
+        id2node = {n.id: n for n in all_nodes}
+        if len(id2node) != len(all_nodes):
+            return
+
+        meta = {
+            'version': SNAPSHOT_VERSION,
+            'sources': stamp,
+            'num_nodes': self.num_nodes,
+            'num_utils': len(self.utils),
+            'kinds': [n.kind for n in all_nodes],
+            'names': [n.name for n in all_nodes],
+            'states': [n.states for n in all_nodes],
+            'in_id2node': [self.id2node.get(n.id) is n for n in all_nodes],
+            'in_name2node': [self.name2node.get(n.name) is n for n in all_nodes],
+        }
+        parents = [[p.id for p in n.parents] for n in all_nodes]
+        children = [[c.id for c in n.children] for n in all_nodes]
+
+        try:
+            # ValueError: rows of different lengths
+            tables = []
+            cols = []
+            for n in all_nodes:
+                if n.kind == 'utility':
+                    tables.append(np.asarray(n.vals, dtype=float).ravel())
+                    cols.append(0)
+                else:
+                    table = np.asarray(n.cpt, dtype=float)
+                    tables.append(table.ravel())
+                    cols.append(table.shape[1] if table.ndim == 2 else 0)
+
+            buf = io.BytesIO()
+            np.savez(buf,
+                     meta=np.array(json.dumps(meta)),
+                     ids=np.array([n.id for n in all_nodes], dtype=np.int64),
+                     num_states=np.array([n.num_states for n in all_nodes], dtype=np.int64),
+                     parent_ptr=np.cumsum([0] + [len(l) for l in parents]),
+                     parents=np.array(sum(parents, []), dtype=np.int64),
+                     child_ptr=np.cumsum([0] + [len(l) for l in children]),
+                     children=np.array(sum(children, []), dtype=np.int64),
+                     table_ptr=np.cumsum([0] + [len(t) for t in tables]),
+                     table_cols=np.array(cols, dtype=np.int64),
+                     tables=np.concatenate(tables + [np.zeros(0)]))
+            # written as a whole so a concurrent reader never sees a partial file
+            tmp = '%s.%d.tmp' % (snapshot, os.getpid())
+            with open(tmp, 'wb') as f:
+                f.write(buf.getvalue())
+            os.replace(tmp, snapshot)
+        except (OSError, ValueError):
+            pass
+
+    def load_snapshot(self, snapshot, stamp):
+        '''
+        load a network saved by save_snapshot from the sources of the same stamp
+        return False if the snapshot is not readable or not of these sources
+        '''
+        try:
+            with np.load(snapshot) as z:
+                meta = json.loads(str(z['meta']))
+                if meta['version'] != SNAPSHOT_VERSION or meta['sources'] != stamp:
+                    return False
+                data = {k: z[k] for k in z.files if k != 'meta'}
+        except (OSError, ValueError, KeyError):
+            return False
+
+        ids = data['ids'].tolist()
+        all_nodes = []
+        for i, id in enumerate(ids):
+            n = Node(id, meta['kinds'][i], meta['names'][i])
+            n.num_states = int(data['num_states'][i])
+            n.states = meta['states'][i]
+            start, end = data['table_ptr'][i], data['table_ptr'][i+1]
+            cols = int(data['table_cols'][i])
+            if n.kind == 'utility':
+                n.vals = data['tables'][start:end].tolist()
+            elif cols > 0:
+                n.cpt = TableView(data['tables'][start:end], cols)
+            all_nodes.append(n)
+
+        id2node = {n.id: n for n in all_nodes}
+        for i, n in enumerate(all_nodes):
+            p_start, p_end = data['parent_ptr'][i], data['parent_ptr'][i+1]
+            n.parents = [id2node[id] for id in data['parents'][p_start:p_end].tolist()]
+            c_start, c_end = data['child_ptr'][i], data['child_ptr'][i+1]
+            n.children = [id2node[id] for id in data['children'][c_start:c_end].tolist()]
+
+        self.num_nodes = meta['num_nodes']
+        num_utils = meta['num_utils']
+        self.nodes = all_nodes[:len(all_nodes)-num_utils]
+        self.utils = all_nodes[len(all_nodes)-num_utils:]
+        self.num_utils = num_utils
+        for i, n in enumerate(all_nodes):
+            if meta['in_id2node'][i]:
+                self.id2node[n.id] = n
+            if meta['in_name2node'][i]:
+                self.name2node[n.name] = n
+        for n in self.utils:
+            self.id2util[n.id] = n
+        return True
+
     def read_uai(self, filename):
         f = open(filename, 'r')
-        line = f.readline().strip()
+        tokens = f.read(1024).split()
         f.close()
-        if line == 'ID':
+        kind = tokens[0] if tokens else ''
+        if kind == 'ID':
             self.read_uai_id(filename)
-        elif line == 'BAYES':
+        elif kind == 'BAYES':
             self.read_uai_bn(filename)
         else:
-            raise ValueError('Invalid type of network', line)
+            raise ValueError('Invalid type of network', kind)
 
     def read_erg(self, filename):
         f = open(filename, 'r')
@@ -193,51 +453,45 @@ class Network:
             cpt_lino += 1
 
     def read_uai_bn(self, filename):
-        f = open(filename, 'r')
-        lines = f.readlines()
-        f.close()
+        kind, numbers = read_uai_numbers(filename)
 
-        if lines[0].strip() != 'BAYES':
+        if kind != 'BAYES':
             print('Only accept Bayesian network')
             return
 
-        self.num_nodes = int(lines[1])
+        self.num_nodes = int(numbers[0])
+        pos = 1
 
         # each node has how many states
-        pars = lines[2].strip().split()
         for i in range(self.num_nodes):
             n = Node(i, 'chance')
-            n.num_states = int(pars[i])
+            n.num_states = int(numbers[pos+i])
             n.states = [j for j in range(n.num_states)]
             self.nodes.append(n)
             self.id2node[i] = n
+        pos += self.num_nodes
 
         '''
             only consider the case that
             all nodes are listed and from 0 ~ n
         '''
         # each node has [incoming nodes]
+        pos += 1    # number of tables, one per node
         for i in range(self.num_nodes):
-            pars = lines[4+i].strip().split()
-            num_parents = int(pars[0]) - 1
+            num_parents = int(numbers[pos]) - 1
             n = self.id2node[i]
             for j in range(num_parents):
-                m = int(pars[j+1])
+                m = int(numbers[pos+j+1])
                 p = self.id2node[m]
                 n.parents.append(p)
                 p.children.append(n)
+            pos += num_parents + 2
 
-        cpt_lino = 4 + self.num_nodes + 1
+        # cpt: views of numbers
+        tables, pos = read_uai_tables(numbers, pos, self.num_nodes)
         for i in range(self.num_nodes):
             n = self.id2node[i]
-            num_vals = int(lines[cpt_lino])
-            num_rows = int(num_vals / n.num_states)
-            for j in range(num_rows):
-                cpt_lino += 1
-                pars = lines[cpt_lino].strip().split()
-                vals = [float(p) for p in pars]
-                n.cpt.append(vals)
-            cpt_lino += 2
+            n.cpt = TableView(tables[i], n.num_states)
 
     def read_uai_id(self, filename):
         id_file = filename.replace('.uai', '.id')
@@ -252,17 +506,16 @@ class Network:
         num_relations = int(lines[2])
         relation_types = lines[3].strip().split()
 
-        f = open(filename, 'r')
-        lines = f.readlines()
-        f.close()
+        kind, numbers = read_uai_numbers(filename)
 
-        if lines[0].strip() != 'ID':
-            print('Only accept ID, get', lines[0].strip())
+        if kind != 'ID':
+            print('Only accept ID, get', kind)
             return
 
         # nodes
-        assert self.num_nodes == int(lines[1])
-        pars = lines[2].strip().split()
+        assert self.num_nodes == int(numbers[0])
+        pars = numbers[1:1+self.num_nodes].astype(int)
+        pos = 1 + self.num_nodes
         for i in range(self.num_nodes):
             if node_types[i] == 'C':
                 n = Node(i, 'chance')
@@ -276,12 +529,13 @@ class Network:
             self.id2node[i] = n
 
         # relations
-        assert num_relations == int(lines[3])
+        assert num_relations == int(numbers[pos])
+        pos += 1
         table_ids = []  # the node id own the table
         for i in range(num_relations):
-            lino = 4+i
-            pars = lines[lino].strip().split()
-            assert int(pars[0]) == (len(pars)-1)
+            num_pars = int(numbers[pos])
+            pars = numbers[pos:pos+num_pars+1].astype(int)
+            pos += num_pars + 1
             if relation_types[i] == 'P':
                 cid = int(pars[-1])
                 n = self.id2node[cid]
@@ -303,28 +557,19 @@ class Network:
             else:
                 raise ValueError('Unknown relation type', relation_types[i])
 
-        # cpts
-        lino = num_relations + 5
-        for cid in table_ids:
+        # cpts: views of numbers
+        tables, pos = read_uai_tables(numbers, pos, num_relations)
+        for cid, vals in zip(table_ids, tables):
             n = self.id2node.get(cid)
             if n is None:
                 n = self.id2util.get(cid)
 
-            num_vals = int(lines[lino])
-            vals = []
-            for i in range(num_vals):
-                lino += 1
-                vals.append(float(lines[lino]))
-
             if n.kind == 'chance':
-                num_col = n.num_states
-                num_row = num_vals / num_col
-                n.cpt = [vals[i:i+num_col] for i in range(0, num_vals, num_col)]
+                n.cpt = TableView(vals, n.num_states)
             elif n.kind == 'utility':
-                n.vals = vals
+                n.vals = vals.tolist()
             else:
                 raise ValueError('Unknown node type', n.kind)
-            lino += 2
 
         # decision
         f_pvo = open(pvo_file, 'r')
@@ -955,31 +1200,31 @@ class Network:
         for n in self.nodes:
             n.visit = False
 
-        if not reverse:
-            for n in self.nodes:
-                if len(n.parents) == 0:
-                    n.visit = True
-                    self.dfs_rec(n)
-        else:
-            for n in self.nodes:
-                if len(n.children) == 0:
-                    n.visit = True
-                    self.dfs_rec(n, reverse)
+        for n in self.nodes:
+            if len(n.children if reverse else n.parents) == 0:
+                n.visit = True
+                self.dfs_rec(n, reverse)
 
     def dfs_rec(self, n, reverse=False):
-        if not reverse:
-            for c in n.children:
-                if c.visit == False:
-                    c.visit = True
-                    self.dfs_rec(c)
-        else:
-            for p in n.parents:
-                if p.visit == False:
-                    p.visit = True
-                    self.dfs_rec(p, reverse)
-
-        self.finish_id += 1
-        n.finish_id = self.finish_id
+        '''
+        set the finish id of the nodes reached from n (by the parents if reverse),
+        the same order as the recursion but with an explicit stack
+        '''
+        # (node, index of the next child)
+        stack = [(n, 0)]
+        while len(stack) > 0:
+            node, i = stack[-1]
+            nexts = node.parents if reverse else node.children
+            while i < len(nexts) and nexts[i].visit:
+                i += 1
+            if i < len(nexts):
+                stack[-1] = (node, i + 1)
+                nexts[i].visit = True
+                stack.append((nexts[i], 0))
+                continue
+            stack.pop()
+            self.finish_id += 1
+            node.finish_id = self.finish_id
 
     def topo_sort(self, method=0):
         '''
@@ -998,28 +1243,30 @@ class Network:
             self.nodes = [self.id2node[id] for id in order]
 
     def rec_remove(self):
-        # copy nodes
-        gnodes = []
-        id2gnodes = {}
-        for n in self.nodes:
-            if n.depend:
-                gn = gNode(n)
-                gnodes.append(gn)
-                id2gnodes[gn.id] = gn
-
+        '''
+        Kahn's algorithm on the depend nodes, the first node in self.nodes
+        without parents left is removed first
+        '''
+        ids = [n.id for n in self.nodes if n.depend]
+        index = {id: i for i, id in enumerate(ids)}
+        children = [[] for id in ids]
+        num_parents = [0] * len(ids)
+        for i, id in enumerate(ids):
+            for p in self.id2node[id].parents:
+                j = index.get(p.id)
+                if j is not None and p.depend:
+                    children[j].append(i)
+                    num_parents[i] += 1
+
+        ready = [i for i in range(len(ids)) if num_parents[i] == 0]
         order = []
-        while len(gnodes) > 0:
-            # find no parent
-            choice = None
-            for gn in gnodes:
-                if len(gn.parents) == 0:
-                    choice = gn
-                    break
-            # remove
-            for id in choice.children:
-                id2gnodes[id].parents.remove(choice.id)
-            order.append(choice.id)
-            gnodes.remove(choice)
+        while len(ready) > 0:
+            i = heapq.heappop(ready)
+            order.append(ids[i])
+            for j in children[i]:
+                num_parents[j] -= 1
+                if num_parents[j] == 0:
+                    heapq.heappush(ready, j)
         return order
 
     def normalize_util(self):
@@ -1271,11 +1518,16 @@ class Network:
             self.copy_not_depend_d()
 
     def mark_depend(self, n):
-        if n.depend:
-            return
-        n.depend = True
-        for p in n.parents:
-            self.mark_depend(p)
+        '''
+        mark n and its ancestors
+        '''
+        stack = [n]
+        while len(stack) > 0:
+            node = stack.pop()
+            if node.depend:
+                continue
+            node.depend = True
+            stack += [p for p in node.parents if not p.depend]
 
     def copy_not_depend_d(self):
         for n in self.nodes:
@@ -1289,55 +1541,17 @@ class Network:
 
         return num
 
-    def minfill(self):
-        # copy nodes
-        gnodes = []
-        id2gnodes = {}
-        for n in self.nodes:
-            if n.depend:
-                gn = gNode(n)
-                gnodes.append(gn)
-                id2gnodes[gn.id] = gn
-
-        # start eliminate
-        minfill_order = []
-        while len(gnodes) > 0:
-            # find minfill
-            min_num = math.inf
-            choice = None
-            for gn in gnodes:
-                num = self.cal_fill(id2gnodes, gn)
-                if num < min_num:
-                    choice = gn
-                    min_num = num
-            gnodes = self.do_fill(gnodes, id2gnodes, choice)
-            minfill_order.append(choice.id)
-
-        self.minfill_order = minfill_order
-        self.copy_nodes = self.nodes.copy()
-        self.nodes = [self.id2node[id] for id in minfill_order]
-
-    def cal_fill(self, id2gnodes, gn, weighted=True):
-        num = 0
-        for id in gn.neighbors:
-            neigh = id2gnodes[id]
-            added_neigh = (set(gn.neighbors) | set(neigh.neighbors)) - set(neigh.neighbors)
-            if not weighted:
-                num += len(added_neigh)
-            else:
-                for nid in added_neigh:
-                    num += self.id2node[id].num_states * self.id2node[nid].num_states
-        return num
-
-    def do_fill(self, gnodes, id2gnodes, gn):
-        gnodes.remove(gn)
-        for id in gn.neighbors:
-            neigh = id2gnodes[id]
-            neigh.neighbors.remove(gn.id)
-            neigh.neighbors = list(set(gn.neighbors) | set(neigh.neighbors))
-            neigh.neighbors.remove(id)
+    def minfill(self, heuristic='wminfill', time_limit=0):
+        '''
+        order the depend nodes by a greedy elimination of the moral graph (see elim_order.py)
+        '''
+        adj, weights = moral_graph(self)
+        order, width = elim_order(adj, weights, heuristic, time_limit=time_limit)
 
-        return gnodes
+        self.minfill_order = order
+        self.induced_width = width
+        self.copy_nodes = self.nodes.copy()
+        self.nodes = [self.id2node[id] for id in order]
 
     def find_connected_components(self):
         for n in self.nodes:
@@ -1359,25 +1573,19 @@ class Network:
         to find connected components (undirected graph)
         '''
 
+        # a node is pushed once, when it is visited
         n.visit = True
         n.component_label = component_label
         stack = [n]
-        cnt = 0
         while len(stack) > 0:
-            cnt += 1
             node = stack.pop()
-            for c in (node.parents + node.children):
-                if not c.depend:
-                    continue
-                if c.visit:
-                    continue
-                c.visit = True
-                c.component_label = component_label
-                if c in stack:
-                    print('already in')
-                    import pdb
-                    pdb.set_trace()
-                stack.append(c)
+            for neighbors in (node.parents, node.children):
+                for c in neighbors:
+                    if not c.depend or c.visit:
+                        continue
+                    c.visit = True
+                    c.component_label = component_label
+                    stack.append(c)
 
     def collect_cared_nodes(self):
         self.copy_nodes = self.nodes.copy()
@@ -0,0 +1,163 @@
+import heapq
+
+'''
+An and-inverter graph built in-process from cube sets, for the bit_aig encoding
+
+A literal is 2 * node + complement, node 0 is the constant false, so the
+literals 0 and 1 are false and true. The inputs are nodes 1..num_inputs.
+The AND nodes are structurally hashed and the constants are propagated
+when they are created, the wide ANDs and ORs of the cubes are balanced.
+
+    aig = AIG(3)
+    f = aig.sop(['1-0', '01-'])
+    lits = aig.tseitin([f], [5, 6, 7], new_var, clauses)
+'''
+
+
+class AIG:
+    def __init__(self, num_inputs):
+        self.num_inputs = num_inputs
+        # fanins of the AND nodes, None for the constant and the inputs
+        self.fanins = [None] * (num_inputs + 1)
+        self.levels = [0] * (num_inputs + 1)
+        self.strash = {}
+
+    def input(self, i):
+        '''
+        the positive literal of the i-th input (from 0)
+        '''
+        return 2 * (i + 1)
+
+    def level(self, lit):
+        return self.levels[lit >> 1]
+
+    def and_(self, a, b):
+        if a > b:
+            a, b = b, a
+        # constants and trivial cases
+        if a == 0:
+            return 0
+        if a == 1:
+            return b
+        if a == b:
+            return a
+        if a ^ b == 1:
+            return 0
+
+        node = self.strash.get((a, b))
+        if node is None:
+            node = len(self.fanins)
+            self.fanins.append((a, b))
+            self.levels.append(max(self.level(a), self.level(b)) + 1)
+            self.strash[(a, b)] = node
+        return 2 * node
+
+    def or_(self, a, b):
+        return self.and_(a ^ 1, b ^ 1) ^ 1
+
+    def and_all(self, lits):
+        '''
+        balanced AND, the two lowest literals are combined first
+        '''
+        heap = [(self.level(l), l) for l in set(lits)]
+        if len(heap) == 0:
+            return 1
+        heapq.heapify(heap)
+        while len(heap) > 1:
+            a = heapq.heappop(heap)[1]
+            b = heapq.heappop(heap)[1]
+            c = self.and_(a, b)
+            if c == 0:
+                return 0
+            heapq.heappush(heap, (self.level(c), c))
+        return heap[0][1]
+
+    def or_all(self, lits):
+        return self.and_all([l ^ 1 for l in lits]) ^ 1
+
+    def cube(self, pat):
+        '''
+        pat: '01-' over the inputs from 0
+        '''
+        return self.and_all(self.cube_lits(pat))
+
+    def sop(self, pats):
+        '''
+        the OR of the cubes, factored by the most frequent literal
+        '''
+        return self.factor([self.cube_lits(pat) for pat in pats])
+
+    def cube_lits(self, pat):
+        lits = []
+        for i, p in enumerate(pat):
+            if p == '1':
+                lits.append(self.input(i))
+            elif p == '0':
+                lits.append(self.input(i) ^ 1)
+        return lits
+
+    def factor(self, cubes):
+        '''
+        cubes: lists of literals
+        l & (the cubes with l, without l) | (the other cubes) for the literal l
+        in the most cubes, until no literal is shared
+        '''
+        ors = []
+        while len(cubes) > 1:
+            count = {}
+            for c in cubes:
+                for l in c:
+                    count[l] = count.get(l, 0) + 1
+            best = max(count, key=lambda l: (count[l], -l), default=None)
+            if best is None or count[best] < 2:
+                break
+            with_l = [[l for l in c if l != best] for c in cubes if best in c]
+            cubes = [c for c in cubes if best not in c]
+            ors.append(self.and_(best, self.factor(with_l)))
+        ors += [self.and_all(c) for c in cubes]
+        return self.or_all(ors)
+
+    def tseitin(self, outputs, input_vars, new_var, clauses):
+        '''
+        add the clauses of the AND nodes in the cones of outputs, each node gets new_var()
+        input_vars: the var of each input
+        return the literal of each output over the vars, False and True for the constants
+        '''
+        node2var = {}
+        for i, v in enumerate(input_vars):
+            node2var[i + 1] = v
+
+        def lit2var(lit):
+            v = node2var[lit >> 1]
+            return -v if lit & 1 else v
+
+        for out in outputs:
+            # post order without recursion
+            stack = [out >> 1]
+            while len(stack) > 0:
+                node = stack[-1]
+                if node == 0 or node in node2var:
+                    stack.pop()
+                    continue
+                a, b = self.fanins[node]
+                if (a >> 1) not in node2var and (a >> 1) != 0:
+                    stack.append(a >> 1)
+                    continue
+                if (b >> 1) not in node2var and (b >> 1) != 0:
+                    stack.append(b >> 1)
+                    continue
+                stack.pop()
+                v = new_var()
+                node2var[node] = v
+                la, lb = lit2var(a), lit2var(b)
+                clauses.append([-v, la])
+                clauses.append([-v, lb])
+                clauses.append([v, -la, -lb])
+
+        res = []
+        for out in outputs:
+            if out <= 1:
+                res.append(out == 1)
+            else:
+                res.append(lit2var(out))
+        return res
@@ -0,0 +1,89 @@
+import collections
+
+from ssat_encoder import SSATEncoder
+from clause_sink import ChainClauseSink
+
+'''
+Encode one network for many queries (.evid, .map or .sdp files)
+
+The network is read once and copied for each query to be pruned and sorted.
+The clauses of encode_nodes only depend on the nodes left after pruning (and
+the evidence instantiated in their cpts by relevance.py), so
+the formula is reused as a whole while they are the same, and only the
+clauses of encode_query (evidence, SDP decision) are added for the query.
+For other nodes left, the cpt encoded for an earlier query is relocated to
+the new vars (SSATEncoder.encode_cpt_block) and only unseen cpts are encoded.
+
+    batch = BatchEncoder(net, filename, encode='val', query='PE', log_state=True)
+    for evid_file in evid_files:
+        encoder = batch.encode(evid_file=evid_file)
+        SSATWriter(encoder).write_all(targets)
+'''
+
+# the attributes of SSATEncoder set by encode_nodes
+ENCODED_STATE = [
+    'var_id', 'thr_var', 'clauses', 'scale', 'pool_num', 'num_shared_cpt',
+    'node_id2state_vars', 'node_id2state_cls', 'node_id2state_cls_full',
+    'intro_vars', 'state_vars', 'rand_vars',
+    'dec_vars', 'ob_vars', 'node_id2dec_vars', 'node_id2ob_vars',
+    'util_state_vars', 'util_id2state_cls', 'util_vars', 'max_util', 'min_util',
+    'node_id2var_pool', 'node_id2merge_list', 'node_id2vars', 'node_id2edge_var',
+    'node_id2var_range',
+]
+
+
+class BatchEncoder:
+    def __init__(self, net, filename, num_formulas=4, **kwargs):
+        '''
+        net(Network): the network read by Network.read_network, without a query
+        filename(str): the network file, the default query files are named after it
+        num_formulas(int): number of formulas kept for reuse
+        kwargs: the arguments of SSATEncoder
+        '''
+        self.net = net
+        self.filename = filename
+        self.num_formulas = num_formulas
+        self.kwargs = kwargs
+
+        # the nodes left -> the encoder state after encode_nodes
+        self.formulas = collections.OrderedDict()
+        # the cpts shared by different sets of nodes, not relocatable if shared across tables
+        self.cpt_blocks = None if kwargs.get('share_val') else {}
+
+        self.num_queries = 0
+        self.num_reused = 0
+
+    def encode(self, evid_file='', query_file='', sdp_file=''):
+        '''
+        return the SSATEncoder of the query, as after tossat
+        '''
+        net = self.net.copy()
+        net.read_query(self.filename, evid_file, query_file, sdp_file)
+        encoder = SSATEncoder(net, **self.kwargs)
+        encoder.prepare_net()
+
+        # the nodes to encode in order, and the evidence instantiated in their cpts
+        key = (tuple([n.id for n in net.nodes if n.depend]), tuple(net.removed_edges),
+               tuple(net.collapsed_evids))
+        state = self.formulas.get(key)
+        if state is None:
+            encoder.cpt_blocks = self.cpt_blocks
+            encoder.encode_nodes()
+            encoder.cpt_blocks = None
+            state = {k: getattr(encoder, k) for k in ENCODED_STATE}
+            self.formulas[key] = state
+            if len(self.formulas) > self.num_formulas:
+                self.formulas.popitem(last=False)
+        else:
+            # not modified by encode_query and the writers
+            for k, v in state.items():
+                setattr(encoder, k, v)
+            self.formulas.move_to_end(key)
+            self.num_reused += 1
+        self.num_queries += 1
+
+        encoder.clauses = ChainClauseSink(state['clauses'])
+        encoder.encode_query()
+        encoder.print_summary()
+        net.nodes = net.nodes[::-1]
+        return encoder
@@ -0,0 +1,74 @@
+import time
+import random
+import argparse
+
+from PGM import Network, Node
+
+'''
+Measure the graph routines of Network on random networks of growing size,
+the time per node stays flat when they are linear
+
+    python3 bench_graph.py -n 1000 10000 100000 1000000
+'''
+
+
+def random_net(num_nodes, max_parents, window, seed):
+    '''
+    a chain with random extra parents among the previous window nodes,
+    the nodes are listed in a random order
+    '''
+    random.seed(seed)
+    net = Network(kind='BN', query='PE')
+    nodes = [Node(i, 'chance') for i in range(num_nodes)]
+    for i in range(1, num_nodes):
+        parents = {i - 1}
+        lo = max(0, i - window)
+        for k in range(random.randint(0, max_parents - 1)):
+            parents.add(random.randint(lo, i - 1))
+        for p in sorted(parents):
+            nodes[i].parents.append(nodes[p])
+            nodes[p].children.append(nodes[i])
+    net.id2node = {n.id: n for n in nodes}
+    net.nodes = nodes[:]
+    random.shuffle(net.nodes)
+    net.query_var = [n.id for n in nodes if len(n.children) == 0]
+    return net
+
+
+def bench(net):
+    res = []
+    start = time.time()
+    net.mark_redundent()
+    res.append(time.time() - start)
+    for method in [0, 1, 2]:
+        start = time.time()
+        net.topo_sort(method=method)
+        res.append(time.time() - start)
+    start = time.time()
+    net.find_connected_components()
+    res.append(time.time() - start)
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--num_nodes', type=int, nargs='+',
+                        default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('-p', '--max_parents', type=int, default=3)
+    parser.add_argument('-w', '--window', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    names = ['mark', 'dfs', 'rdfs', 'kahn', 'cc']
+    print('%10s %10s ' % ('nodes', 'edges') + ' '.join(['%16s' % s for s in names]))
+    for num_nodes in args.num_nodes:
+        net = random_net(num_nodes, args.max_parents, args.window, args.seed)
+        num_edges = sum([len(n.parents) for n in net.nodes])
+        times = bench(net)
+        # seconds and microseconds per node
+        print('%10d %10d ' % (num_nodes, num_edges) +
+              ' '.join(['%7.3f s %5.2f us' % (t, t / num_nodes * 1e6) for t in times]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import os
+import io
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+from PGM import Network
+from ssat_encoder import SSATEncoder
+from ssat_writer import SSATWriter
+
+'''
+Measure the output throughput (MB/s) of SSATWriter for each format
+
+    python3 bench_writer.py -i net.uai -m val -q PE
+'''
+
+
+def bench(writer, targets, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            writer.write_all(targets)
+        t = time.time() - start
+        best = t if best is None else min(best, t)
+    size = sum([os.path.getsize(f) for f in targets])
+    return size, best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input', type=str, required=True)
+    parser.add_argument('-q', '--query', type=str,
+                        choices=['PE', 'MPE', 'MAP', 'SDP'], default='PE')
+    parser.add_argument('-m', '--method', type=str, default='val')
+    parser.add_argument('-s', '--state', type=str, default='log', choices=['linear', 'log'])
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--clause_sink', type=str, default='memory', choices=['memory', 'disk'])
+    args = parser.parse_args()
+
+    net = Network(kind='BN', query=args.query)
+    net.read(args.input, '', '')
+
+    encoder = SSATEncoder(net, args.method, args.query, log_state=(args.state == 'log'),
+                          opt='none', clause_sink=args.clause_sink)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.time()
+        encoder.tossat()
+        t_encode = time.time() - start
+    print('Number of clauses =', len(encoder.clauses))
+    print('Encoding time = %.3f s' % (t_encode))
+
+    writer = SSATWriter(encoder)
+    out_dir = tempfile.mkdtemp()
+    try:
+        name = os.path.join(out_dir, 'bench')
+        exts = ['.sdimacs', '.ssat']
+        if args.query == 'PE':
+            exts.append('.wcnf')
+        for ext in exts:
+            size, t = bench(writer, [name + ext], args.repeat)
+            print('%-8s %8.2f MB %8.3f s %8.2f MB/s' % (ext, size / 2**20, t, size / 2**20 / t))
+        size, t = bench(writer, [name + ext for ext in exts], args.repeat)
+        print('%-8s %8.2f MB %8.3f s %8.2f MB/s' % ('all', size / 2**20, t, size / 2**20 / t))
+    finally:
+        shutil.rmtree(out_dir)
+
+
+if __name__ == "__main__":
+    main()
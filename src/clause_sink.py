@@ -0,0 +1,182 @@
+import tempfile
+from array import array
+
+'''
+Containers of the clauses produced by SSATEncoder.
+
+The literals are stored as int32 with 0 terminating each clause (as in
+dimacs), so a clause costs 4 bytes per literal instead of a python list.
+Both sinks support append(cl), += [cl, ...], len() and iteration, which
+yields each clause as a list of ints and can be repeated. blocks() yields
+the literals in flat 0-terminated blocks of whole clauses for bulk writing,
+and append_block(lits, num_clauses) adds such a block at once.
+'''
+
+BLOCK_SIZE = 1 << 16    # number of literals read / buffered at a time
+
+
+def new_clause_sink(kind='memory'):
+    if kind == 'memory':
+        return MemoryClauseSink()
+    elif kind == 'disk':
+        return DiskClauseSink()
+    else:
+        raise ValueError('Unknown clause sink', kind)
+
+
+def last_clause_end(lits):
+    '''
+    the index after the last 0 in lits, 0 if no clause ends in lits
+    '''
+    for i in range(len(lits) - 1, -1, -1):
+        if lits[i] == 0:
+            return i + 1
+    return 0
+
+
+def split_clauses(lits):
+    '''
+    lits: a block of 0-terminated clauses
+    '''
+    clauses = []
+    start = 0
+    for i, v in enumerate(lits):
+        if v == 0:
+            clauses.append(lits[start:i])
+            start = i + 1
+    return clauses
+
+
+class MemoryClauseSink:
+    def __init__(self):
+        self.lits = array('i')
+        self.num_clauses = 0
+
+    def append(self, cl):
+        self.lits.extend(cl)
+        self.lits.append(0)
+        self.num_clauses += 1
+
+    def __iadd__(self, clauses):
+        for cl in clauses:
+            self.append(cl)
+        return self
+
+    def append_block(self, lits, num_clauses):
+        '''
+        lits(array('i')): num_clauses 0-terminated clauses
+        '''
+        self.lits += lits
+        self.num_clauses += num_clauses
+
+    def __len__(self):
+        return self.num_clauses
+
+    def __iter__(self):
+        for lits in self.blocks():
+            yield from split_clauses(lits)
+
+    def blocks(self):
+        start = 0
+        while start < len(self.lits):
+            lits = self.lits[start:start+BLOCK_SIZE].tolist()
+            end = last_clause_end(lits)
+            # a clause longer than a block
+            if end == 0:
+                end = self.lits.index(0, start) + 1 - start
+                lits = self.lits[start:start+end].tolist()
+            yield lits[:end]
+            start += end
+
+
+class DiskClauseSink:
+    '''
+    spill the clauses to an unnamed temp file, removed when closed
+    '''
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.buf = array('i')
+        self.num_clauses = 0
+
+    def append(self, cl):
+        self.buf.extend(cl)
+        self.buf.append(0)
+        self.num_clauses += 1
+        if len(self.buf) >= BLOCK_SIZE:
+            self.flush()
+
+    def __iadd__(self, clauses):
+        for cl in clauses:
+            self.append(cl)
+        return self
+
+    def append_block(self, lits, num_clauses):
+        self.buf += lits
+        self.num_clauses += num_clauses
+        if len(self.buf) >= BLOCK_SIZE:
+            self.flush()
+
+    def __len__(self):
+        return self.num_clauses
+
+    def flush(self):
+        self.file.seek(0, 2)
+        self.buf.tofile(self.file)
+        self.buf = array('i')
+
+    def __iter__(self):
+        for lits in self.blocks():
+            yield from split_clauses(lits)
+
+    def blocks(self):
+        self.flush()
+        pos = 0
+        rest = []
+        while True:
+            self.file.seek(pos)
+            data = self.file.read(4 * BLOCK_SIZE)
+            if len(data) == 0:
+                break
+            pos += len(data)
+            lits = array('i')
+            lits.frombytes(data)
+            lits = rest + lits.tolist()
+            end = last_clause_end(lits)
+            rest = lits[end:]
+            if end > 0:
+                yield lits[:end]
+
+    def close(self):
+        self.file.close()
+
+
+class ChainClauseSink:
+    '''
+    the clauses of a base sink, shared and not modified, followed by its own
+    '''
+
+    def __init__(self, base):
+        self.base = base
+        self.rest = MemoryClauseSink()
+
+    def append(self, cl):
+        self.rest.append(cl)
+
+    def __iadd__(self, clauses):
+        self.rest += clauses
+        return self
+
+    def append_block(self, lits, num_clauses):
+        self.rest.append_block(lits, num_clauses)
+
+    def __len__(self):
+        return len(self.base) + len(self.rest)
+
+    def __iter__(self):
+        for lits in self.blocks():
+            yield from split_clauses(lits)
+
+    def blocks(self):
+        yield from self.base.blocks()
+        yield from self.rest.blocks()
@@ -0,0 +1,93 @@
+import json
+import math
+import os
+
+'''
+Split the network of a PE, MPE or MAP query into its connected components
+
+After pruning, the depend nodes of different components share no cpt, so
+the answer is the product of the answers of the components (the sum over
+the nodes of a component, or the max for MPE and the MAP vars, is taken
+apart) times the constant of the evidence folded by evidence.py. Each
+component is encoded as its own formula and a manifest tells how to
+combine the results (run_components.py):
+
+    {"query": "MPE", "combine": "log_sum", "factor": 1.0,
+     "components": [{"nodes": [0, 2, 5], "files": {"bn.cc0.ssat": 3, ...}}, ...]}
+
+The value of a file is the solved probability times 2 ** its scale
+exponent (the scale printed by SSATWriter). PE multiplies the values,
+MPE and MAP add their logs (the maxima of the components are small).
+'''
+
+COMBINE = {'PE': 'product', 'MPE': 'log_sum', 'MAP': 'log_sum'}
+
+
+def split_components(net):
+    '''
+    net: pruned and sorted (SSATEncoder.prepare_net)
+    return a network per connected component of the depend nodes, with the evidence and
+    the MAP vars in it, to be encoded without pruning
+    '''
+    num_components = net.find_connected_components()
+    subs = []
+    for k in range(num_components):
+        sub = net.copy()
+        for n in sub.nodes:
+            n.depend = n.depend and n.component_label == k
+        sub.nodes = [n for n in sub.nodes if n.depend]
+        ids = set([n.id for n in sub.nodes])
+        sub.evids = [(id, state) for (id, state) in sub.evids if id in ids]
+        sub.query_var = [id for id in sub.query_var if id in ids]
+        # in the manifest, not in a component
+        sub.evid_factor = 1.0
+        subs.append(sub)
+    return subs
+
+
+def new_manifest(net):
+    if net.kind != 'BN' or net.query not in COMBINE:
+        raise ValueError('Components are split for PE, MPE and MAP', net.kind, net.query)
+    return {'query': net.query, 'combine': COMBINE[net.query], 'factor': net.evid_factor, 'components': []}
+
+
+def add_component(manifest, manifest_file, sub, files):
+    '''
+    files: dict of the file name -> scale exponent
+    '''
+    dirname = os.path.dirname(manifest_file)
+    manifest['components'].append({
+        'nodes': sorted([n.id for n in sub.nodes]),
+        'files': {os.path.relpath(f, dirname or '.'): e for f, e in files.items()},
+    })
+
+
+def write_manifest(manifest, manifest_file):
+    f = open(manifest_file, 'w')
+    json.dump(manifest, f, indent=1)
+    f.close()
+
+
+def read_manifest(manifest_file):
+    f = open(manifest_file, 'r')
+    manifest = json.load(f)
+    f.close()
+    return manifest
+
+
+def combine(manifest, results):
+    '''
+    results: (solved probability, scale exponent) of each component, in the order of the manifest
+    return (value, log10 of the value), None if a component is not solved
+    '''
+    if any([p is None for (p, e) in results]):
+        return None, None
+    if manifest['combine'] == 'product':
+        value = manifest['factor']
+        for (p, e) in results:
+            value *= p * 2**e
+        return value, math.log10(value) if value > 0 else -math.inf
+    log_value = math.log10(manifest['factor']) if manifest['factor'] > 0 else -math.inf
+    for (p, e) in results:
+        log_value += (math.log10(p) if p > 0 else -math.inf) + e * math.log10(2)
+    return 10 ** log_value, log_value
@@ -0,0 +1,145 @@
+import pytest
+
+from PGM import Network
+from ssat_encoder import SSATEncoder
+from ssat_writer import SSATWriter
+
+'''
+Small networks and helpers shared by the regression tests (test_*.py)
+'''
+
+# binary A; B | A and C | A with three states, the rows of a table are the same
+NET_ABC = '''BAYES
+3
+2 3 3
+3
+1 0
+2 0 1
+2 0 2
+
+2
+0.5 0.5
+6
+0.25 0.25 0.5
+0.25 0.25 0.5
+6
+0.25 0.5 0.25
+0.25 0.5 0.25
+'''
+
+# two components: A -> B and C -> D
+NET_TWO = '''BAYES
+4
+2 2 3 2
+4
+1 0
+2 0 1
+1 2
+2 2 3
+
+2
+0.3 0.7
+4
+0.1 0.9
+0.8 0.2
+3
+0.2 0.5 0.3
+6
+0.6 0.4
+0.25 0.75
+0.9 0.1
+'''
+
+
+def write_file(path, text):
+    f = open(path, 'w')
+    f.write(text)
+    f.close()
+    return str(path)
+
+
+def read_net(uai_file, evid_file='', query='PE', snapshot=False):
+    net = Network(kind='BN', query=query)
+    net.read(uai_file, evid_file, snapshot=snapshot)
+    return net
+
+
+def encode_files(uai_file, evid_file, name, exts=('.sdimacs', '.ssat', '.wcnf'), query='PE', snapshot=False,
+                 **encoder_args):
+    '''
+    encode a fresh read of the network to name + ext for each ext
+    return (dict of ext -> bytes of the file, SSATWriter)
+    '''
+    args = dict(encode='bklm16', query=query, log_state=True, opt='none')
+    args.update(encoder_args)
+    encoder = SSATEncoder(read_net(uai_file, evid_file, query, snapshot), **args)
+    encoder.tossat()
+    writer = SSATWriter(encoder)
+    writer.write_all([name + ext for ext in exts])
+    files = {}
+    for ext in exts:
+        f = open(name + ext, 'rb')
+        files[ext] = f.read()
+        f.close()
+    return files, writer
+
+
+def sdimacs_value(text):
+    '''
+    the value of a small .sdimacs formula by enumerating its prefix
+    '''
+    prefix = []
+    clauses = []
+    for line in text.decode().splitlines():
+        pars = line.split()
+        if len(pars) == 0 or pars[0] in ['p', 'c']:
+            continue
+        if pars[0] == 'r':
+            prefix.append(('r', int(pars[2]), float(pars[1])))
+        elif pars[0] in ['e', 'a']:
+            prefix += [(pars[0], int(v), None) for v in pars[1:-1]]
+        else:
+            clauses.append([int(l) for l in pars[:-1]])
+
+    assign = {}
+
+    def value(k):
+        # the vars of the clauses not satisfied yet
+        free = set()
+        for cl in clauses:
+            if all([assign.get(abs(l)) == (l < 0) for l in cl]):
+                return 0.0
+            if not any([assign.get(abs(l)) == (l > 0) for l in cl]):
+                free.update([abs(l) for l in cl])
+        # the value does not depend on the vars out of them
+        while k < len(prefix) and prefix[k][1] not in free:
+            k += 1
+        if k == len(prefix):
+            return 1.0
+        q, v, p = prefix[k]
+        vals = []
+        for b in [True, False]:
+            assign[v] = b
+            vals.append(value(k + 1))
+        del assign[v]
+        if q == 'r':
+            return p * vals[0] + (1 - p) * vals[1]
+        return max(vals) if q == 'e' else min(vals)
+
+    return value(0)
+
+
+@pytest.fixture
+def net_abc(tmp_path):
+    '''
+    (uai file, evid file of C = 1), P(e) = 0.5
+    '''
+    return write_file(tmp_path / 'abc.uai', NET_ABC), write_file(tmp_path / 'abc.evid', '1 2 1\n')
+
+
+@pytest.fixture
+def net_two(tmp_path):
+    '''
+    (uai file, evid file of B = 0 and D = 1), P(e) = 0.59 * 0.485
+    '''
+    return write_file(tmp_path / 'two.uai', NET_TWO), write_file(tmp_path / 'two.evid', '2 1 0 3 1\n')
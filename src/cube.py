@@ -0,0 +1,88 @@
+from collections import namedtuple
+
+'''
+A cube over n variables is a pair of bitmasks:
+    care: the bit is 1 if the variable appears in the cube
+    value: the phase of the appeared variables (subset of care)
+
+The i-th variable (the i-th char of a pattern) is the bit (n-1-i),
+so the value of a minterm equals int(pattern, 2).
+
+    '01-1' -> Cube(care=0b1101, value=0b0101)
+'''
+
+Cube = namedtuple('Cube', ['care', 'value'])
+
+
+def pattern2cube(pat):
+    care = 0
+    value = 0
+    for p in pat:
+        care <<= 1
+        value <<= 1
+        if p == '1':
+            care |= 1
+            value |= 1
+        elif p == '0':
+            care |= 1
+    return Cube(care, value)
+
+
+def cube2pattern(cube, num_vars):
+    pat = ''
+    for i in range(num_vars - 1, -1, -1):
+        b = 1 << i
+        if not cube.care & b:
+            pat += '-'
+        elif cube.value & b:
+            pat += '1'
+        else:
+            pat += '0'
+    return pat
+
+
+def cube_intersect(a, b):
+    return ((a.value ^ b.value) & a.care & b.care) == 0
+
+
+def cube_contain(a, b):
+    '''
+    a contains b
+    '''
+    return (a.care & ~b.care) == 0 and ((a.value ^ b.value) & a.care) == 0
+
+
+def cube_supercube(a, b):
+    care = a.care & b.care & ~(a.value ^ b.value)
+    return Cube(care, a.value & care)
+
+
+def cube_num_lits(cube):
+    return bin(cube.care).count('1')
+
+
+def assign2cube(alpha):
+    '''
+    a full assignment of literals, the positive literal is 1
+        [-1, 2, -4] -> Cube(care=0b111, value=0b010)
+    '''
+    value = 0
+    for v in alpha:
+        value <<= 1
+        if v > 0:
+            value |= 1
+    return Cube((1 << len(alpha)) - 1, value)
+
+
+def cube2clause(cube, vars):
+    '''
+    the literals of the cube over vars
+        Cube(care=0b1101, value=0b0100), [1, 2, 3, 4] -> [-1, 2, -4]
+    '''
+    cl = []
+    b = 1 << len(vars)
+    for v in vars:
+        b >>= 1
+        if cube.care & b:
+            cl.append(v if cube.value & b else -v)
+    return cl
@@ -0,0 +1,220 @@
+import os
+import json
+import zipfile
+import hashlib
+import collections
+
+import numpy as np
+
+from cube import Cube
+
+'''
+A persistent key-value cache in a directory, one .npz file per key
+
+The files are named by the sha1 of the key and written through a temp file,
+so several processes can share a directory. The least recently used files
+(by mtime, touched on every hit) are removed when the total size is over
+max_size bytes.
+
+    cache = DiskCache('~/.cache/pgm2ssat', max_size=1 << 30)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.put(key, value)
+
+A value is stored without pickle: its numpy arrays (and bytes) as arrays of
+the .npz, read back with allow_pickle=False, and the rest (dicts of str
+keys, lists, tuples read back as lists, Cube, ints, floats, str, None) as
+JSON. The .pkl files of the earlier format are not read.
+
+MemoCache keeps the recently used values in memory in front of an optional
+DiskCache, for the values computed many times in a run.
+'''
+
+
+def cache_key(*parts):
+    '''
+    the sha1 of the parts, bytes are hashed as they are and others by repr
+    '''
+    h = hashlib.sha1()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = repr(part).encode()
+        h.update(b'%d:' % len(part))
+        h.update(part)
+    return h.hexdigest()
+
+
+def to_plain(value, arrays):
+    '''
+    the JSON value of value, its arrays are appended to arrays and referred to by index
+    '''
+    if isinstance(value, Cube):
+        return {'cube': [int(value.care), int(value.value)]}
+    if isinstance(value, np.ndarray) and value.dtype == object:
+        raise TypeError('Object arrays are not stored in DiskCache')
+    if isinstance(value, (np.ndarray, bytes)):
+        kind = 'bytes' if isinstance(value, bytes) else 'array'
+        arrays.append(np.frombuffer(value, dtype=np.uint8) if kind == 'bytes' else value)
+        return {kind: len(arrays) - 1}
+    if isinstance(value, dict):
+        return {'dict': [[k, to_plain(v, arrays)] for k, v in value.items()]}
+    if isinstance(value, (list, tuple)):
+        return [to_plain(v, arrays) for v in value]
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise TypeError('Not stored in DiskCache', type(value))
+
+
+def from_plain(value, arrays):
+    if isinstance(value, list):
+        return [from_plain(v, arrays) for v in value]
+    if isinstance(value, dict):
+        kind, item = next(iter(value.items()))
+        if kind == 'cube':
+            return Cube(*item)
+        if kind == 'array':
+            return arrays[item]
+        if kind == 'bytes':
+            return arrays[item].tobytes()
+        return dict([(k, from_plain(v, arrays)) for k, v in item])
+    return value
+
+
+class DiskCache:
+    def __init__(self, path, max_size=1 << 30):
+        '''
+        path(str): the directory of the cache, created if not exists
+        max_size(int): the size cap in bytes
+        '''
+        self.path = os.path.expanduser(path)
+        self.max_size = max_size
+        os.makedirs(self.path, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        # updated on put, recounted on eviction
+        self.size = sum([size for (mtime, size, f) in self.files()])
+
+    def files(self):
+        files = []
+        for name in os.listdir(self.path):
+            if not name.endswith('.npz'):
+                continue
+            f = os.path.join(self.path, name)
+            try:
+                st = os.stat(f)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, f))
+        return files
+
+    def file(self, key):
+        return os.path.join(self.path, cache_key(key) + '.npz')
+
+    def get(self, key):
+        '''
+        return None if key is not cached
+        '''
+        f = self.file(key)
+        try:
+            with np.load(f, allow_pickle=False) as z:
+                plain = json.loads(str(z['json']))
+                arrays = [z['a%d' % (i)] for i in range(len(z.files) - 1)]
+            value = from_plain(plain, arrays)
+            os.utime(f)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        arrays = []
+        plain = json.dumps(to_plain(value, arrays))
+        f = self.file(key)
+        tmp = '%s.%d.tmp' % (f, os.getpid())
+        try:
+            with open(tmp, 'wb') as fp:
+                np.savez(fp, json=np.array(plain), **dict([('a%d' % (i), a) for i, a in enumerate(arrays)]))
+            size = os.path.getsize(tmp)
+            # the entry replaced (by this or another process) is not counted twice
+            try:
+                old = os.path.getsize(f)
+            except OSError:
+                old = 0
+            os.replace(tmp, f)
+        except OSError:
+            return
+        self.size += size - old
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        '''
+        remove the least recently used files until the size is under the cap
+        '''
+        files = sorted(self.files())
+        self.size = sum([size for (mtime, size, f) in files])
+        for (mtime, size, f) in files:
+            if self.size <= self.max_size:
+                break
+            try:
+                os.remove(f)
+            except OSError:
+                continue
+            self.size -= size
+
+    def __len__(self):
+        return len(self.files())
+
+
+class MemoCache:
+    def __init__(self, max_len=4096, disk=None):
+        '''
+        max_len(int): number of values kept in memory, the least recently used are dropped
+        disk(DiskCache): the values missed in memory are looked up and stored there if given
+        '''
+        self.max_len = max_len
+        self.disk = disk
+        self.values = collections.OrderedDict()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        '''
+        return None if key is not cached
+        '''
+        value = self.values.get(key)
+        if value is not None:
+            self.values.move_to_end(key)
+            self.hits += 1
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.put_memory(key, value)
+                self.disk_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.put_memory(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def put_memory(self, key, value):
+        self.values[key] = value
+        self.values.move_to_end(key)
+        if len(self.values) > self.max_len:
+            self.values.popitem(last=False)
+
+    def __len__(self):
+        return len(self.values)
@@ -0,0 +1,193 @@
+import math
+import time
+import heapq
+import random
+import argparse
+
+'''
+Greedy elimination orders of the moral graph of a network
+
+The scores of the remaining nodes are kept in a heap (stale entries are
+skipped when popped), eliminating a node only rescores its neighbours and,
+for min-fill, the common neighbours of the added fill edges.
+
+    minfill:  number of fill edges
+    wminfill: sum of num_states(u) * num_states(v) over the fill edges (u, v)
+    mindeg:   number of neighbours
+    minwidth: log2 of the size of the clique (the node and its neighbours),
+              the weighted width of the eliminated factor
+
+    python3 elim_order.py -i net.uai -n BN -H minfill -t 10
+'''
+
+HEURISTICS = ['minfill', 'wminfill', 'mindeg', 'minwidth']
+
+
+def moral_graph(net):
+    '''
+    the undirected graph of the families (and utility scopes) over the depend nodes
+    return (id -> set of neighbour ids, id -> num_states)
+    '''
+    adj = {}
+    weights = {}
+    for n in net.nodes:
+        if n.depend:
+            adj[n.id] = set()
+            weights[n.id] = n.num_states
+
+    scopes = [[n] + n.parents for n in net.nodes if n.depend] + [u.parents for u in net.utils]
+    for scope in scopes:
+        ids = [p.id for p in scope if p.id in adj]
+        for i in ids:
+            adj[i].update(ids)
+    for i in adj:
+        adj[i].discard(i)
+    return adj, weights
+
+
+class Eliminator:
+    '''
+    one greedy elimination of a copy of the graph
+    '''
+
+    def __init__(self, adj, weights, heuristic, rng):
+        if heuristic not in HEURISTICS:
+            raise ValueError('Unknown heuristic', heuristic)
+        self.adj = {v: set(ns) for v, ns in adj.items()}
+        self.weights = weights
+        self.heuristic = heuristic
+        self.rng = rng
+
+        self.score = {}
+        self.heap = []
+        for v in self.adj:
+            self.update(v)
+
+    def fill_weight(self, a, b):
+        if self.heuristic == 'wminfill':
+            return self.weights[a] * self.weights[b]
+        return 1
+
+    def cal_score(self, v):
+        ns = self.adj[v]
+        if self.heuristic == 'mindeg':
+            return len(ns)
+        if self.heuristic == 'minwidth':
+            return sum([math.log2(max(self.weights[u], 1)) for u in ns]) + math.log2(max(self.weights[v], 1))
+        fill = 0
+        ns = list(ns)
+        for i, a in enumerate(ns):
+            adj_a = self.adj[a]
+            for b in ns[i + 1:]:
+                if b not in adj_a:
+                    fill += self.fill_weight(a, b)
+        return fill
+
+    def update(self, v):
+        s = self.cal_score(v)
+        self.score[v] = s
+        heapq.heappush(self.heap, (s, self.rng.random(), v))
+
+    def pop(self):
+        while True:
+            s, r, v = heapq.heappop(self.heap)
+            if v in self.adj and self.score[v] == s:
+                return v
+
+    def eliminate(self, v):
+        '''
+        connect the neighbours of v and remove v, return the number of neighbours
+        '''
+        ns = self.adj.pop(v)
+        del self.score[v]
+        for a in ns:
+            self.adj[a].discard(v)
+
+        fill = self.heuristic in ['minfill', 'wminfill']
+        touched = set()
+        ns_list = list(ns)
+        for i, a in enumerate(ns_list):
+            adj_a = self.adj[a]
+            for b in ns_list[i + 1:]:
+                if b in adj_a:
+                    continue
+                if fill:
+                    # (a, b) is no more a fill edge of their common neighbours
+                    adj_b = self.adj[b]
+                    small, large = (adj_a, adj_b) if len(adj_a) < len(adj_b) else (adj_b, adj_a)
+                    for c in small:
+                        if c in large and c not in ns:
+                            self.score[c] -= self.fill_weight(a, b)
+                            touched.add(c)
+                adj_a.add(b)
+                self.adj[b].add(a)
+
+        for c in touched:
+            heapq.heappush(self.heap, (self.score[c], self.rng.random(), c))
+        for a in ns:
+            self.update(a)
+        return len(ns)
+
+    def run(self, bound=math.inf):
+        '''
+        return (order, induced width), None if the width reaches bound
+        '''
+        order = []
+        width = 0
+        while len(self.adj) > 0:
+            v = self.pop()
+            width = max(width, self.eliminate(v))
+            if width >= bound:
+                return None
+            order.append(v)
+        return order, width
+
+
+def elim_order(adj, weights, heuristic='minfill', seed=0, time_limit=0):
+    '''
+    adj: id -> set of neighbour ids, weights: id -> num_states
+    the ties are broken at random, with time_limit (seconds) the elimination
+    is repeated with new ties until the time is up and the narrowest order is kept
+    return (order, induced width)
+    '''
+    rng = random.Random(seed)
+    start = time.time()
+    best = Eliminator(adj, weights, heuristic, rng).run()
+    while time.time() - start < time_limit and best[1] > 0:
+        res = Eliminator(adj, weights, heuristic, rng).run(bound=best[1])
+        if res is not None:
+            best = res
+    return best
+
+
+def main():
+    from PGM import Network
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input', type=str, required=True)
+    parser.add_argument('-n', '--net_type', type=str, choices=['BN', 'ID'], default='BN')
+    parser.add_argument('-H', '--heuristic', type=str, choices=HEURISTICS, default='minfill')
+    parser.add_argument('-t', '--time_limit', type=float, default=0,
+                        help='Seconds spent on retries with random ties')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', type=str, default='',
+                        help='Write the order, one node id per line')
+    args = parser.parse_args()
+
+    net = Network(kind=args.net_type, query='PE' if args.net_type == 'BN' else 'MEU')
+    net.read_network(args.input)
+
+    start = time.time()
+    adj, weights = moral_graph(net)
+    order, width = elim_order(adj, weights, args.heuristic, args.seed, args.time_limit)
+    print('Number of nodes =', len(order))
+    print('Induced width =', width)
+    print('Ordering time = %.3f s' % (time.time() - start))
+
+    if len(args.output) > 0:
+        with open(args.output, 'w') as f:
+            f.write(''.join(['%d\n' % id for id in order]))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,108 @@ import argparse
 from PGM import Network
 from ssat_encoder import SSATEncoder
 from ssat_writer import SSATWriter, write_exist_var
+from batch_encoder import BatchEncoder
+from disk_cache import DiskCache, MemoCache
+from elim_order import HEURISTICS
+from renumber import renumber
+from preprocess import preprocess
+from components import split_components, new_manifest, add_component, write_manifest
+
+
+def read_query_batch(filename):
+    '''
+    each line lists the files of a query: .evid, .map (or .query) and .sdp
+    return list of (output name, evid_file, query_file, sdp_file)
+    '''
+    f = open(filename, 'r')
+    lines = f.readlines()
+    f.close()
+
+    queries = []
+    for line in lines:
+        pars = line.split()
+        if len(pars) == 0:
+            continue
+        files = {'.evid': '', '.map': '', '.query': '', '.sdp': ''}
+        for par in pars:
+            name, ext = os.path.splitext(par)
+            if ext not in files:
+                raise ValueError('Unknown query file', par)
+            files[ext] = par
+        name, ext = os.path.splitext(pars[0])
+        queries.append((name, files['.evid'], files['.map'] or files['.query'], files['.sdp']))
+    return queries
+
+
+def output_targets(name, args):
+    '''
+    name: the output file name without extension
+    '''
+    targets = [name + '.sdimacs', name + '.ssat']
+    if args.net_type == 'BN' and args.query == 'PE':
+        targets.append(name + '.wcnf')
+        if args.method == 'all05':
+            targets.append(name + '.cnf')  # for approxmc
+        # targets.append(name + '.mc2021')
+    return targets
+
+
+def print_cache_stats(cpt_cache):
+    if cpt_cache is not None:
+        print('CPT cache hits = %d, misses = %d' % (cpt_cache.hits, cpt_cache.misses))
+
+
+def preprocess_formula(encoder, args):
+    if args.preprocess:
+        num_vars, num_clauses = encoder.var_id, len(encoder.clauses)
+        pre = preprocess(encoder)
+        if pre.unsat:
+            print('Preprocessed: unsatisfiable, the formula is kept')
+            return
+        print('Preprocessed: units = %d, subsumed = %d, strengthened = %d, equivalent = %d, eliminated = %d'
+              % tuple([pre.stats[k] for k in ['units', 'subsumed', 'strengthened', 'equivalent', 'eliminated']]))
+        print('Preprocessed: (var, cls) = (%d, %d) -> (%d, %d), factor = %r'
+              % (num_vars, num_clauses, encoder.var_id, len(encoder.clauses), pre.scale))
+
+
+def renumber_formula(encoder, args):
+    if args.renumber != 'none':
+        width = renumber(encoder, args.renumber)
+        print('Renumbered by %s order, induced width = %d' % (args.renumber, width))
+
+
+def encode_components(net, name, args, encoder_args):
+    '''
+    prune the network once, encode each connected component to <name>.cc<k>.* and
+    write the manifest <name>.components.json (components.py)
+    '''
+    encoder = SSATEncoder(net, **encoder_args)
+    encoder.prepare_net()
+    subs = split_components(encoder.net)
+    print('Number of connected components = ', len(subs))
+
+    manifest = new_manifest(encoder.net)
+    manifest_file = name + '.components.json'
+    # pruned and conditioned once for all
+    sub_args = dict(encoder_args, prune=False, relevance=False, condition_evid=False, connected_component=False)
+    for k, sub in enumerate(subs):
+        print('Processing component %d, number of nodes = %d' % (k, len(sub.nodes)))
+        encoder = SSATEncoder(sub, **sub_args)
+        encoder.tossat()
+        preprocess_formula(encoder, args)
+        renumber_formula(encoder, args)
+        targets = output_targets('%s.cc%d' % (name, k), args)
+        writer = SSATWriter(encoder)
+        writer.write_all(targets)
+        add_component(manifest, manifest_file, sub, {t: writer.scale_exponent(t) for t in targets})
+        print_tool_stats(encoder)
+    write_manifest(manifest, manifest_file)
+    print('Manifest =', manifest_file)
+
+
+def print_tool_stats(encoder):
+    for tool, (runs, total) in sorted(encoder.tool_time.items()):
+        print('Tool %s: runs = %d, time = %.2f s' % (tool, runs, total))
 
 
 def main():
@@ -23,13 +125,47 @@ def main():
                         'bklm16', 'sbk05', 'val', 'share_bit', 'direct_bit', 'bit_sop', 'bit_aig', 'all05'], required=True)
     parser.add_argument('-p', '--prune', default=False, action='store_true',
                         help='Prune network by evidence')
-    parser.add_argument('-o', '--opt', type=str, choices=['none', 'qm', 'esp'],
-                        default='none', help='quine-mccluskey or espresso minimization')
+    parser.add_argument('--relevance', default=False, action='store_true',
+                        help='Prune network by the relevance of each node to the query (all queries), '
+                        'instead of -p')
+    parser.add_argument('--condition_evidence', default=False, action='store_true',
+                        help='Instantiate the evidence in the cpts and fold the evidence '
+                        'without parents into a constant before encoding')
+    parser.add_argument('-o', '--opt', type=str, choices=['none', 'qm', 'esp', 'esp_multi', 'esp_bin'],
+                        default='none', help='quine-mccluskey, in-process espresso, in-process espresso of all probs '
+                        'of a table as one multi-output function, or the espresso binary')
     parser.add_argument('-c', '--share_across_table', default=False, action='store_true')
     parser.add_argument('-s', '--state', type=str, default='log', choices=['linear', 'log'])
     parser.add_argument('-b', '--bit', type=int, default=32,
                         help='Number of bits when using bit sharing methods')
     parser.add_argument('-cc', '--connected_component', default=False, action='store_true')
+    parser.add_argument('--clause_sink', type=str, default='memory', choices=['memory', 'disk'],
+                        help='Keep the clauses in a compact memory buffer or spill them to a temp file')
+    parser.add_argument('--cache_dir', type=str, default='',
+                        help='Directory of the persistent cache of encoded cpts')
+    parser.add_argument('--cache_size', type=int, default=1024,
+                        help='Size cap of the cpt cache in MB')
+    parser.add_argument('--memo_size', type=int, default=0,
+                        help='Number of minimized cube sets kept in memory for reuse (0 to disable), '
+                        'also kept in the cache dir if given')
+    parser.add_argument('--abc', default=False, action='store_true',
+                        help='Use the abc binary for bit_aig instead of the in-process AIG')
+    parser.add_argument('-qb', '--query_batch', type=str, default='',
+                        help='A file of queries, one per line (.evid, .map, .sdp files), '
+                        'encoded with the network read and encoded once')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of processes encoding the cpts')
+    parser.add_argument('--preprocess', default=False, action='store_true',
+                        help='Simplify the clauses keeping the value of the formula (units, subsumption, '
+                        'equivalent literals, elimination of the innermost exist vars) before writing')
+    parser.add_argument('--split_components', default=False, action='store_true',
+                        help='Encode each connected component of the pruned network (PE, MPE, MAP) to its own '
+                        'formula with a manifest of how to combine the results, see run_components.py')
+    parser.add_argument('--snapshot', default=False, action='store_true',
+                        help='Reuse the .npz snapshot of the network file, written next to it when first read')
+    parser.add_argument('--renumber', type=str, default='none', choices=['none'] + HEURISTICS,
+                        help='Renumber the vars in each quantifier block and sort the clauses '
+                        'by an elimination order of the network')
     args = parser.parse_args()
 
     print(args)
@@ -39,11 +175,6 @@ def main():
     print('Processing', infile)
 
     name, ext = os.path.splitext(infile)
-    outfile1 = infile.replace(ext, '.sdimacs')
-    outfile2 = infile.replace(ext, '.ssat')
-    outfile3 = infile.replace(ext, '.wcnf')
-    outfile4 = infile.replace(ext, '.cnf')  # for approxmc
-    # outfile5 = infile.replace(ext, '.mc2021')
 
     if args.net_type == 'BN':
         net = Network(kind='BN', query=args.query)
@@ -54,25 +185,57 @@ def main():
     elif args.net_type == 'CPT':
         net = Network(kind='CPT', query='PE')
 
-    net.read(infile, args.evid_file, args.query_file)
+    encoder_args = dict(encode=args.method, query=args.query, num_bit=args.bit,
+                        log_state=(args.state == 'log'), prune=args.prune,
+                        connected_component=args.connected_component,
+                        opt=args.opt, share_val=args.share_across_table,
+                        clause_sink=args.clause_sink, jobs=args.jobs,
+                        use_abc=args.abc, relevance=args.relevance,
+                        condition_evid=args.condition_evidence)
+    cpt_cache = None
+    if len(args.cache_dir) > 0:
+        cpt_cache = DiskCache(args.cache_dir, max_size=args.cache_size << 20)
+        encoder_args['cpt_cache'] = cpt_cache
+    if args.memo_size > 0:
+        min_cache = None
+        if cpt_cache is not None:
+            min_cache = DiskCache(os.path.join(args.cache_dir, 'min'), max_size=args.cache_size << 20)
+        encoder_args['min_memo'] = MemoCache(args.memo_size, min_cache)
+
+    if len(args.query_batch) > 0:
+        net.read_network(infile, snapshot=args.snapshot)
+        batch = BatchEncoder(net, infile, **encoder_args)
+        for (query_name, evid_file, query_file, sdp_file) in read_query_batch(args.query_batch):
+            print('Processing query', query_name)
+            encoder = batch.encode(evid_file, query_file, sdp_file)
+            preprocess_formula(encoder, args)
+            renumber_formula(encoder, args)
+            writer = SSATWriter(encoder)
+            writer.write_all(output_targets(query_name, args))
+            print_tool_stats(encoder)
+        print('Reused formulas = %d / %d' % (batch.num_reused, batch.num_queries))
+        print_cache_stats(cpt_cache)
+        return
+
+    net.read(infile, args.evid_file, args.query_file, snapshot=args.snapshot)
+
+    if args.split_components:
+        encode_components(net, name, args, encoder_args)
+        print_cache_stats(cpt_cache)
+        return
 
     # entry = net.cal_num_entry()
     # print('Total entry = ', entry)
 
-    encoder = SSATEncoder(net, args.method, args.query, num_bit=args.bit,
-                          log_state=(args.state == 'log'), prune=args.prune,
-                          connected_component=args.connected_component,
-                          opt=args.opt, share_val=args.share_across_table)
+    encoder = SSATEncoder(net, **encoder_args)
     encoder.tossat()
+    preprocess_formula(encoder, args)
+    renumber_formula(encoder, args)
 
     writer = SSATWriter(encoder)
-    writer.write_ssat(outfile1)
-    writer.write_ssat(outfile2)
-    if args.net_type == 'BN' and args.query == 'PE':
-        writer.write_wcnf(outfile3)
-        if args.method == 'all05':
-            writer.write_cnf(outfile4)
-        # writer.write_mc2021(outfile5)
+    writer.write_all(output_targets(name, args))
+    print_tool_stats(encoder)
+    print_cache_stats(cpt_cache)
 
     '''
     PE query needed for SDP
@@ -0,0 +1,63 @@
+import numpy as np
+
+from PGM import TableView
+from relevance import num_entries, instantiate_evidence
+
+'''
+Condition the network on the evidence before encoding
+
+    - the edges out of the evidence nodes are removed and the observed
+      states are instantiated in the cpts of the children (relevance.py)
+    - an evidence node left without parents is a constant P(e), the product
+      of the constants is net.evid_factor, encoded as one random var of
+      that probability with a unit clause (SSATEncoder.encode_evid), and the
+      node is not encoded
+    - an evidence node with parents is collapsed into two states, the
+      observed one (1) and the others (0), its cpt is P(e | parents)
+
+The value of the formula does not change, the evidence nodes removed or
+collapsed are in net.collapsed_evids.
+'''
+
+
+def condition_evidence(net, constant=True):
+    '''
+    constant: fold the evidence nodes without parents into net.evid_factor
+    return (number of edges, nodes collapsed, constant nodes, cpt entries removed)
+    '''
+    num_edges, removed = instantiate_evidence(net)
+
+    query_var = set(net.query_var) if net.query == 'MAP' else set()
+    num_collapsed = 0
+    num_constant = 0
+    evids = []
+    for (id, state) in net.evids:
+        n = net.id2node[id]
+        if id in query_var or not n.depend or not n.cared or n.kind != 'chance' or \
+                any([c.depend for c in n.children]):
+            evids.append((id, state))
+            continue
+
+        before = num_entries(n)
+        if len(n.parents) == 0 and constant:
+            net.evid_factor *= n.cpt[0][state]
+            n.depend = False
+            n.cared = False
+            num_constant += 1
+            removed += before
+            evids.append((id, state))
+        elif n.num_states > 2:
+            p = np.asarray(n.cpt, dtype=np.float64)[:, state]
+            n.num_states = 2
+            n.states = [0, 1]
+            n.cpt = TableView(np.stack([1 - p, p], axis=1).ravel(), 2)
+            num_collapsed += 1
+            removed += before - num_entries(n)
+            evids.append((id, 1))
+        else:
+            evids.append((id, state))
+            continue
+        net.collapsed_evids.append((id, state))
+
+    net.evids = evids
+    return num_edges, num_collapsed, num_constant, removed
@@ -0,0 +1,764 @@
+from cube import Cube, cube_contain, cube_intersect, cube_supercube, cube_num_lits
+
+'''
+In-process two-level minimization (espresso-style expand, irredundant,
+reduce and last_gasp with the essential primes set aside) on bit-packed
+cubes, see cube.py for the representation.
+
+Functions of up to 1024 minterms of onset + dc are also covered exactly
+(all primes, then a branch and bound cover of bounded size), so on random
+functions of 3-8 vars the covers have no more cubes than the ones of the
+espresso binary; -o esp runs this and -o esp_bin the binary.
+'''
+
+
+def espresso(onset, num_vars, dc=[], max_iter=20, offset=None):
+    '''
+    onset(list of Cube): the cubes to be covered
+    num_vars(int): number of variables
+    dc(list of Cube): don't care cubes
+    offset(list of Cube): the complement of onset + dc if known
+    return a list of Cube covering the onset and contained in onset + dc
+    '''
+    F = remove_contained(onset)
+    # a single cube can only grow into the don't cares
+    if len(F) == 0 or (len(F) == 1 and len(dc) == 0):
+        return F
+
+    D = list(dc)
+    R = offset
+    if R is None:
+        R = complement(F + D, num_vars)
+
+    F = expand(F, R)
+    F = irredundant(F, D)
+
+    # the essential primes are in any cover, kept as don't cares meanwhile
+    E = essential(F, D)
+    if len(E) > 0:
+        F = [c for c in F if c not in E]
+        D = D + E
+
+    F = E + improve(F, D, R, num_vars, max_iter)
+
+    # small functions are covered exactly, the heuristic cover is kept if as good
+    G = exact_cover(onset, dc, num_vars)
+    if G is not None and cover_cost(G) < cover_cost(F):
+        return G
+    return F
+
+
+def improve(F, D, R, num_vars, max_iter):
+    '''
+    reduce, expand and irredundant until the cost stops decreasing,
+    then last_gasp, again while last_gasp reduces the cost
+    '''
+    best = F
+    best_cost = cover_cost(F)
+    for it in range(max_iter):
+        F = reduce(F, D, num_vars)
+        F = expand(F, R)
+        F = irredundant(F, D)
+        cost = cover_cost(F)
+        if cost < best_cost:
+            best = F
+            best_cost = cost
+            continue
+
+        F = last_gasp(best, D, R, num_vars)
+        cost = cover_cost(F)
+        if cost < best_cost:
+            best = F
+            best_cost = cost
+        else:
+            break
+
+    return best
+
+
+def minterms(F, num_vars, limit):
+    '''
+    the set of the minterms of the cubes of F, None if more than limit
+    '''
+    full = (1 << num_vars) - 1
+    if sum([1 << (num_vars - cube_num_lits(c)) for c in F]) > limit:
+        return None
+    res = set()
+    for c in F:
+        free = full & ~c.care
+        sub = free
+        while True:
+            res.add(c.value | sub)
+            if sub == 0:
+                break
+            sub = (sub - 1) & free
+    return res
+
+
+def all_primes(M, num_vars, limit):
+    '''
+    the prime implicants of the minterms M (Quine-McCluskey), None if more than limit implicants
+    '''
+    cur = set([Cube((1 << num_vars) - 1, m) for m in M])
+    primes = []
+    num = len(cur)
+    while len(cur) > 0:
+        nxt = set()
+        merged = set()
+        for c in cur:
+            care = c.care
+            while care:
+                b = care & -care
+                care ^= b
+                if c.value & b and Cube(c.care, c.value ^ b) in cur:
+                    merged.add(c)
+                    merged.add(Cube(c.care, c.value ^ b))
+                    nxt.add(Cube(c.care & ~b, c.value & ~b))
+        primes += [c for c in cur if c not in merged]
+        num += len(nxt)
+        if num > limit:
+            return None
+        cur = nxt
+    return primes
+
+
+def exact_cover(onset, dc, num_vars, max_minterms=1024, max_implicants=8192, max_nodes=200):
+    '''
+    a cover of the fewest primes of onset + dc, by branch and bound over the minterms of the onset,
+    None if the function is over the limits
+    '''
+    on = minterms(onset, num_vars, max_minterms)
+    if on is None:
+        return None
+    free = minterms(dc, num_vars, max_minterms)
+    if free is None:
+        return None
+    primes = all_primes(on | free, num_vars, max_implicants)
+    if primes is None:
+        return None
+
+    rows = dict([(m, 0) for m in on])
+    for k, p in enumerate(primes):
+        for m in minterms([p], num_vars, 1 << num_vars):
+            if m in rows:
+                rows[m] |= 1 << k
+    chosen = min_hitting_set(rows.values(), max_nodes)
+    return [p for k, p in enumerate(primes) if chosen >> k & 1]
+
+
+def espresso_multi(onsets, num_vars, dc=[], max_iter=20):
+    '''
+    minimize the outputs of a multi-output function together
+    onsets(list of list of Cube): the disjoint onsets of the outputs
+    dc(list of Cube): don't care cubes of all outputs
+    return a list of covers, one per output
+
+    the outputs are encoded by extra variables above num_vars, the offset of
+    the characteristic function is complemented once and the offset of each
+    output is its cofactor, instead of complementing each output
+    '''
+    F = [remove_contained(on) for on in onsets]
+    if not disjoint(F, num_vars):
+        return [espresso(on, num_vars, dc, max_iter) for on in F]
+
+    num_out_vars = max(len(F) - 1, 0).bit_length()
+    var_mask = (1 << num_vars) - 1
+    out_mask = ((1 << num_out_vars) - 1) << num_vars
+    chi = [Cube(c.care | out_mask, c.value | (i << num_vars))
+           for i, on in enumerate(F) for c in merge_adjacent(on)]
+    chi += list(dc)
+    # the unused codes of the outputs
+    chi += [Cube(out_mask, i << num_vars) for i in range(len(F), 1 << num_out_vars)]
+    R = complement(chi, num_vars + num_out_vars)
+
+    covers = []
+    for i, on in enumerate(F):
+        if len(on) == 0 or (len(on) == 1 and len(dc) == 0):
+            covers.append(on)
+            continue
+        code = Cube(out_mask, i << num_vars)
+        offset = [Cube(r.care & var_mask, r.value & var_mask) for r in R if cube_intersect(r, code)]
+        covers.append(espresso(on, num_vars, dc, max_iter, offset=offset))
+    return covers
+
+
+def disjoint(F, num_vars):
+    '''
+    whether the covers of F share no minterm, checked on minterm covers only
+    '''
+    full = (1 << num_vars) - 1
+    seen = set()
+    for on in F:
+        for c in on:
+            if c.care != full or c.value in seen:
+                return False
+            seen.add(c.value)
+    return True
+
+
+def cover_cost(F):
+    return (len(F), sum([cube_num_lits(c) for c in F]))
+
+
+def remove_contained(F):
+    '''
+    single cube containment, keep the order of the remaining cubes
+    '''
+    seen = set()
+    uniq = []
+    for c in F:
+        if c not in seen:
+            seen.add(c)
+            uniq.append(c)
+    # the same care set cannot contain each other
+    if len(set([c.care for c in uniq])) <= 1:
+        return uniq
+
+    order = sorted(range(len(uniq)), key=lambda i: cube_num_lits(uniq[i]))
+    kept = []
+    for i in order:
+        care, value = uniq[i]
+        contained = False
+        for k in kept:
+            kc, kv = uniq[k]
+            if (kc & ~care) == 0 and ((kv ^ value) & kc) == 0:
+                contained = True
+                break
+        if not contained:
+            kept.append(i)
+    kept.sort()
+    return [uniq[i] for i in kept]
+
+
+def merge_adjacent(F):
+    '''
+    merge the pairs of cubes differing in one literal until no pair left,
+    the covered minterms are the same
+    '''
+    while True:
+        cubes = set(F)
+        merged = []
+        used = set()
+        for c in F:
+            if c in used:
+                continue
+            care = c.care
+            while care:
+                b = care & -care
+                care ^= b
+                d = Cube(c.care, c.value ^ b)
+                if d in cubes and d not in used:
+                    used.add(c)
+                    used.add(d)
+                    merged.append(Cube(c.care & ~b, c.value & ~b))
+                    break
+        if len(merged) == 0:
+            return F
+        F = merged + [c for c in F if c not in used]
+
+
+def cofactor(F, c):
+    '''
+    cofactor of cover F with respect to cube c
+    '''
+    res = []
+    for f in F:
+        if (f.value ^ c.value) & f.care & c.care:
+            continue
+        res.append(Cube(f.care & ~c.care, f.value & ~c.care))
+    return res
+
+
+def split_var(F):
+    '''
+    choose the most binate variable, or the most frequent one if F is unate
+    return (bit, is_binate)
+    '''
+    pos = 0
+    neg = 0
+    for f in F:
+        pos |= f.care & f.value
+        neg |= f.care & ~f.value
+    binate = pos & neg
+    cand = binate if binate else (pos | neg)
+
+    best = 0
+    best_cnt = -1
+    while cand:
+        b = cand & -cand
+        cand ^= b
+        cnt = 0
+        for f in F:
+            if f.care & b:
+                cnt += 1
+        if cnt > best_cnt:
+            best = b
+            best_cnt = cnt
+    return best, binate != 0
+
+
+def tautology(F):
+    for f in F:
+        if f.care == 0:
+            return True
+    if len(F) == 0:
+        return False
+
+    b, is_binate = split_var(F)
+    # a unate cover without the universal cube cannot be a tautology
+    if not is_binate:
+        return False
+
+    F0 = [Cube(f.care & ~b, f.value) for f in F if not (f.care & f.value & b)]
+    if not tautology(F0):
+        return False
+    F1 = [Cube(f.care & ~b, f.value & ~b) for f in F if not (f.care & ~f.value & b)]
+    return tautology(F1)
+
+
+def complement(F, num_vars):
+    if len(F) == 0:
+        return [Cube(0, 0)]
+    for f in F:
+        if f.care == 0:
+            return []
+
+    # De Morgan
+    if len(F) == 1:
+        f = F[0]
+        res = []
+        care = f.care
+        while care:
+            b = care & -care
+            care ^= b
+            res.append(Cube(b, (~f.value) & b))
+        return res
+
+    b, is_binate = split_var(F)
+    F0 = [Cube(f.care & ~b, f.value) for f in F if not (f.care & f.value & b)]
+    F1 = [Cube(f.care & ~b, f.value & ~b) for f in F if not (f.care & ~f.value & b)]
+    C0 = complement(F0, num_vars)
+    C1 = complement(F1, num_vars)
+
+    # merge the cubes appearing in both halves
+    common = set(C0) & set(C1)
+    res = [c for c in C0 if c in common]
+    for c in C0:
+        if c not in common:
+            res.append(Cube(c.care | b, c.value))
+    for c in C1:
+        if c not in common:
+            res.append(Cube(c.care | b, c.value | b))
+    return res
+
+
+def expand(F, R):
+    '''
+    expand each cube into a prime not intersecting the offset R
+    '''
+    # the number of cubes having each part (0 or 1, both for a free var) of each var
+    num_bits = 0
+    for f in F:
+        num_bits = max(num_bits, f.care.bit_length())
+    cnt_pos = [0] * num_bits
+    cnt_neg = [0] * num_bits
+    for f in F:
+        for j in range(num_bits):
+            b = 1 << j
+            if not f.care & b or f.value & b:
+                cnt_pos[j] += 1
+            if not f.care & b or not f.value & b:
+                cnt_neg[j] += 1
+
+    # expand the cubes of the lightest columns first, they are less likely to be covered
+    weight = []
+    for f in F:
+        w = 0
+        for j in range(num_bits):
+            b = 1 << j
+            if not f.care & b or f.value & b:
+                w += cnt_pos[j]
+            if not f.care & b or not f.value & b:
+                w += cnt_neg[j]
+        weight.append(w)
+    # the number of cubes having each literal, the rare ones are raised first
+    num_lits = {}
+    for f in F:
+        care = f.care
+        while care:
+            b = care & -care
+            care ^= b
+            num_lits[(b, f.value & b)] = num_lits.get((b, f.value & b), 0) + 1
+
+    order = sorted(range(len(F)), key=lambda i: weight[i])
+    covered = [False] * len(F)
+    expanded = []
+    for i in order:
+        if covered[i]:
+            continue
+        c = expand1(F[i], [F[k] for k in range(len(F)) if k != i and not covered[k]], R, num_lits)
+        expanded.append(c)
+        for k, d in enumerate(F):
+            if not covered[k] and cube_contain(c, d):
+                covered[k] = True
+
+    return remove_contained(expanded)
+
+
+def expand1(c, CC, R, num_lits):
+    '''
+    expand cube c into a prime not intersecting the offset R, covering the cubes of CC if it can
+    num_lits(dict): (bit, phase) -> number of cubes of the cover having the literal
+    '''
+    care, value = c
+    blocks = set([(value ^ r.value) & care & r.care for r in R])
+    forbid = single_blocks(blocks)
+
+    # the vars to raise to cover each cube within the overexpanded cube
+    needs = []
+    for d in CC:
+        need = (care & ~d.care) | ((value ^ d.value) & care)
+        if need & forbid == 0:
+            needs.append(need)
+
+    # cover the feasible cubes, the one leaving the most others feasible first
+    while True:
+        feasible = []
+        for need in needs:
+            if need == 0:
+                continue
+            rest = set([b & ~need for b in blocks])
+            if 0 not in rest:
+                feasible.append((need, single_blocks(rest)))
+        if len(feasible) == 0:
+            break
+        best = None
+        best_key = None
+        for (need, lower) in feasible:
+            num = 0
+            for (other, other_lower) in feasible:
+                if other & lower == 0:
+                    num += 1
+            key = (-num, -num_bits_set(need))
+            if best_key is None or key < best_key:
+                best = need
+                best_key = key
+        care &= ~best
+        blocks = set([b & ~best for b in blocks])
+        forbid = single_blocks(blocks)
+        needs = [need & care for need in needs if need & forbid == 0]
+
+    # raise the var most of the other cubes in the overexpanded cube need
+    while True:
+        cnt = {}
+        for need in needs:
+            rest = need
+            while rest:
+                b = rest & -rest
+                rest ^= b
+                cnt[b] = cnt.get(b, 0) + 1
+        if len(cnt) == 0:
+            break
+        b = max(cnt, key=lambda b: (cnt[b], -b))
+        care &= ~b
+        blocks = set([d & ~b for d in blocks])
+        forbid = single_blocks(blocks)
+        needs = [need & care for need in needs if need & forbid == 0 and need & care]
+
+    # raise the literal which most other cubes do not have
+    raise_order = []
+    rest = care
+    while rest:
+        b = rest & -rest
+        rest ^= b
+        raise_order.append((num_lits.get((b, value & b), 0), b.bit_length(), b))
+    raise_order.sort()
+    for (same, j, b) in raise_order:
+        if forbid & b:
+            continue
+        care &= ~b
+        blocks = set([d & ~b for d in blocks])
+        forbid = single_blocks(blocks)
+
+    return Cube(care, value & care)
+
+
+def single_blocks(blocks):
+    '''
+    the literals which cannot be raised
+    '''
+    forbid = 0
+    for d in blocks:
+        if d & (d - 1) == 0:
+            forbid |= d
+    return forbid
+
+
+def num_bits_set(x):
+    return bin(x).count('1')
+
+
+def min_hitting_set(rows, max_nodes=1000):
+    '''
+    rows(iterable of int): nonzero bitmasks
+    return a bitmask meeting every row with the fewest bits,
+    branch and bound up to max_nodes branches, the best found beyond
+    '''
+    rows = list(set(rows))
+    if len(rows) == 0:
+        return 0
+    # the rows met by each bit
+    cols = {}
+    for i, r in enumerate(rows):
+        while r:
+            b = r & -r
+            r ^= b
+            cols[b] = cols.get(b, 0) | (1 << i)
+
+    best = [greedy_hitting_set(rows)]
+    best_num = [num_bits_set(best[0])]
+    nodes = [0]
+
+    def search(cols, U, chosen, num):
+        '''
+        U: the rows not met yet
+        '''
+        while True:
+            cols = dict([(b, m & U) for (b, m) in cols.items() if m & U])
+            # a bit meeting a subset of the rows of another one is not needed
+            # (the kept bits are looked up by the lowest row of the bit checked)
+            kept = {}
+            kept_by_row = {}
+            for (b, m) in sorted(cols.items(), key=lambda x: -num_bits_set(x[1])):
+                if any([m & ~k == 0 for k in kept_by_row.get(m & -m, [])]):
+                    continue
+                kept[b] = m
+                rest = m
+                while rest:
+                    i = rest & -rest
+                    rest ^= i
+                    kept_by_row.setdefault(i, []).append(m)
+            cols = kept
+            # the rows met by one bit only take it
+            once = 0
+            twice = 0
+            for m in cols.values():
+                twice |= once & m
+                once |= m
+            if U & ~once:
+                return
+            single = once & ~twice & U
+            if single == 0:
+                break
+            for (b, m) in cols.items():
+                if m & single:
+                    chosen |= b
+                    num += 1
+                    U &= ~m
+        if num >= best_num[0]:
+            return
+        if U == 0:
+            best[0] = chosen
+            best_num[0] = num
+            return
+        if nodes[0] >= max_nodes:
+            return
+        nodes[0] += 1
+
+        # the bits of each row left
+        row_bits = {}
+        for (b, m) in cols.items():
+            while m:
+                i = m & -m
+                m ^= i
+                row_bits[i] = row_bits.get(i, 0) | b
+        # the rows sharing no bit need a bit each
+        order = sorted(row_bits, key=lambda i: num_bits_set(row_bits[i]))
+        bound = 0
+        used = 0
+        for i in order:
+            if row_bits[i] & used == 0:
+                bound += 1
+                used |= row_bits[i]
+        if num + bound >= best_num[0]:
+            return
+
+        # branch on the bits of the shortest row, the one meeting the most rows first,
+        # a bit not taken in a branch is left out of the next ones
+        row = row_bits[order[0]]
+        bits = []
+        while row:
+            b = row & -row
+            row ^= b
+            bits.append(b)
+        bits.sort(key=lambda b: -num_bits_set(cols[b]))
+        cols = dict(cols)
+        for b in bits:
+            search(cols, U & ~cols[b], chosen | b, num + 1)
+            del cols[b]
+
+    search(cols, (1 << len(rows)) - 1, 0, 0)
+    return best[0]
+
+
+def greedy_hitting_set(rows):
+    '''
+    take the bit meeting the most rows until all rows are met
+    '''
+    chosen = 0
+    while len(rows) > 0:
+        cnt = {}
+        for r in rows:
+            rest = r
+            while rest:
+                b = rest & -rest
+                rest ^= b
+                cnt[b] = cnt.get(b, 0) + 1
+        b = max(cnt, key=lambda b: (cnt[b], -b))
+        chosen |= b
+        rows = [r for r in rows if r & b == 0]
+    return chosen
+
+
+def essential(F, D):
+    '''
+    the primes of F containing a minterm of no other prime of the function,
+    p is essential if the consensus of the other cubes with p does not cover p
+    '''
+    E = []
+    for i, p in enumerate(F):
+        H = []
+        for q in F[:i] + F[i+1:] + D:
+            conflict = (p.value ^ q.value) & p.care & q.care
+            if conflict & (conflict - 1):
+                continue
+            care = (p.care | q.care) & ~conflict
+            H.append(Cube(care, (p.value | q.value) & care))
+        if not tautology(cofactor(H, p)):
+            E.append(p)
+    return E
+
+
+def irredundant(F, D, max_pieces=4096):
+    '''
+    remove the cubes covered by the other cubes and the don't cares,
+    the fewest partially redundant cubes are kept to cover each other
+    '''
+    # relatively essential cubes
+    essential = []
+    redundant = []
+    for i, c in enumerate(F):
+        if tautology(cofactor(F[:i] + F[i+1:] + D, c)):
+            redundant.append(i)
+        else:
+            essential.append(i)
+    if len(redundant) == 0:
+        return F
+
+    E = [F[i] for i in essential]
+    # partially redundant cubes
+    partial = [i for i in redundant if not tautology(cofactor(E + D, F[i]))]
+
+    rows = cover_rows([F[i] for i in partial], E + D, max_pieces)
+    if rows is not None:
+        chosen = min_hitting_set(rows)
+        keep = set(essential) | set([i for k, i in enumerate(partial) if chosen >> k & 1])
+        return [F[i] for i in range(len(F)) if i in keep]
+
+    # greedily drop the partially redundant cubes covered by the rest
+    order = sorted(partial, key=lambda i: -cube_num_lits(F[i]))
+    removed = set()
+    for i in order:
+        others = [F[k] for k in partial if k != i and k not in removed]
+        if tautology(cofactor(E + others + D, F[i])):
+            removed.add(i)
+    keep = set(essential) | (set(partial) - removed)
+    return [F[i] for i in range(len(F)) if i in keep]
+
+
+def cover_rows(P, C, max_pieces):
+    '''
+    split the part of the cubes P outside the cover C into pieces each contained in or
+    disjoint from every cube of P
+    return a bitmask of the cubes of P containing each piece, None beyond max_pieces pieces
+    '''
+    rows = set()
+    num_pieces = 0
+    for p in P:
+        stack = [Cube(u.care | p.care, u.value | p.value) for u in complement(cofactor(C, p), 0)]
+        while len(stack) > 0:
+            num_pieces += 1
+            if num_pieces > max_pieces:
+                return None
+            q = stack.pop()
+            row = 0
+            split = 0
+            for k, c in enumerate(P):
+                if not cube_intersect(c, q):
+                    continue
+                if cube_contain(c, q):
+                    row |= 1 << k
+                else:
+                    split = c.care & ~q.care
+                    break
+            if split:
+                b = split & -split
+                stack.append(Cube(q.care | b, q.value))
+                stack.append(Cube(q.care | b, q.value | b))
+            else:
+                rows.add(row)
+    return rows
+
+
+def reduce(F, D, num_vars):
+    '''
+    reduce each cube into the smallest cube containing its essential part
+    '''
+    F = list(F)
+    order = sorted(range(len(F)), key=lambda i: -cube_num_lits(F[i]))
+    removed = [False] * len(F)
+    for i in order:
+        c = F[i]
+        others = [F[k] for k in range(len(F)) if k != i and not removed[k]]
+        comp = complement(cofactor(others + D, c), num_vars)
+        if len(comp) == 0:
+            removed[i] = True
+            continue
+        sc = comp[0]
+        for s in comp[1:]:
+            sc = cube_supercube(sc, s)
+        F[i] = Cube(c.care | sc.care, c.value | sc.value)
+    return [F[i] for i in range(len(F)) if not removed[i]]
+
+
+def last_gasp(F, D, R, num_vars):
+    '''
+    reduce the cubes independently and add the primes covering
+    at least two of the reduced cubes
+    '''
+    reduced = []
+    for i, c in enumerate(F):
+        comp = complement(cofactor(F[:i] + F[i+1:] + D, c), num_vars)
+        if len(comp) == 0:
+            continue
+        sc = comp[0]
+        for s in comp[1:]:
+            sc = cube_supercube(sc, s)
+        r = Cube(c.care | sc.care, c.value | sc.value)
+        if r != c:
+            reduced.append(r)
+    if len(reduced) < 2:
+        return F
+
+    new_primes = []
+    for p in expand(reduced, R):
+        num = 0
+        for r in reduced:
+            if cube_contain(p, r):
+                num += 1
+        if num >= 2:
+            new_primes.append(p)
+    if len(new_primes) == 0:
+        return F
+
+    return irredundant(remove_contained(F + new_primes), D)
@@ -0,0 +1,380 @@
+import numpy as np
+
+from clause_sink import new_clause_sink
+from renumber import map_vars
+from ssat_writer import SSATWriter
+
+'''
+CNF preprocessing that keeps the value of an SSAT formula
+
+The prefix is a list of (quantifier, var, probability) in order, quantifier
+'e' (exist), 'r' (random) or 't' (threshold). The rules and where they apply:
+    unit propagation:    all vars, a unit on a random var multiplies the
+                         value by its probability (self.scale)
+    subsumption and
+    self-subsuming resolution: all clauses (the matrix stays equivalent)
+    equivalent literals: an exist var equivalent to a literal of the same
+                         or an outer block is replaced by the literal
+    variable elimination: the exist vars of the innermost block, when the
+                         resolvents are no more than the clauses removed
+The threshold vars, the frozen vars and the vars not in the prefix are
+never assigned or replaced. The vars assigned or removed are in
+self.removed, the value of the formula is self.scale times the value of
+the clauses left (quantified by the prefix without the removed vars).
+
+    pre = Preprocessor(clauses, prefix)
+    pre.run()
+    clauses = pre.result()
+
+preprocess(encoder) applies it to the clauses of SSATEncoder between tossat
+and SSATWriter (encode.py --preprocess), instead of a round trip through an
+external preprocessor (simplify_ssat.py).
+'''
+
+
+class Preprocessor:
+    def __init__(self, clauses, prefix, frozen=(), max_occ=16, max_len=20):
+        '''
+        clauses: iterable of lists of literals
+        frozen: the vars kept, e.g. the random vars when the probabilities must stay 0.5
+        max_occ, max_len: bounds of the occurrences and the resolvents of variable elimination
+        '''
+        self.max_occ = max_occ
+        self.max_len = max_len
+
+        self.quant = {}
+        self.prob = {}
+        self.level = {}     # block index
+        self.pos = {}       # position in the prefix
+        level = -1
+        last_q = None
+        self.frozen = set(frozen)
+        for (q, v, p) in prefix:
+            if v in self.quant:
+                # a var twice in the prefix is kept as it is
+                self.frozen.add(v)
+                continue
+            if q != last_q:
+                level += 1
+                last_q = q
+            self.quant[v] = q
+            self.prob[v] = p
+            self.level[v] = level
+            self.pos[v] = len(self.pos)
+        self.inner_level = level if last_q == 'e' else None
+
+        self.clauses = []
+        self.occ = {}
+        self.units = []
+        self.unsat = False
+        self.scale = 1.0
+        self.removed = set()
+        self.stats = {'units': 0, 'subsumed': 0, 'strengthened': 0, 'equivalent': 0, 'eliminated': 0}
+        for cl in clauses:
+            cl = set(cl)
+            if any([-l in cl for l in cl]):
+                continue
+            self.add(cl)
+
+    # clause store
+
+    def add(self, cl):
+        if len(cl) == 0:
+            self.unsat = True
+        i = len(self.clauses)
+        self.clauses.append(cl)
+        for l in cl:
+            self.occ.setdefault(l, set()).add(i)
+        if len(cl) == 1:
+            self.units.append(i)
+        return i
+
+    def remove(self, i):
+        for l in self.clauses[i]:
+            self.occ[l].discard(i)
+        self.clauses[i] = None
+
+    def remove_lit(self, i, l):
+        cl = self.clauses[i]
+        cl.discard(l)
+        self.occ[l].discard(i)
+        if len(cl) == 0:
+            self.unsat = True
+        elif len(cl) == 1:
+            self.units.append(i)
+
+    def live(self):
+        return [i for i, cl in enumerate(self.clauses) if cl is not None]
+
+    def result(self):
+        '''
+        the clauses left, [] if unsat (self.scale is then 0)
+        '''
+        if self.unsat:
+            return []
+        return [sorted(cl, key=abs) for cl in self.clauses if cl is not None]
+
+    def may_assign(self, v):
+        return v in self.quant and self.quant[v] != 't' and v not in self.frozen
+
+    def is_free_exist(self, v):
+        return v in self.quant and self.quant[v] == 'e' and v not in self.frozen
+
+    # rules
+
+    def propagate(self):
+        changed = False
+        while len(self.units) > 0 and not self.unsat:
+            i = self.units.pop()
+            cl = self.clauses[i]
+            if cl is None or len(cl) != 1:
+                continue
+            l = next(iter(cl))
+            v = abs(l)
+            if not self.may_assign(v):
+                continue
+            if self.quant[v] == 'r':
+                p = self.prob[v]
+                self.scale *= p if l > 0 else 1 - p
+            for j in list(self.occ.get(l, ())):
+                self.remove(j)
+            for j in list(self.occ.get(-l, ())):
+                self.remove_lit(j, -l)
+            self.removed.add(v)
+            self.stats['units'] += 1
+            changed = True
+        if self.unsat:
+            self.scale = 0.0
+        return changed
+
+    def subsume(self):
+        '''
+        backward subsumption and self-subsuming resolution by each clause, shortest first
+        '''
+        changed = False
+        order = sorted(self.live(), key=lambda i: len(self.clauses[i]))
+        for i in order:
+            c = self.clauses[i]
+            if c is None or self.unsat:
+                continue
+            # the literal of the fewest occurrences
+            best = min(c, key=lambda l: len(self.occ.get(l, ())) + len(self.occ.get(-l, ())))
+            for j in list(self.occ.get(best, ())):
+                d = self.clauses[j]
+                if j != i and d is not None and len(d) >= len(c) and c <= d:
+                    self.remove(j)
+                    self.stats['subsumed'] += 1
+                    changed = True
+            for l in list(c):
+                rest = c - {l}
+                for j in list(self.occ.get(-l, ())):
+                    d = self.clauses[j]
+                    if j != i and d is not None and len(d) >= len(c) and rest <= d:
+                        self.remove_lit(j, -l)
+                        self.stats['strengthened'] += 1
+                        changed = True
+                if self.clauses[i] is None or len(c) == 1:
+                    break
+        return changed
+
+    def implication_sccs(self):
+        '''
+        strongly connected components of the implication graph of the binary clauses
+        (iterative Tarjan), each a list of literals
+        '''
+        succ = {}
+        for cl in self.clauses:
+            if cl is not None and len(cl) == 2:
+                a, b = cl
+                succ.setdefault(-a, []).append(b)
+                succ.setdefault(-b, []).append(a)
+
+        index = {}
+        low = {}
+        on_stack = set()
+        stack = []
+        sccs = []
+        for root in succ:
+            if root in index:
+                continue
+            work = [(root, 0)]
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            while len(work) > 0:
+                l, k = work[-1]
+                nexts = succ.get(l, [])
+                if k < len(nexts):
+                    work[-1] = (l, k + 1)
+                    m = nexts[k]
+                    if m not in index:
+                        index[m] = low[m] = len(index)
+                        stack.append(m)
+                        on_stack.add(m)
+                        work.append((m, 0))
+                    elif m in on_stack:
+                        low[l] = min(low[l], index[m])
+                    continue
+                work.pop()
+                if len(work) > 0:
+                    p = work[-1][0]
+                    low[p] = min(low[p], low[l])
+                if low[l] == index[l]:
+                    scc = []
+                    while True:
+                        m = stack.pop()
+                        on_stack.discard(m)
+                        scc.append(m)
+                        if m == l:
+                            break
+                    if len(scc) > 1:
+                        sccs.append(scc)
+        return sccs
+
+    def substitute(self, v, lit):
+        '''
+        replace v by lit in all the clauses
+        '''
+        for sign in [1, -1]:
+            for j in list(self.occ.get(sign * v, ())):
+                cl = self.clauses[j]
+                self.remove(j)
+                cl.discard(sign * v)
+                if -sign * lit in cl:
+                    continue    # tautology
+                cl.add(sign * lit)
+                self.add(cl)
+
+    def equivalences(self):
+        changed = False
+        for scc in self.implication_sccs():
+            if self.unsat:
+                break
+            lits = set(scc)
+            if any([-l in lits for l in lits]):
+                self.unsat = True
+                self.scale = 0.0
+                break
+            # each component has a mirror of negated literals, take the one with a positive rep
+            known = [l for l in scc if abs(l) in self.pos]
+            if len(known) == 0:
+                continue
+            rep = min(known, key=lambda l: self.pos[abs(l)])
+            if rep < 0:
+                continue
+            for l in scc:
+                v = abs(l)
+                if l == rep or not self.is_free_exist(v) or self.level[v] < self.level[rep]:
+                    continue
+                self.substitute(v, rep if l > 0 else -rep)
+                self.removed.add(v)
+                self.stats['equivalent'] += 1
+                changed = True
+        return changed
+
+    def eliminate(self):
+        if self.inner_level is None:
+            return False
+        changed = False
+        cands = [v for v in self.quant if self.level[v] == self.inner_level and self.is_free_exist(v)]
+        cands.sort(key=lambda v: len(self.occ.get(v, ())) * len(self.occ.get(-v, ())))
+        for v in cands:
+            if self.unsat:
+                break
+            pos = list(self.occ.get(v, ()))
+            neg = list(self.occ.get(-v, ()))
+            if len(pos) + len(neg) == 0 or len(pos) > self.max_occ or len(neg) > self.max_occ:
+                continue
+            resolvents = []
+            ok = True
+            for i in pos:
+                for j in neg:
+                    r = (self.clauses[i] | self.clauses[j]) - {v, -v}
+                    if any([-l in r for l in r]):
+                        continue
+                    resolvents.append(r)
+                    if len(r) > self.max_len or len(resolvents) > len(pos) + len(neg):
+                        ok = False
+                        break
+                if not ok:
+                    break
+            if not ok:
+                continue
+            for i in pos + neg:
+                self.remove(i)
+            for r in resolvents:
+                self.add(r)
+            self.removed.add(v)
+            self.stats['eliminated'] += 1
+            changed = True
+        return changed
+
+    def run(self, max_rounds=8):
+        self.propagate()
+        for k in range(max_rounds):
+            changed = False
+            for rule in [self.subsume, self.equivalences, self.eliminate]:
+                if self.unsat:
+                    break
+                changed |= rule()
+                changed |= self.propagate()
+            if not changed or self.unsat:
+                break
+        if self.unsat:
+            self.scale = 0.0
+        return self.stats
+
+
+def frozen_vars(encoder, prefix):
+    '''
+    the random vars of 0.5 counted in the scale printed by SSATWriter (state vars,
+    rand vars of -1), and all the random vars of .cnf (all05)
+    '''
+    rand = set([v for (q, v, p) in prefix if q == 'r'])
+    if encoder.encode == 'all05':
+        return rand
+    counted = set([abs(v) for v in encoder.state_vars + encoder.util_state_vars])
+    counted |= set([v for (v, p) in encoder.rand_vars if p == -1])
+    frozen = rand & counted
+    # the role of the state vars of a node of two depends on their number (SSATWriter.roles('len'))
+    if encoder.net.query == 'PE':
+        for vars in encoder.node_id2state_vars.values():
+            if len(vars) == 2 and abs(vars[0]) != abs(vars[1]):
+                frozen |= set([abs(v) for v in vars])
+    return frozen
+
+
+def preprocess(encoder):
+    '''
+    preprocess the clauses of encoder in place, the vars removed are removed from the prefix and
+    the other vars renumbered in order, the scale is a random var of that probability with a unit clause
+    the formula is not changed if the clauses are unsatisfiable (scale 0)
+    return the Preprocessor
+    '''
+    prefix = SSATWriter(encoder).prefix()
+    pre = Preprocessor(encoder.clauses, prefix, frozen_vars(encoder, prefix))
+    pre.run()
+    if pre.unsat:
+        return pre
+
+    keep = np.ones(encoder.var_id + 1, dtype=np.int64)
+    keep[0] = 0
+    keep[list(pre.removed)] = 0
+    new_id = np.cumsum(keep) * keep
+    # the vars of a range are still consecutive
+    num_kept = np.cumsum(keep)
+    ranges = {id: [range(int(num_kept[r.start - 1]) + 1, int(num_kept[r.stop - 1]) + 1) for r in rs]
+              for id, rs in encoder.node_id2var_range.items()}
+
+    sink = new_clause_sink(encoder.clause_sink)
+    for cl in pre.result():
+        sink.append([int(new_id[v]) if v > 0 else -int(new_id[-v]) for v in cl])
+    encoder.clauses = sink
+    map_vars(encoder, new_id)
+    encoder.node_id2var_range = ranges
+
+    if pre.scale != 1:
+        encoder.var_id += 1
+        encoder.rand_vars = encoder.rand_vars + [(encoder.var_id, pre.scale)]
+        encoder.clauses.append([encoder.var_id])
+    return pre
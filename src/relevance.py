@@ -0,0 +1,161 @@
+import numpy as np
+
+from PGM import TableView
+
+'''
+Relevance analysis of the network of a query before encoding
+
+The rules, applied in order (the removed nodes are marked not depend):
+    evidence edges: the edges out of the evidence nodes are removed and the
+                    observed states are instantiated in the cpts of the children
+    barren:         the nodes without an evidence, query, unobserved or
+                    decision (SDP) node or utility (MEU) among their descendants
+    d-separation:   the nodes whose cpts are not requisite for
+                    P(decision, unobserved | evidence) by Bayes-ball (SDP),
+                    the evidence nodes removed are not cared (encode_evid)
+
+The rules keep the value of the formula of each query:
+    MPE: evidence edges (the max over a barren node is not 1)
+    PE, MAP: evidence edges, barren (a joint probability, scaled by d-separation)
+    SDP: all, the threshold on the conditional is not changed by the scale
+    MEU: barren
+The edges of a causal graph are kept, the evidence is an intervention.
+
+    stats = prune_relevance(net)
+    for rule, (num_nodes, num_entries) in stats.items(): ...
+'''
+
+RULES = ['evidence edges', 'barren', 'd-separation']
+
+
+def num_entries(n):
+    if n.kind != 'chance':
+        return 0
+    return len(n.cpt) * n.num_states
+
+
+def instantiate_evidence(net):
+    '''
+    remove the edges out of the evidence nodes, recorded in net.removed_edges
+    return (number of edges, number of cpt entries removed)
+    '''
+    evids = dict(net.evids)
+    if net.query == 'MAP':
+        for id in net.query_var:
+            evids.pop(id, None)
+
+    num_edges = 0
+    removed = 0
+    for n in net.nodes:
+        if not n.depend or n.kind != 'chance':
+            continue
+        observed = [i for i, p in enumerate(n.parents) if p.id in evids]
+        if len(observed) == 0:
+            continue
+
+        shape = [p.num_states for p in n.parents] + [n.num_states]
+        cpt = np.asarray(n.cpt, dtype=np.float64).reshape(shape)
+        index = tuple([evids[p.id] if i in observed else slice(None) for i, p in enumerate(n.parents)])
+        before = num_entries(n)
+        n.cpt = TableView(np.ascontiguousarray(cpt[index]).ravel(), n.num_states)
+
+        for i in observed:
+            p = n.parents[i]
+            p.children = [c for c in p.children if c is not n]
+            net.removed_edges.append((p.id, n.id, evids[p.id]))
+        n.parents = [p for i, p in enumerate(n.parents) if i not in observed]
+        num_edges += len(observed)
+        removed += before - num_entries(n)
+    return num_edges, removed
+
+
+def mark_ancestors(net, cared):
+    '''
+    mark the nodes in cared and their ancestors depend
+    return (number of nodes, number of cpt entries removed)
+    '''
+    before = [n for n in net.nodes if n.depend]
+    for n in net.nodes:
+        n.depend = False
+    for n in cared:
+        net.mark_depend(n)
+    removed = [n for n in before if not n.depend]
+    return len(removed), sum([num_entries(n) for n in removed])
+
+
+def requisite_nodes(targets, observed):
+    '''
+    Bayes-ball (Shachter, 1998) from targets given observed (sets of nodes)
+    return the nodes marked on the top, whose cpts are requisite for P(targets | observed)
+    '''
+    top = set()
+    bottom = set()
+    # (node, visited from a child)
+    schedule = [(n, True) for n in targets]
+    while len(schedule) > 0:
+        n, from_child = schedule.pop()
+        if from_child and n not in observed:
+            if n not in top:
+                top.add(n)
+                schedule += [(p, True) for p in n.parents]
+            if n not in bottom:
+                bottom.add(n)
+                schedule += [(c, False) for c in n.children]
+        elif not from_child:
+            if n in observed:
+                if n not in top:
+                    top.add(n)
+                    schedule += [(p, True) for p in n.parents]
+            elif n not in bottom:
+                bottom.add(n)
+                schedule += [(c, False) for c in n.children]
+    return top
+
+
+def mark_requisite(net, targets, observed):
+    '''
+    the depend nodes not requisite are removed, the evidence of them is not cared
+    return (number of nodes, number of cpt entries removed)
+    '''
+    top = requisite_nodes(targets, observed)
+    num = 0
+    removed = 0
+    for n in net.nodes:
+        if n.depend and n not in top:
+            n.depend = False
+            num += 1
+            removed += num_entries(n)
+    for n in observed:
+        if not n.depend:
+            n.cared = False
+    return num, removed
+
+
+def prune_relevance(net):
+    '''
+    apply the rules of net.query to net
+    return rule -> (number of nodes or edges, number of cpt entries removed)
+    '''
+    stats = {}
+    evid_nodes = [net.id2node[id] for (id, state) in net.evids]
+
+    if net.kind == 'BN' and not net.causal:
+        stats['evidence edges'] = instantiate_evidence(net)
+
+    cared = None
+    if net.kind == 'ID':
+        cared = [p for u in net.utils for p in u.parents]
+    elif net.query in ['PE', 'MAP']:
+        cared = evid_nodes + [net.id2node[id] for id in net.query_var]
+    elif net.query == 'SDP':
+        cared = evid_nodes + [net.id2node[id] for id in net.unobserved] + \
+            [net.id2node[id] for (id, state) in net.dec]
+    # nothing cared, nothing to compute but 1
+    if cared is not None and len(cared) > 0:
+        stats['barren'] = mark_ancestors(net, cared)
+
+    if net.kind == 'BN' and net.query == 'SDP' and len(net.dec) > 0:
+        targets = set([net.id2node[id] for id in net.unobserved] + [net.id2node[id] for (id, state) in net.dec])
+        stats['d-separation'] = mark_requisite(net, targets, set(evid_nodes) - targets)
+
+    return stats
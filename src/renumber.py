@@ -0,0 +1,146 @@
+from array import array
+
+import numpy as np
+
+from clause_sink import new_clause_sink
+from elim_order import moral_graph, elim_order
+from ssat_writer import SSATWriter
+
+'''
+Renumber the vars and reorder the clauses of an encoded formula by an
+elimination order of the network, between SSATEncoder.tossat and SSATWriter
+
+The nodes are ranked in the reverse of the elimination order (the nodes
+eliminated last first, as the branching order of a tree decomposition) and
+each var takes the rank of the node it was created for
+(SSATEncoder.node_id2var_range). The ids are permuted within each
+quantifier block of the prefix: the blocks keep their place and size, and
+the vars of a block are numbered by rank. The clauses are stably sorted by
+the largest rank of their vars. The formula itself is not changed.
+
+    encoder.tossat()
+    renumber(encoder, 'minfill')
+    SSATWriter(encoder).write_all(targets)
+'''
+
+
+def node_ranks(encoder, heuristic='minfill'):
+    '''
+    return (node id -> rank, induced width of the order)
+    '''
+    net = encoder.net
+    adj, weights = moral_graph(net)
+    order, width = elim_order(adj, weights, heuristic)
+    rank = {id: i for i, id in enumerate(order[::-1])}
+    # a utility joins the bucket of its last parent
+    for u in net.utils:
+        ranks = [rank[p.id] for p in u.parents if p.id in rank]
+        if len(ranks) > 0:
+            rank[u.id] = max(ranks)
+    return rank, width
+
+
+def var_ranks(encoder, rank):
+    '''
+    rank of each var id, the vars of no node are ranked after all the nodes
+    '''
+    var_rank = np.full(encoder.var_id + 1, len(rank), dtype=np.int64)
+    var_rank[0] = -1
+    for node_id, ranges in encoder.node_id2var_range.items():
+        if node_id in rank:
+            for r in ranges:
+                var_rank[r.start:r.stop] = rank[node_id]
+    return var_rank
+
+
+def new_var_ids(encoder, var_rank):
+    '''
+    the prefix blocks in order, the vars of each block by rank
+    return new_id, new_id[old id] = new id
+    '''
+    new_id = np.zeros(encoder.var_id + 1, dtype=np.int64)
+    next_id = 1
+    for (q, ids) in SSATWriter(encoder).quantifier_blocks():
+        ids = [id for id in dict.fromkeys(ids) if new_id[id] == 0]
+        ids.sort(key=lambda id: (var_rank[id], id))
+        for id in ids:
+            new_id[id] = next_id
+            next_id += 1
+    # the vars not in the prefix keep their order at the end
+    for id in range(1, encoder.var_id + 1):
+        if new_id[id] == 0:
+            new_id[id] = next_id
+            next_id += 1
+    return new_id
+
+
+def sort_clauses(clauses, new_id, var_rank, kind):
+    '''
+    return a new clause sink of the renumbered clauses, by the largest rank of their vars
+    '''
+    sink = new_clause_sink(kind)
+    chunks = [np.array(lits, dtype=np.int64) for lits in clauses.blocks()]
+    if len(chunks) == 0:
+        return sink
+    lits = np.concatenate(chunks)
+
+    ends = np.flatnonzero(lits == 0)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    # every clause has at least its 0, ranked -1
+    key = np.maximum.reduceat(var_rank[np.abs(lits)], starts)
+    order = np.argsort(key, kind='stable')
+
+    lens = (ends - starts + 1)[order]
+    offsets = np.cumsum(lens) - lens
+    idx = np.arange(len(lits)) + np.repeat(starts[order] - offsets, lens)
+    lits = lits[idx]
+    lits = np.sign(lits) * new_id[np.abs(lits)]
+
+    block = array('i')
+    block.frombytes(lits.astype(np.int32).tobytes())
+    sink.append_block(block, len(starts))
+    return sink
+
+
+def map_vars(encoder, new_id, sort=False):
+    '''
+    replace the var ids read by SSATWriter by new_id[id], the vars of new id 0 are removed
+    sort: sort the lists of vars by the new ids
+    the lists and dicts are replaced, not modified (shared by BatchEncoder)
+    '''
+    order = sorted if sort else list
+
+    def var(v):
+        return int(new_id[v]) if v >= 0 else -int(new_id[-v])
+
+    def kept(v):
+        return new_id[abs(v)] != 0
+
+    encoder.thr_var = var(encoder.thr_var)
+    for k in ['state_vars', 'intro_vars', 'dec_vars', 'util_state_vars']:
+        setattr(encoder, k, order([var(v) for v in getattr(encoder, k) if kept(v)]))
+    for k in ['rand_vars', 'util_vars']:
+        setattr(encoder, k, order([(var(v), p) for (v, p) in getattr(encoder, k) if kept(v)]))
+    encoder.ob_vars = [(var(v), p) for (v, p) in encoder.ob_vars if kept(v)]
+    for k in ['node_id2state_vars', 'node_id2dec_vars']:
+        setattr(encoder, k, {id: [var(v) for v in vars if kept(v)] for id, vars in getattr(encoder, k).items()})
+    encoder.node_id2ob_vars = {id: [(var(v), p) for (v, p) in vars if kept(v)]
+                               for id, vars in encoder.node_id2ob_vars.items()}
+    encoder.node_id2edge_var = {id: var(v) for id, v in encoder.node_id2edge_var.items() if kept(v)}
+    encoder.var_id = int(new_id.max())
+    # no more the ranges of the new ids
+    encoder.node_id2var_range = {}
+
+
+def renumber(encoder, heuristic='minfill'):
+    '''
+    renumber the vars read by SSATWriter and sort the clauses, in place
+    return the induced width of the elimination order
+    '''
+    rank, width = node_ranks(encoder, heuristic)
+    var_rank = var_ranks(encoder, rank)
+    new_id = new_var_ids(encoder, var_rank)
+
+    encoder.clauses = sort_clauses(encoder.clauses, new_id, var_rank, encoder.clause_sink)
+    map_vars(encoder, new_id, sort=True)
+    return width
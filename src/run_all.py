@@ -1,33 +1,292 @@
 import sys
 import os
 import glob
-import multiprocessing as mp
+import time
+import signal
+import sqlite3
+import argparse
+import resource
 
-# want = '*.wcnf'
+'''
+Run a script on every file of a directory, a job per file, as
 
+    python3 src/run_all.py ssat.sh exp/bn .ssat 4
 
-def run(script, filename):
-    # cmd = 'runexec --keep-system-config --output %s.log sh %s %s >> %s.log' % (
-    #     filename, script, filename, filename)
-    cmd = 'sh %s %s' % (script, filename)
-    os.system(cmd)
+The jobs are kept in an SQLite database (<dir>/run_all.db by default), so
+an interrupted sweep resumes with the jobs not finished, and scheduled
+largest first (by the size of the file, or by the cost predicted from the
+jobs finished) on the given number of cores. Each job runs in its own
+process group with the limits of resource.setrlimit (cpu time, address
+space), inherited by the solver started by the script; the cpu time and
+peak rss of the job and its children are read by os.wait4. A wall time
+limit kills the process group, and the processes left in the group of a
+job are killed when it ends. A file changed since its job was added (size
+or mtime) is run again.
+'''
 
 
-if __name__ == "__main__":
-    # arguments
-    script = sys.argv[1]
-    dir_name = sys.argv[2]
-    want = '*' + sys.argv[3]
-    num_cores = 4
-    if len(sys.argv) == 5:
-        num_cores = int(sys.argv[4])
+class JobDB:
+    def __init__(self, filename):
+        self.conn = sqlite3.connect(filename)
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+            script TEXT, file TEXT, size INTEGER, status TEXT, exit_code INTEGER,
+            cpu_time REAL, max_rss INTEGER, wall_time REAL, finished REAL, mtime REAL,
+            PRIMARY KEY (script, file))''')
+        # a database of an earlier version without the mtime of the files
+        columns = [r[1] for r in self.conn.execute('PRAGMA table_info(jobs)')]
+        if 'mtime' not in columns:
+            self.conn.execute('ALTER TABLE jobs ADD COLUMN mtime REAL')
+        self.conn.commit()
+
+    def add(self, script, filenames):
+        '''
+        add the files not seen yet as pending, the files changed since they were added (size or mtime)
+        and the jobs left running by an interrupted sweep are pending again
+        '''
+        stats = [(f, os.stat(f)) for f in filenames]
+        rows = [(script, f, st.st_size, st.st_mtime, 'pending') for (f, st) in stats]
+        self.conn.executemany('INSERT OR IGNORE INTO jobs (script, file, size, mtime, status) VALUES (?, ?, ?, ?, ?)',
+                              rows)
+        changed = [(st.st_size, st.st_mtime, script, f, st.st_size, st.st_mtime) for (f, st) in stats]
+        self.conn.executemany('''UPDATE jobs SET size = ?, mtime = ?, status = 'pending'
+            WHERE script = ? AND file = ? AND (size != ? OR mtime != ?)''', changed)
+        # the mtime is unknown in a database of an earlier version, only the size is compared
+        self.conn.executemany('UPDATE jobs SET mtime = ? WHERE script = ? AND file = ? AND mtime IS NULL',
+                              [(st.st_mtime, script, f) for (f, st) in stats])
+        self.conn.execute("UPDATE jobs SET status = 'pending' WHERE script = ? AND status = 'running'", (script,))
+        self.conn.commit()
+
+    def retry(self, script, status):
+        self.conn.execute("UPDATE jobs SET status = 'pending' WHERE script = ? AND status = ?", (script, status))
+        self.conn.commit()
+
+    def pending(self, script, filenames):
+        '''
+        return list of (file, size, cpu time of an earlier run or None)
+        '''
+        rows = self.conn.execute("SELECT file, size, cpu_time FROM jobs WHERE script = ? AND status = 'pending'",
+                                 (script,)).fetchall()
+        wanted = set(filenames)
+        return [r for r in rows if r[0] in wanted]
+
+    def cost_per_byte(self):
+        '''
+        cpu time per byte of the input over the finished jobs of all scripts, None if no job is finished
+        '''
+        cpu, size = self.conn.execute(
+            "SELECT SUM(cpu_time), SUM(size) FROM jobs WHERE status = 'done' AND size > 0").fetchone()
+        if cpu is None or not size:
+            return None
+        return cpu / size
+
+    def set_status(self, script, filename, status):
+        self.conn.execute('UPDATE jobs SET status = ? WHERE script = ? AND file = ?', (status, script, filename))
+        self.conn.commit()
+
+    def finish(self, script, filename, status, exit_code, cpu_time, max_rss, wall_time):
+        self.conn.execute('''UPDATE jobs SET status = ?, exit_code = ?, cpu_time = ?, max_rss = ?,
+            wall_time = ?, finished = ? WHERE script = ? AND file = ?''',
+                          (status, exit_code, cpu_time, max_rss, wall_time, time.time(), script, filename))
+        self.conn.commit()
+
+    def summary(self, script):
+        return dict(self.conn.execute('SELECT status, COUNT(*) FROM jobs WHERE script = ? GROUP BY status',
+                                      (script,)).fetchall())
+
+
+def order_jobs(db, jobs, order='size'):
+    '''
+    jobs: list of (file, size, cpu time of an earlier run or None)
+    return list of (file, predicted cost), the largest first
+    order: 'size' of the file, or 'cost', the cpu time of an earlier run of the file
+        or its size times the cpu time per byte of the jobs finished
+    '''
+    rate = db.cost_per_byte() if order == 'cost' else None
+    costs = []
+    for (f, size, cpu_time) in jobs:
+        if order == 'cost' and cpu_time is not None:
+            cost = cpu_time
+        elif rate is not None:
+            cost = size * rate
+        else:
+            cost = size
+        costs.append((f, cost))
+    costs.sort(key=lambda x: (-x[1], x[0]))
+    return costs
+
+
+def set_limits(cpu_time, memory):
+    '''
+    in the job process, inherited by its children
+    cpu_time: seconds, memory: MB of address space, 0 for no limit
+    '''
+    if cpu_time > 0:
+        # SIGXCPU at the soft limit, SIGKILL at the hard one
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_time, cpu_time + 5))
+    if memory > 0:
+        resource.setrlimit(resource.RLIMIT_AS, (memory << 20, memory << 20))
+
+
+class Scheduler:
+    def __init__(self, db, script, num_cores=4, cpu_time=0, memory=0, wall_time=0, cwd=None):
+        '''
+        cwd: the directory the jobs are run from, the current one if None
+        '''
+        self.db = db
+        self.script = script
+        self.cwd = cwd
+        self.num_cores = num_cores
+        self.cpu_time = cpu_time
+        self.memory = memory
+        self.wall_time = wall_time
+
+        # pid -> (file, cost, start time)
+        self.running = {}
+        self.num_done = 0
+        self.cost_done = 0
+        self.start_time = None
+
+    def start(self, filename, cost):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.setpgid(0, 0)
+                if self.cwd is not None:
+                    os.chdir(self.cwd)
+                set_limits(self.cpu_time, self.memory)
+                os.execvp('sh', ['sh', self.script, filename])
+            finally:
+                os._exit(127)
+        try:
+            os.setpgid(pid, pid)
+        except OSError:
+            pass    # already set by the child, or the child has exec'ed
+        self.running[pid] = (filename, cost, time.time())
+        self.db.set_status(self.script, filename, 'running')
+
+    def kill_overdue(self):
+        if self.wall_time <= 0:
+            return
+        now = time.time()
+        for pid, (filename, cost, start) in self.running.items():
+            if now - start > self.wall_time:
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def reap(self, block):
+        '''
+        return whether a job finished
+        '''
+        pid, status, usage = os.wait4(-1, 0 if block else os.WNOHANG)
+        if pid == 0 or pid not in self.running:
+            return False
+        filename, cost, start = self.running.pop(pid)
+        wall = time.time() - start
+        # the processes left in the group of the job, e.g. the solver of a script killed by the cpu limit
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        cpu = usage.ru_utime + usage.ru_stime
+        rss = usage.ru_maxrss    # KB
+
+        if os.WIFSIGNALED(status):
+            exit_code = -os.WTERMSIG(status)
+        else:
+            exit_code = os.WEXITSTATUS(status)
+        # the solver killed by a limit may not fail the script
+        # the cpu time of rusage may be a tick short of the limit
+        if (self.cpu_time > 0 and cpu >= self.cpu_time - 0.1) or (self.wall_time > 0 and wall > self.wall_time):
+            job_status = 'timeout'
+        elif exit_code != 0:
+            job_status = 'failed'
+        else:
+            job_status = 'done'
+        self.db.finish(self.script, filename, job_status, exit_code, cpu, rss, wall)
+
+        self.num_done += 1
+        self.cost_done += cost
+        self.print_progress(filename, job_status, cpu, rss, wall)
+        return True
+
+    def print_progress(self, filename, job_status, cpu, rss, wall):
+        elapsed = time.time() - self.start_time
+        left = self.cost_total - self.cost_done
+        eta = elapsed * left / self.cost_done if self.cost_done > 0 else 0
+        print('[%d/%d] %s %s: cpu = %.2f s, rss = %.1f MB, wall = %.2f s, elapsed = %.0f s, eta = %.0f s'
+              % (self.num_done, self.num_total, job_status, filename, cpu, rss / 1024, wall, elapsed, eta))
+        sys.stdout.flush()
+
+    def run(self, jobs):
+        '''
+        jobs: list of (file, predicted cost) in the order to start
+        '''
+        self.num_total = len(jobs)
+        self.cost_total = sum([cost for (f, cost) in jobs])
+        self.start_time = time.time()
+        queue = list(jobs)
+        # stopped as by ctrl-c, the jobs do not outlive the scheduler in their process groups
+        for sig in [signal.SIGTERM, signal.SIGHUP]:
+            signal.signal(sig, signal.default_int_handler)
+        try:
+            while len(queue) > 0 or len(self.running) > 0:
+                while len(queue) > 0 and len(self.running) < self.num_cores:
+                    filename, cost = queue.pop(0)
+                    self.start(filename, cost)
+                if self.wall_time > 0:
+                    if not self.reap(block=False):
+                        self.kill_overdue()
+                        time.sleep(0.2)
+                else:
+                    self.reap(block=True)
+        except KeyboardInterrupt:
+            # the jobs running are pending again at the next run
+            for pid in self.running:
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            raise
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('script', type=str)
+    parser.add_argument('dir_name', type=str)
+    parser.add_argument('ext', type=str, help='The extension of the files to run on, e.g. .ssat')
+    parser.add_argument('num_cores', type=int, nargs='?', default=4)
+    parser.add_argument('--db', type=str, default='',
+                        help='The job database, <dir_name>/run_all.db by default')
+    parser.add_argument('--order', type=str, default='size', choices=['size', 'cost'],
+                        help='Largest first by the file size or by the cost predicted from the jobs finished')
+    parser.add_argument('--cpu_time', type=int, default=0, help='CPU time limit of a job in seconds')
+    parser.add_argument('--memory', type=int, default=0, help='Address space limit of a job in MB')
+    parser.add_argument('--wall_time', type=int, default=0, help='Wall time limit of a job in seconds')
+    parser.add_argument('--retry', type=str, default=[], nargs='*', choices=['failed', 'timeout', 'done'],
+                        help='Run again the jobs of these status')
+    args = parser.parse_args()
 
     # files
-    p = os.path.join(dir_name, '**', want)
+    p = os.path.join(args.dir_name, '**', '*' + args.ext)
     filenames = glob.glob(p, recursive=True)
-    args = [(script, file) for file in filenames]
 
-    print('Use', num_cores, 'cores')
-    pool = mp.Pool(num_cores)
-    pool.starmap(run, args)
-    # pool.starmap_async(run, args)
+    db = JobDB(args.db or os.path.join(args.dir_name, 'run_all.db'))
+    db.add(args.script, filenames)
+    for status in args.retry:
+        db.retry(args.script, status)
+    jobs = order_jobs(db, db.pending(args.script, filenames), args.order)
+
+    print('Use', args.num_cores, 'cores')
+    print('Jobs = %d, pending = %d' % (len(filenames), len(jobs)))
+    scheduler = Scheduler(db, args.script, args.num_cores, args.cpu_time, args.memory, args.wall_time)
+    try:
+        scheduler.run(jobs)
+    except KeyboardInterrupt:
+        print('Interrupted, the jobs not finished are run again by the next run')
+    print('Summary =', db.summary(args.script))
+
+
+if __name__ == "__main__":
+    main()
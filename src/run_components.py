@@ -0,0 +1,100 @@
+import sys
+import os
+import argparse
+
+from run_all import JobDB, Scheduler, order_jobs
+from components import read_manifest, combine
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'log_parser'))
+from parselog import parse_ssat_log, parse_ssatabc_log, parse_claussat_log
+
+'''
+Solve the components of a formula split by encode.py --split_components
+concurrently and combine the results by the manifest (components.py)
+
+    python3 src/run_components.py -m bn.components.json -s ssat.sh -x .ssat -j 4
+
+The script is run by the scheduler of run_all.py from the directory of the
+script (its ./bin and ./timeout), the largest component first and with the
+same limits. The probability of each component is read from the log of
+the solver.
+'''
+
+# script -> suffix of the log written by the script
+LOG_SUFFIX = {
+    'ssat.sh': '.ssat-heu.log',
+    'erssat.sh': '.sdimacs.log',
+    'claussat.sh': '.claussat.log',
+}
+
+
+def parse_result(script, filename):
+    '''
+    return (probability, runtime) from the log of the script on filename, None if not solved
+    '''
+    name = os.path.basename(script)
+    if name not in LOG_SUFFIX:
+        raise ValueError('Unknown solver script', script)
+    logfile = filename + LOG_SUFFIX[name]
+    if not os.path.isfile(logfile):
+        return None, None
+
+    if name == 'ssat.sh':
+        runtime, memory, prob = parse_ssat_log(logfile)
+    elif name == 'erssat.sh':
+        runtime, memory, prob = parse_ssatabc_log(logfile)
+    else:
+        runtime, memory, ub, lb = parse_claussat_log(logfile)
+        prob = lb if ub == lb else None
+    return prob, runtime
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m', '--manifest', type=str, required=True)
+    parser.add_argument('-s', '--script', type=str, required=True,
+                        help='The solver script, one of %s' % ', '.join(LOG_SUFFIX))
+    parser.add_argument('-x', '--ext', type=str, default='.ssat',
+                        help='The formula of each component given to the script')
+    parser.add_argument('-j', '--jobs', type=int, default=4,
+                        help='Number of components solved at a time')
+    parser.add_argument('--cpu_time', type=int, default=0, help='CPU time limit of a component in seconds')
+    parser.add_argument('--memory', type=int, default=0, help='Address space limit of a component in MB')
+    args = parser.parse_args()
+
+    manifest = read_manifest(args.manifest)
+    dirname = os.path.dirname(os.path.abspath(args.manifest))
+    script = os.path.abspath(args.script)
+
+    files = []
+    for c in manifest['components']:
+        names = [f for f in c['files'] if os.path.splitext(f)[1] == args.ext]
+        if len(names) == 0:
+            raise ValueError('No %s file of a component' % args.ext, c['files'])
+        files.append((os.path.join(dirname, names[0]), c['files'][names[0]]))
+
+    print('Solve', len(files), 'components with', args.jobs, 'cores')
+    # the components of a manifest are solved again each time
+    db = JobDB(':memory:')
+    db.add(script, [f for (f, e) in files])
+    jobs = order_jobs(db, db.pending(script, [f for (f, e) in files]))
+    Scheduler(db, script, args.jobs, args.cpu_time, args.memory, cwd=os.path.dirname(script)).run(jobs)
+
+    results = []
+    runtimes = []
+    for k, (f, e) in enumerate(files):
+        prob, runtime = parse_result(args.script, f)
+        print('Component %d: prob = %r, scale = 2^%d, time = %s' % (k, prob, e, runtime))
+        results.append((prob, e))
+        runtimes.append(runtime)
+
+    value, log_value = combine(manifest, results)
+    times = [t for t in runtimes if isinstance(t, float)]
+    print('Max component time =', max(times) if len(times) == len(runtimes) and len(times) > 0 else None)
+    print('Factor =', manifest['factor'])
+    print('Value =', value)
+    print('Log10 value =', log_value)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,13 @@
-import os
 import sys
-import datetime
+
+from preprocess import Preprocessor
+
+'''
+Simplify an .ssat file by preprocess.py, written to <name>-min.ssat
+
+The vars left are renumbered in the order of the prefix, the value of the
+formula is the value of the new formula times the printed Scale.
+'''
 
 
 def main(argv):
@@ -9,34 +16,33 @@ def main(argv):
 
     print('Read %s' % ssat_file)
     num_vars, num_cls, var_str, cls_str = read_ssat(ssat_file)
+    prefix = read_prefix(var_str)
+    clauses = [[int(v) for v in line.split()[:-1]] for line in cls_str if len(line.split()) > 0]
 
-    stamp = str(os.getpid()) + '-' + str(datetime.datetime.now().timestamp())
-    tmp_file = 'tmp-%s.cnf' % stamp
-    tmp_out = 'tmp-%s-min.cnf' % stamp
-    tmp_varmap = 'tmp-%s-min.varmap' % stamp
-
-    # for negation of decision variables in SDP problem
-    # cls_str = add_negation(cls_str)
-
-    write_cnf(tmp_file, num_vars, num_cls, cls_str)
+    pre = Preprocessor(clauses, prefix)
+    stats = pre.run()
+    print('Preprocessed: units = %d, subsumed = %d, strengthened = %d, equivalent = %d, eliminated = %d'
+          % tuple([stats[k] for k in ['units', 'subsumed', 'strengthened', 'equivalent', 'eliminated']]))
 
-    cmd = './SatELite_v1.0_linux %s %s %s -' % (tmp_file, tmp_out, tmp_varmap)
-    os.system(cmd)
+    if pre.unsat:
+        print('UNSATISFIABLE')
+        write_ssat(new_ssat_file, 1, 1, ['1 x1 R 0\n'], ['1 0\n'])
+        return
 
-    if os.path.isfile(tmp_out):
-        new_num_vars, new_num_cls, new_cls_str = read_cnf(tmp_out)
-        origin_num_vars, assignments, var_map = read_varmap(tmp_varmap)
-
-        scale = cal_scale(var_str, assignments)
-        print('Scale = ', scale)
-
-        new_var_str = replace_ssat_vars(var_str, var_map)
+    var_map = {}
+    for (q, v, p) in prefix:
+        if v not in pre.removed and v not in var_map:
+            var_map[v] = len(var_map) + 1
+    new_cls = pre.result()
+    new_cls_str = [' '.join(['%d' % (var_map[v] if v > 0 else -var_map[-v]) for v in cl]) + ' 0\n'
+                   for cl in new_cls]
 
-        write_ssat(new_ssat_file, new_num_vars, new_num_cls, new_var_str, new_cls_str)
-    else:
-        write_ssat(new_ssat_file, 1, 1, '1 x1 R 0\n', '1 0\n')
+    num_lits = sum([len(cl) for cl in new_cls])
+    print('Result  :   #vars: %d   #clauses: %d   #literals: %d' % (len(var_map), len(new_cls), num_lits))
+    print('Scale = ', pre.scale)
 
-    os.system('rm %s %s %s' % (tmp_file, tmp_out, tmp_varmap))
+    new_var_str = replace_ssat_vars(var_str, var_map)
+    write_ssat(new_ssat_file, len(var_map), len(new_cls), new_var_str, new_cls_str)
 
 
 def read_ssat(filename):
@@ -53,6 +59,18 @@ def read_ssat(filename):
     return num_vars, num_cls, var_str, cls_str
 
 
+def read_prefix(var_str):
+    '''
+    return list of (quantifier 'e', 'r' or 't', var id, probability or threshold, None for 'e')
+    '''
+    prefix = []
+    for line in var_str:
+        pars = line.strip().split()
+        p = float(pars[3]) if len(pars) > 3 else None
+        prefix.append((pars[2].lower(), abs(int(pars[0])), p))
+    return prefix
+
+
 def write_ssat(filename, num_vars, num_cls, var_str, cls_str):
     f = open(filename, 'w')
     f.write('%d\n' % num_vars)
@@ -66,90 +84,24 @@ def write_ssat(filename, num_vars, num_cls, var_str, cls_str):
     f.close()
 
 
-def write_cnf(filename, num_vars, num_cls, cls_str):
-    f = open(filename, 'w')
-    f.write('p cnf %d %d\n' % (num_vars, num_cls))
-    for cl in cls_str:
-        f.write(cl)
-    f.close()
-
-
-def read_cnf(filename):
-    f = open(filename)
-    lines = f.readlines()
-    f.close()
-
-    num_vars = 0
-    num_cls = 0
-    cls_str = []
-    for i, line in enumerate(lines):
-        pars = line.strip().split()
-        if len(pars) == 0:
-            continue
-        elif pars[0] == 'c':
-            continue
-        elif pars[0] == 'p':
-            num_vars = int(pars[2])
-            num_cls = int(pars[3])
-            cls_str = lines[i+1:]
-            break
-
-    return num_vars, num_cls, cls_str
-
-
-def read_varmap(filename):
-    f = open(filename, 'r')
-    lines = f.readlines()
-    f.close()
-
-    origin_num_vars = int(lines[0].strip().split()[0])
-
-    pars = lines[1].strip().split()
-    assignments = [int(v) for v in pars[:-1]]
-
-    pars = lines[2].strip().split()
-    var_map = {}
-    for i, v in enumerate(pars[:-1]):
-        var_map[v] = str(i+1)
-
-    return origin_num_vars, assignments, var_map
-
-
 def replace_ssat_vars(var_str, var_map):
     new_var_str = []
     for line in var_str:
         pars = line.strip().split()
-        id = pars[0]
-        new_var = var_map.get(id)
+        id = int(pars[0])
+        new_var = var_map.get(abs(id))
         if new_var is None:
             continue
+        if id < 0:
+            new_var = -new_var
 
-        new_line = '%s x%s ' % (new_var, new_var)
-        new_line += pars[2] + ' ' + pars[3] + '\n'
+        new_line = '%d x%d ' % (new_var, new_var)
+        new_line += ' '.join(pars[2:]) + '\n'
         new_var_str.append(new_line)
 
     return new_var_str
 
 
-def cal_scale(var_str, assignments):
-    prob_map = {}
-    for line in var_str:
-        pars = line.strip().split()
-        if pars[2] == 'R':
-            prob_map[int(pars[0])] = float(pars[3])
-
-    scale = 1
-    for v in assignments:
-        p = prob_map.get(abs(v))
-        if p is not None:
-            if v > 0:
-                scale *= p
-            else:
-                scale *= (1-p)
-
-    return scale
-
-
 def add_negation(cls_str):
     cl = [int(v) for v in cls_str[-1].strip().split()]
     new_cl_str = ''
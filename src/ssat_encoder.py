@@ -1,13 +1,56 @@
 import itertools
 import math
 import os
-import datetime
-
+import hashlib
+import sys
+import io
+import time
+import contextlib
+import multiprocessing
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+
+import numpy as np
 from quine_mccluskey.qm import QuineMcCluskey
 
+from cube import Cube, pattern2cube, cube2pattern, assign2cube, cube2clause
+from logic_min import espresso, espresso_multi
+from aig import AIG
+from clause_sink import new_clause_sink
+from disk_cache import cache_key, MemoCache
+from PGM import Network, Node
+from relevance import prune_relevance
+from evidence import condition_evidence
+
+
+def source_digest(modules):
+    '''
+    the sha1 of the source files of the modules
+    '''
+    h = hashlib.sha1()
+    for m in modules:
+        with open(m.__file__, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+# changes of the encoding invalidate the cached cpt blocks
+ENCODER_DIGEST = source_digest([sys.modules[__name__], sys.modules['cube'], sys.modules['logic_min'],
+                                sys.modules['aig']])
+
+# the semaphore bounding the external tools of all worker processes, see encode_cpt_parallel
+tool_slots = None
+
+
+def init_worker(slots):
+    global tool_slots
+    tool_slots = slots
+
 
 class SSATEncoder:
-    def __init__(self, net, encode, query, num_bit=20, log_state=False, prune=False, connected_component=False, opt='esp', share_val=False):
+    def __init__(self, net, encode, query, num_bit=20, log_state=False, prune=False, connected_component=False, opt='esp', share_val=False, clause_sink='memory', cpt_cache=None, jobs=1, min_memo=None, use_abc=False, relevance=False, condition_evid=False):
         '''
         net(Network): the Network object 
         encode(string): the encoding method 
@@ -15,14 +58,23 @@ class SSATEncoder:
         num_bit(int): number of bits to share the values
         log_state(bool): whether use log(state) to encode states
         prune(bool): whether apply network pruning
-        opt(str): use quine-mccluskey or espresso minimization
+        opt(str): use quine-mccluskey, in-process espresso (esp, esp_multi for all probs of a table at once) or espresso binary (esp_bin) minimization
         share_val(bool): whether share value across table
+        clause_sink(str): keep the clauses in memory or spill them to disk, see clause_sink.py
+        cpt_cache(DiskCache): the persistent cache of the clauses of the cpts
+        jobs(int): number of processes encoding the cpts and of the concurrent external tools
+        min_memo(MemoCache): the memo of the minimized cubes, see memo_simplify
+        use_abc(bool): use the abc binary for bit_aig instead of the in-process AIG
+        relevance(bool): prune the network by the relevance rules of the query (relevance.py) instead of prune
+        condition_evid(bool): instantiate the evidence in the cpts before encoding (evidence.py)
         '''
 
         # network to encode
         self.net = net
         self.causal = net.causal
         self.prune = prune if query in ['PE', 'SDP', 'MEU'] else False
+        self.relevance = relevance
+        self.condition_evid = condition_evid
         self.cc = connected_component
 
         self.encode = encode
@@ -79,7 +131,8 @@ class SSATEncoder:
 
         # the clauses encoding each node
         self.node_id2clauses = {}
-        self.clauses = []
+        self.clause_sink = clause_sink
+        self.clauses = new_clause_sink(clause_sink)
 
         # scale of variables
         self.scale = 1
@@ -98,6 +151,21 @@ class SSATEncoder:
         # for causal graph
         self.node_id2edge_var = {}  # the variable controlling nodes' edge to parents
 
+        # the ranges of the vars created for each node (states, cpt, utility), see renumber.py
+        self.node_id2var_range = {}
+
+        # the clauses of the cpts to be relocated, see encode_cpt_block
+        self.cpt_blocks = None      # dict in memory (batch_encoder.py)
+        self.cpt_cache = cpt_cache  # DiskCache, see disk_cache.py
+        self.jobs = jobs
+        self.min_memo = min_memo
+
+        self.use_abc = use_abc
+        # the files of the external tools, see scratch_file
+        self.scratch = None
+        # tool -> (number of runs, seconds)
+        self.tool_time = {}
+
     # reset all vars and clauses
 
     def reset(self):
@@ -124,7 +192,7 @@ class SSATEncoder:
         # utiliy nodes
         self.util_vars = []
 
-        self.clauses = []
+        self.clauses = new_clause_sink(self.clause_sink)
 
         # meu calculation
         self.scale = 1
@@ -137,11 +205,33 @@ class SSATEncoder:
         # for causal graph
         self.node_id2edge_var = {}  # the variable controlling nodes' edge to parents
 
+        self.node_id2var_range = {}
+
     # network to SSAT
 
     def tossat(self):
+        self.prepare_net()
+        self.encode_nodes()
+        self.encode_query()
+        self.print_summary()
+
+        # self.net.minfill()
+        # for n in self.net.nodes:
+        #     if n.depend:
+        #         print(n.id, [c.id for c in n.parents if c.depend], self.node_id2state_vars[n.id])
+        self.net.nodes = self.net.nodes[::-1]
+
+    def prepare_net(self):
+        '''
+        prune and sort the network before encoding
+        '''
         print('Total number of nodes = ', self.net.num_nodes)
-        if self.prune:
+        if self.relevance:
+            for rule, (num, entries) in prune_relevance(self.net).items():
+                print('Relevance %s: removed = %d, entries = %d' % (rule, num, entries))
+            print('Relevant number of nodes = ', self.net.count_depend())
+            self.net.nodes = [n for n in self.net.nodes if n.depend]
+        elif self.prune:
             self.net.mark_redundent()
             print('Pruned number of nodes = ', self.net.count_depend())
             if self.query == 'SDP':
@@ -160,10 +250,13 @@ class SSATEncoder:
             print('Number of connected components = ', num_components)
             self.net.collect_cared_nodes()
 
-        # threshold variable for SDP
-        if self.query == 'SDP':
-            self.var_id += 1
-            self.thr_var = self.var_id
+        # after pruning, the evidence dropped is not conditioned on
+        if self.condition_evid and self.net.kind == 'BN' and not self.causal:
+            # the probabilities of all05 are all 0.5
+            stats = condition_evidence(self.net, constant=(self.encode != 'all05'))
+            print('Evidence conditioned: edges = %d, collapsed = %d, constant = %d, entries = %d, factor = %r'
+                  % (stats + (self.net.evid_factor,)))
+            self.net.nodes = [n for n in self.net.nodes if n.depend]
 
         if self.net.kind == 'ID':
             if self.super_util:
@@ -172,11 +265,21 @@ class SSATEncoder:
                 self.u_scale, self.u_shift = self.net.normalize_util()
             self.net.assign_dec_level()
 
+    def encode_nodes(self):
+        '''
+        the clauses independent of the evidence and the query
+        '''
+        # threshold variable for SDP
+        if self.query == 'SDP':
+            self.var_id += 1
+            self.thr_var = self.var_id
+
         # encode states first
         for n in self.net.nodes:
             if not n.depend:
                 continue
 
+            start = self.var_id
             if n.kind == 'chance':
                 # edge variable
                 if self.causal:
@@ -190,42 +293,56 @@ class SSATEncoder:
                 continue
             else:
                 raise ValueError('Wrong kind of node', n.kind)
+            self.add_var_range(n.id, start)
 
         if self.net.kind == 'ID' and not self.super_util:
             self.encode_util_mutual()
 
+        # the pools shared across tables are not relocatable
+        if self.jobs > 1 and not self.share_val:
+            if self.cpt_blocks is None:
+                self.cpt_blocks = {}
+            self.encode_cpt_parallel([n for n in self.net.nodes if n.depend and n.kind == 'chance'])
+
         # encode probabilities
         for n in self.net.nodes:
             if not n.depend:
                 continue
 
+            start = self.var_id
             if n.kind == 'chance':
-                self.encode_cpt(n)
+                if (self.cpt_blocks is not None or self.cpt_cache is not None) and not self.share_val:
+                    self.encode_cpt_block(n)
+                else:
+                    self.encode_cpt(n)
             elif n.kind == 'decision':
                 self.encode_observe(n)
             else:
                 raise ValueError('Wrong kind of node', n.kind)
+            self.add_var_range(n.id, start)
 
         if self.net.kind == 'ID':
             for n in self.net.utils:
+                start = self.var_id
                 if self.super_util:
                     self.encode_super_util(n)
                 else:
                     self.encode_util_val(n)
+                self.add_var_range(n.id, start)
+
+    def add_var_range(self, node_id, start):
+        '''
+        the vars from start + 1 to self.var_id are created for the node
+        '''
+        if self.var_id > start:
+            self.node_id2var_range.setdefault(node_id, []).append(range(start + 1, self.var_id + 1))
 
+    def encode_query(self):
         self.encode_evid()
 
         if self.query == 'SDP':
             self.encode_sdp()
 
-        self.print_summary()
-
-        # self.net.minfill()
-        # for n in self.net.nodes:
-        #     if n.depend:
-        #         print(n.id, [c.id for c in n.parents if c.depend], self.node_id2state_vars[n.id])
-        self.net.nodes = self.net.nodes[::-1]
-
     def print_summary(self):
         print('-------Summary-------')
         print('Decision level:', self.net.max_dec_level)
@@ -237,6 +354,11 @@ class SSATEncoder:
         if len(self.pool_num) > 0:
             print('Max number of prob = ', max(self.pool_num))
         print('Number of bit-shared cpt = ', self.num_shared_cpt)
+        if self.min_memo is not None:
+            memo = self.min_memo
+            total = max(memo.hits + memo.disk_hits + memo.misses, 1)
+            print('Minimization memo hits = %d (%.1f%%), disk hits = %d (%.1f%%), misses = %d'
+                  % (memo.hits, 100 * memo.hits / total, memo.disk_hits, 100 * memo.disk_hits / total, memo.misses))
         print('---------------------')
 
     def encode_chance_node(self, n):
@@ -293,6 +415,12 @@ class SSATEncoder:
                     self.clauses.append([v])
             evid_id.append(node_id)
 
+        # the evidence folded into a constant, a new list as rand_vars may be shared (batch_encoder.py)
+        if self.net.evid_factor != 1:
+            self.var_id += 1
+            self.rand_vars = self.rand_vars + [(self.var_id, self.net.evid_factor)]
+            self.clauses.append([self.var_id])
+
         # enable/disable the edge
         if self.causal:
             for n in self.net.nodes:
@@ -437,6 +565,168 @@ class SSATEncoder:
                 else:
                     raise ValueError('Unknown encode method:', self.encode)
 
+    def family_vars(self, n):
+        '''
+        the state vars of the parents and the node
+        '''
+        vars = []
+        for m in n.parents + [n]:
+            vars += [v for v in self.node_id2state_vars[m.id] if v > 0]
+        return vars
+
+    def cpt_block_key(self, n, rank):
+        '''
+        the cpt, the numbers of states of the family, the order of their vars
+        and the settings deciding the clauses of encode_cpt
+        '''
+        settings = (ENCODER_DIGEST, self.encode, self.opt, self.num_bit, self.log_state, self.digit,
+                    self.min_val, self.thr_cpt_size, self.thr_shared_num, self.encode_state_order,
+                    self.min_memo is not None, self.use_abc)
+        num_states = [m.num_states for m in n.parents + [n]]
+        cpt = np.asarray(n.cpt, dtype=np.float64)
+        return cache_key(settings, num_states, cpt.shape, rank, cpt.tobytes())
+
+    def encode_cpt_block(self, n):
+        '''
+        encode_cpt through the blocks of clauses in self.cpt_blocks (memory) and self.cpt_cache (disk)
+        the clauses of a cpt refer to the state vars of its family and the vars it introduces,
+        a block keeps them numbered from 1 in the order of the vars,
+        a cpt encoded before (in any encoder) is relocated to the current vars instead of encoded again
+        '''
+        fam_vars = self.family_vars(n)
+        rank = sorted(range(len(fam_vars)), key=fam_vars.__getitem__)
+        key = self.cpt_block_key(n, rank)
+
+        block = None
+        if self.cpt_blocks is not None:
+            block = self.cpt_blocks.get(key)
+        if block is None and self.cpt_cache is not None:
+            block = self.cpt_cache.get(key)
+            if block is not None and self.cpt_blocks is not None:
+                self.cpt_blocks[key] = block
+        if block is not None:
+            self.relocate_cpt_block(block, fam_vars)
+            return
+
+        # encode into a separate sink, the messages are replayed with the block
+        clauses, self.clauses = self.clauses, new_clause_sink('memory')
+        var_id, scale = self.var_id, self.scale
+        num_rand, num_intro, num_pool = len(self.rand_vars), len(self.intro_vars), len(self.pool_num)
+        num_shared = self.num_shared_cpt
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            self.encode_cpt(n)
+        print(log.getvalue(), end='')
+        sink, self.clauses = self.clauses, clauses
+        self.clauses.append_block(sink.lits, len(sink))
+
+        # not relocatable: refers to other vars (edge vars) or scale is not a product
+        old_vars = np.concatenate([np.sort(fam_vars), np.arange(var_id + 1, self.var_id + 1)]).astype(np.int64)
+        lits = np.asarray(sink.lits, dtype=np.int64)
+        if not np.isin(np.abs(lits[lits != 0]), old_vars).all():
+            return
+        if self.scale % scale != 0:
+            return
+
+        def localize(ids):
+            ids = np.asarray(ids, dtype=np.int64)
+            return np.sign(ids) * (np.searchsorted(old_vars, np.abs(ids)) + 1)
+
+        block = {
+            'num_fam_vars': len(fam_vars),
+            'num_vars': len(old_vars),
+            'lits': localize(lits).astype(np.int32),     # 0 stays 0
+            'num_clauses': len(sink),
+            'rand_vars': [(int(v), p) for v, (id, p) in
+                          zip(localize([id for (id, p) in self.rand_vars[num_rand:]]), self.rand_vars[num_rand:])],
+            'intro_vars': localize(self.intro_vars[num_intro:]).tolist(),
+            'pool_num': self.pool_num[num_pool:],
+            'scale': self.scale // scale,
+            'num_shared': self.num_shared_cpt - num_shared,
+            'log': log.getvalue(),
+        }
+        if self.cpt_blocks is not None:
+            self.cpt_blocks[key] = block
+        if self.cpt_cache is not None:
+            self.cpt_cache.put(key, block)
+
+    def relocate_cpt_block(self, block, fam_vars):
+        num_new_vars = block['num_vars'] - block['num_fam_vars']
+        # local var i -> new_vars[i]
+        new_vars = np.concatenate([[0], np.sort(fam_vars),
+                                   np.arange(self.var_id + 1, self.var_id + 1 + num_new_vars)]).astype(np.int64)
+        self.var_id += num_new_vars
+
+        def relocate(ids):
+            ids = np.asarray(ids, dtype=np.int64)
+            return np.sign(ids) * new_vars[np.abs(ids)]
+
+        lits = relocate(block['lits'])
+        self.clauses.append_block(array('i', lits.astype(np.int32).tobytes()), block['num_clauses'])
+        if len(block['rand_vars']) > 0:
+            ids = relocate([id for (id, p) in block['rand_vars']]).tolist()
+            self.rand_vars += [(id, p) for id, (local, p) in zip(ids, block['rand_vars'])]
+        if len(block['intro_vars']) > 0:
+            self.intro_vars += relocate(block['intro_vars']).tolist()
+        self.pool_num += block['pool_num']
+        self.scale *= block['scale']
+        self.num_shared_cpt += block['num_shared']
+        print(block['log'], end='')
+
+    def cpt_job(self, n):
+        '''
+        the family of n for encode_cpt_job, in the order of their vars
+        '''
+        members = n.parents + [n]
+        members.sort(key=lambda m: min([abs(v) for v in self.node_id2state_vars[m.id]], default=0))
+        settings = {'encode': self.encode, 'query': self.query, 'num_bit': self.num_bit,
+                    'log_state': self.log_state, 'opt': self.opt, 'jobs': self.jobs,
+                    'use_abc': self.use_abc}
+        if self.min_memo is not None:
+            # a memo of the worker in front of the same disk store
+            settings['min_memo'] = MemoCache(self.min_memo.max_len, self.min_memo.disk)
+        members = [(m.id, m.kind, m.num_states, m.states, m.id in self.node_id2dec_vars) for m in members]
+        return (settings, members, n.id, [p.id for p in n.parents], n.cpt)
+
+    def encode_cpt_parallel(self, nodes):
+        '''
+        encode the cpts of nodes not in the caches in self.jobs worker processes,
+        the blocks are put into self.cpt_blocks and relocated by encode_cpt_block in order
+        '''
+        # the cpts refer to the edge vars
+        if self.causal:
+            return
+
+        jobs = {}
+        for n in nodes:
+            fam_vars = self.family_vars(n)
+            key = self.cpt_block_key(n, sorted(range(len(fam_vars)), key=fam_vars.__getitem__))
+            if key in self.cpt_blocks or key in jobs:
+                continue
+            if self.cpt_cache is not None:
+                block = self.cpt_cache.get(key)
+                if block is not None:
+                    self.cpt_blocks[key] = block
+                    continue
+            jobs[key] = self.cpt_job(n)
+        if len(jobs) == 0:
+            return
+
+        # the largest cpts first, forked to keep the hash seed of qm
+        keys = sorted(jobs, key=lambda k: -cpt_size(jobs[k][-1]))
+        methods = multiprocessing.get_all_start_methods()
+        ctx = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        with ctx.Pool(min(self.jobs, len(keys)), init_worker, (ctx.BoundedSemaphore(self.jobs),)) as pool:
+            results = pool.map(encode_cpt_job, [jobs[k] for k in keys], chunksize=1)
+        for key, (block, tool_time) in zip(keys, results):
+            for tool, (runs, total) in tool_time.items():
+                self.tool_time[tool] = tuple(map(sum, zip(self.tool_time.get(tool, (0, 0)), (runs, total))))
+            if block is None:
+                continue
+            self.cpt_blocks[key] = block
+            if self.cpt_cache is not None:
+                self.cpt_cache.put(key, block)
+
     def encode_cpt_clear(self, n, method='bklm16'):
         '''
         method: bklm16, bit_share
@@ -444,16 +734,17 @@ class SSATEncoder:
         merge_list = self.cpt2merge_list(n)
         parent_vars, node_vars = self.get_combination_vars(n)
         vars = parent_vars + node_vars
+        self.check_merge_list(merge_list, vars)
         sel_var = None
         if method == 'bit_share':
             # import pdb
             # pdb.set_trace()
             merge_list, onset_merge_list, offset_merge_list = self.bit_share_merge_list(merge_list)
-            onset_merge_list = self.simplify_merge_list(onset_merge_list)
-            offset_merge_list = self.simplify_merge_list(offset_merge_list)
+            onset_merge_list = self.simplify_merge_list(onset_merge_list, len(vars))
+            offset_merge_list = self.simplify_merge_list(offset_merge_list, len(vars))
             self.encode_bit_merge_list(
                 n, onset_merge_list, offset_merge_list, vars, imply_rand=True)
-        merge_list = self.simplify_merge_list(merge_list)
+        merge_list = self.simplify_merge_list(merge_list, len(vars), dc=self.cpt_dc(n))
         var_pool = self.encode_merge_list(n, merge_list, vars, sel_var=sel_var)
 
         if self.share_val:
@@ -470,12 +761,14 @@ class SSATEncoder:
         vars = parent_vars + node_vars
 
         new_merge_list = {}
+        dc = self.cpt_dc(n)
         for merge_list in merge_lists:
-            res = self.simplify_merge_list(merge_list)
+            self.check_merge_list(merge_list, vars)
+            res = self.simplify_merge_list(merge_list, len(vars), dc=dc)
             for prob, pats in res.items():
                 new_pats = new_merge_list.get(round(prob, self.digit))
                 if new_pats is None:
-                    new_merge_list[round(prob, self.digit)] = pats
+                    new_merge_list[round(prob, self.digit)] = list(pats)
                 else:
                     new_pats += pats
 
@@ -739,8 +1032,10 @@ class SSATEncoder:
             return
 
         if rep == 'sop':
-            # onset
+            # the outputs are minimized separately, together with the offset
+            cmds = []
             if single_po:
+                outputs = []
                 for i, b in enumerate(bit_vars):
                     out_id = num_bit - i
                     single_onset = []
@@ -750,65 +1045,154 @@ class SSATEncoder:
                     if len(single_onset) == 0:
                         continue
 
-                    self.write_pla(num_input, 1, single_onset,
-                                   'pla/on%d.pla' % (i))
-                    cmd = './espresso pla/on%d.pla > pla/out_on%d.pla' % (i, i)
-                    # cmd = 'cp pla/on%d.pla pla/out_on%d.pla' % (i, i)
-                    os.system(cmd)
-                    opt_onset = self.read_pla('pla/out_on%d.pla' % (i))
+                    self.write_pla(num_input, 1, single_onset, self.scratch_file('on%d.pla' % (i)))
+                    cmds.append('./espresso %s > %s' % (self.scratch_file('on%d.pla' % (i)),
+                                                        self.scratch_file('out_on%d.pla' % (i))))
+                    outputs.append(i)
+            else:
+                self.write_pla(num_input, num_bit, onset, self.scratch_file('on.pla'))
+                cmds.append('./espresso %s > %s' % (self.scratch_file('on.pla'), self.scratch_file('out_on.pla')))
+
+            self.write_pla(num_input+num_sel, 1, offset, self.scratch_file('off.pla'))
+            cmds.append('./espresso %s > %s' % (self.scratch_file('off.pla'), self.scratch_file('out_off.pla')))
+            self.run_tools(cmds)
+
+            # onset
+            if single_po:
+                for i in outputs:
+                    opt_onset = self.read_pla(self.scratch_file('out_on%d.pla' % (i)))
                     for pat in opt_onset:
                         self.pattern2onset_clause(pat, input_vars, [sel_combs[i]], [bit_vars[i]])
             else:
-                self.write_pla(num_input, num_bit, onset, 'pla/on.pla')
-                cmd = './espresso pla/on.pla > pla/out_on.pla'
-                os.system(cmd)
-                opt_onset = self.read_pla('pla/out_on.pla')
+                opt_onset = self.read_pla(self.scratch_file('out_on.pla'))
                 for pat in opt_onset:
                     self.pattern2onset_clause(pat, input_vars, sel_combs, bit_vars)
 
             # offset
-            self.write_pla(num_input+num_sel, 1, offset, 'pla/off.pla')
-            cmd = './espresso pla/off.pla > pla/out_off.pla'
-            os.system(cmd)
-            offset = self.read_pla('pla/out_off.pla')
+            offset = self.read_pla(self.scratch_file('out_off.pla'))
             for pat in offset:
                 self.pattern2offset_clause(pat, input_vars, sel_vars)
 
+        elif rep == 'aig' and not self.use_abc:
+            self.encode_aig(input_vars, sel_vars, sel_combs, bit_vars, p1_onset, onset, offset)
+
         elif rep == 'aig':
+            on_pla, on_dimacs, on_io = [self.scratch_file('on' + ext) for ext in ['.pla', '.dimacs', '.io']]
+            off_pla, off_dimacs, off_io = [self.scratch_file('off' + ext) for ext in ['.pla', '.dimacs', '.io']]
             # only prob = 1
             if len(onset) == 0 and len(p1_onset) > 0:
                 p1_onset = [(p + '0') for p in p1_onset]
-                self.write_pla(num_input, 1, p1_onset, 'pla/off.pla')
-                cmd = './abc -c \"read_pla -z pla/off.pla; st; ps; %s ps; aig2cnf pla/off.dimacs pla/off.io\"' % (
-                    opt_cmd)
-                os.system(cmd)
-                self.dimacs2offset_clause(input_vars, [], 'pla/off.dimacs',
-                                          'pla/off.io', reverse=True)
+                self.write_pla(num_input, 1, p1_onset, off_pla)
+                cmd = './abc -c \"read_pla -z %s; st; ps; %s ps; aig2cnf %s %s\"' % (
+                    off_pla, opt_cmd, off_dimacs, off_io)
+                self.run_tools([cmd])
+                self.dimacs2offset_clause(input_vars, [], off_dimacs,
+                                          off_io, reverse=True)
             # no prob = 1
             elif len(p1_onset) == 0:
-                self.write_pla(num_input, num_bit, onset, 'pla/on.pla')
-                cmd = './abc -c \"r pla/on.pla; st; ps; %s ps; aig2cnf pla/on.dimacs pla/on.io\"' % (
-                    opt_cmd)
-                os.system(cmd)
+                self.write_pla(num_input, num_bit, onset, on_pla)
+                cmd = './abc -c \"r %s; st; ps; %s ps; aig2cnf %s %s\"' % (
+                    on_pla, opt_cmd, on_dimacs, on_io)
+                self.run_tools([cmd])
                 self.dimacs2onset_clause(input_vars, sel_combs, bit_vars,
-                                         'pla/on.dimacs', 'pla/on.io', complement=True)
+                                         on_dimacs, on_io, complement=True)
             else:
-                # onset
-                self.write_pla(num_input, num_bit, onset, 'pla/on.pla')
-                cmd = './abc -c \"r pla/on.pla; st; ps; %s ps; aig2cnf pla/on.dimacs pla/on.io\"' % (
-                    opt_cmd)
-                os.system(cmd)
+                # onset and offset
+                self.write_pla(num_input, num_bit, onset, on_pla)
+                self.write_pla(num_input, num_bit, offset, off_pla)
+                cmds = ['./abc -c \"r %s; st; ps; %s ps; aig2cnf %s %s\"' % (pla, opt_cmd, dimacs, io_file)
+                        for (pla, dimacs, io_file) in [(on_pla, on_dimacs, on_io), (off_pla, off_dimacs, off_io)]]
+                self.run_tools(cmds)
                 self.dimacs2onset_clause(input_vars, sel_combs, bit_vars,
-                                         'pla/on.dimacs', 'pla/on.io')
-                # offset
-                self.write_pla(num_input, num_bit, offset, 'pla/off.pla')
-                cmd = './abc -c \"r pla/off.pla; st; ps; %s ps; aig2cnf pla/off.dimacs pla/off.io\"' % (
-                    opt_cmd)
-                os.system(cmd)
-                self.dimacs2offset_clause(input_vars, sel_combs, 'pla/off.dimacs', 'pla/off.io')
+                                         on_dimacs, on_io)
+                self.dimacs2offset_clause(input_vars, sel_combs, off_dimacs, off_io)
         else:
             raise ValueError('unknown representation', rep)
 
+    def encode_aig(self, input_vars, sel_vars, sel_combs, bit_vars, p1_onset, onset, offset):
+        '''
+        the clauses of bit_aig by the in-process AIG (aig.py) instead of abc, the same cases:
+        only prob = 1: one of the prob = 1 entries holds
+        no prob = 1: the output of each bit, its complement is the offset
+        otherwise: the outputs of the bits and the offset
+        '''
+        num_input = len(input_vars)
+        num_bit = len(bit_vars)
+        aig = AIG(num_input + len(sel_vars))
+
+        def new_var():
+            self.var_id += 1
+            self.intro_vars.append(self.var_id)
+            return self.var_id
+
+        def neg(l):
+            return (not l) if isinstance(l, bool) else -l
+
+        outputs = []
+        if len(onset) > 0:
+            for i in range(num_bit):
+                pats = [pat[:num_input] for pat in onset if pat[num_input+i] == '1']
+                outputs.append(aig.sop(pats))
+        if len(onset) == 0:
+            outputs.append(aig.sop(p1_onset))
+        elif len(p1_onset) > 0:
+            outputs.append(aig.sop([pat[:-1] for pat in offset]))
+        lits = aig.tseitin(outputs, input_vars + sel_vars, new_var, self.clauses)
+
+        cls = []
+        if len(onset) == 0:
+            cls.append([lits[0]])
+        else:
+            for i in range(num_bit):
+                cls.append([neg(lits[i])] + sel_combs[i] + [bit_vars[i]])
+                if len(p1_onset) == 0:
+                    cls.append([lits[i]] + sel_combs[i])
+            if len(p1_onset) > 0:
+                cls.append([neg(lits[-1])])
+
+        for cl in cls:
+            if True in [l is True for l in cl]:
+                continue
+            cl = [l for l in cl if l is not False]
+            if len(cl) == 0:
+                v = new_var()
+                cl = [v]
+                self.clauses.append([-v])
+            self.clauses.append(cl)
+
+    def scratch_file(self, name):
+        '''
+        the path of name in the private directory of the files of the external tools,
+        removed with the encoder
+        '''
+        if self.scratch is None:
+            self.scratch = tempfile.TemporaryDirectory(prefix='pla-')
+        return os.path.join(self.scratch.name, name)
+
+    def run_tools(self, cmds):
+        '''
+        run the independent commands of the external tools in at most self.jobs threads,
+        their outputs are written in order to sys.stdout, after the prints before them
+        and into the redirect of a worker (encode_cpt_job)
+        '''
+        def run(cmd):
+            with tool_slots or contextlib.nullcontext():
+                start = time.time()
+                res = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE)
+                return res.stdout, time.time() - start
+
+        if self.jobs > 1 and len(cmds) > 1:
+            with ThreadPoolExecutor(min(self.jobs, len(cmds))) as pool:
+                results = list(pool.map(run, cmds))
+        else:
+            results = [run(cmd) for cmd in cmds]
+
+        for cmd, (out, t) in zip(cmds, results):
+            sys.stdout.write(out.decode(errors='replace'))
+            tool = os.path.basename(cmd.split()[0])
+            runs, total = self.tool_time.get(tool, (0, 0))
+            self.tool_time[tool] = (runs + 1, total + t)
+
     def cpt2minterm(self, n, num_bit, num_sel, sel_combs):
         '''
         pattern: alpha state bit
@@ -1880,7 +2264,6 @@ class SSATEncoder:
 
     def encode_util_val(self, n):
         merge_list = self.util2merge_list(n)
-        merge_list = self.simplify_merge_list(merge_list)
         vars = self.util_state_vars.copy()
         for r in n.parents:
             if not self.log_state:
@@ -1891,6 +2274,8 @@ class SSATEncoder:
                 for v in s[0]:
                     vars.append(abs(v))
 
+        self.check_merge_list(merge_list, vars)
+        merge_list = self.simplify_merge_list(merge_list, len(vars))
         self.encode_merge_list(n, merge_list, vars)
 
     def encode_super_util(self, n):
@@ -1951,57 +2336,53 @@ class SSATEncoder:
         return new_cl
 
     def merge_state_cls(self, clauses, dc_clauses=[]):
-        remain_clauses = clauses.copy() + dc_clauses.copy()
-        final_clauses = []
+        '''
+        merge the clauses differing in the phase of one literal until no
+        clause can be merged, return the clauses never merged (the primes)
 
+        clauses with the same vars are bucketed together and the partner of a
+        clause is found by flipping one literal and looking it up in a hash set
+        '''
         # assume all the clauses are sorted by vars
+        remain_clauses = [tuple(cl) for cl in clauses + dc_clauses]
+        dc_set = set([tuple(cl) for cl in dc_clauses])
+        final_clauses = []
+        final_set = set()
+
         while len(remain_clauses) > 0:
+            # duplicates merge with the same clauses as the first one
+            cl2id = {}
+            for cl in remain_clauses:
+                if cl not in cl2id:
+                    cl2id[cl] = len(cl2id)
+            remain_clauses = list(cl2id.keys())
+
             new_clauses = []
-            is_merged_id = []
+            new_set = set()
+            is_merged = [False] * len(remain_clauses)
             for i, cl1 in enumerate(remain_clauses):
-                for j in range(i+1, len(remain_clauses)):
-                    cl2 = remain_clauses[j]
-                    if len(cl1) != len(cl2):
+                # the clauses with one literal flipped, in the order of index
+                partners = []
+                for k, v in enumerate(cl1):
+                    j = cl2id.get(cl1[:k] + (-v,) + cl1[k+1:])
+                    if j is not None:
+                        partners.append((j, k))
+                        is_merged[i] = True
+                partners.sort()
+                for j, k in partners:
+                    if j < i:
                         continue
-
-                    # compare
-                    num_diff = 0
-                    can_merge = False
-                    merge_cl = []
-                    for k, v1 in enumerate(cl1):
-                        v2 = cl2[k]
-                        # have different literal
-                        if abs(v1) != abs(v2):
-                            can_merge = False
-                            break
-                        # if same phase
-                        elif v1 == v2:
-                            continue
-                        # not the same phase
-                        else:
-                            num_diff += 1
-                            # if >2 not the same, cannot merge
-                            if num_diff > 1:
-                                can_merge = False
-                                break
-
-                            can_merge = True
-                            merge_cl = cl1.copy()
-                            merge_cl.remove(v1)
-
-                    # the merged clause
-                    if can_merge:
-                        if i not in is_merged_id:
-                            is_merged_id.append(i)
-                        if j not in is_merged_id:
-                            is_merged_id.append(j)
+                    merge_cl = cl1[:k] + cl1[k+1:]
+                    if merge_cl not in new_set:
+                        new_set.add(merge_cl)
                         new_clauses.append(merge_cl)
             # cannot be merged anymore
             for i, cl in enumerate(remain_clauses):
-                if i in is_merged_id:
+                if is_merged[i]:
                     continue
-                if (remain_clauses[i] not in final_clauses) and (remain_clauses[i] not in dc_clauses):
-                    final_clauses.append(remain_clauses[i])
+                if (cl not in final_set) and (cl not in dc_set):
+                    final_set.add(cl)
+                    final_clauses.append(list(cl))
             # clauses for next iteration
             remain_clauses = new_clauses
         return final_clauses
@@ -2171,57 +2552,109 @@ class SSATEncoder:
     def cpt2merge_list(self, n, seperate_state=False):
         '''
         merge list = 
-        [
-            ([pat1], prob1),
-            ([pat2], prob2),
+        {
+            prob1: [cube1, ...],
+            prob2: [cube2, ...],
             ...
-        ]
+        }
 
-        pat = ['0000', '10-1', ...]
+        cube = Cube(care, value) over parent vars + node vars, see cube.py
 
         seperate_state: merge each state seperately (bklm16)
         '''
 
         assert self.log_state
 
+        cpt = np.asarray(n.cpt, dtype=float)
+        row_vals, num_var = self.cpt_row_values(n)
+
+        assert cpt.shape[0] == len(row_vals), (cpt.shape[0], len(row_vals))
+        assert cpt.shape[1] == n.num_states, (cpt.shape[1], n.num_states)
+
+        # the state part of the cubes
         state_cls = self.node_id2state_cls[n.id]
-        combs = self.cal_combination(n)
+        num_state_var = len(state_cls[0])
+        state_vals = [assign2cube(self.implication(s, False)).value for s in state_cls]
+        state_vals = np.array(state_vals, dtype=row_vals.dtype)
+        num_var += num_state_var
 
-        assert len(n.cpt) == len(combs), (len(n.cpt), len(combs))
-        assert len(n.cpt[0]) == n.num_states, (len(n.cpt[0]), n.num_states)
+        # pattern of each entry, entries in row-major order
+        vals = (row_vals[:, None] << num_state_var) | state_vals[None, :]
+        care = (1 << num_var) - 1
 
-        # to have variable sharing
         if not seperate_state:
-            merge_list = {}
+            return self.bucket_probs(cpt.ravel(), vals.ravel(), care)
         else:
-            merge_list = [{} for i in range(n.num_states)]
+            return [self.bucket_probs(cpt[:, i], vals[:, i], care) for i in range(n.num_states)]
 
-        # conditional probability
-        for j, comb in enumerate(combs):
-            p = 1
-            base_cl = [-v for v in comb]
-            # encode each value in a row
-            for i in range(n.num_states):
-                prob = n.cpt[j][i]
-                if prob == 1:
-                    continue
-                s = state_cls[i]
-                pat = self.assign2pattern(base_cl + self.implication(s, False))
-
-                # find variables with same/complement probability to share
-                if not seperate_state:
-                    pats = merge_list.get(round(prob, self.digit))
-                    if pats is None:
-                        merge_list[round(prob, self.digit)] = [pat]
-                    else:
-                        pats.append(pat)
-                else:
-                    pats = merge_list[i].get(round(prob, self.digit))
-                    if pats is None:
-                        merge_list[i][round(prob, self.digit)] = [pat]
-                    else:
-                        pats.append(pat)
+    def cpt_row_values(self, n):
+        '''
+        the value of the parent part of the cube of each cpt row,
+        the same order as cal_combination
+        return (values, number of parent vars)
+        '''
+        num_rows = 1
+        num_var = 0
+        for r in n.parents:
+            num_rows *= r.num_states
+            num_var += len(self.node_id2state_cls[r.id][0])
+
+        # python ints if the cubes do not fit in int64
+        dtype = np.int64
+        if num_var + len(self.node_id2state_cls[n.id][0]) >= 63:
+            dtype = object
+
+        vals = np.zeros(num_rows, dtype=dtype)
+        idx = np.arange(num_rows)
+        shift = 0
+        # the last parent changes the fastest
+        for r in reversed(n.parents):
+            state_cls = self.node_id2state_cls[r.id]
+            table = np.array([assign2cube([-v for v in cl]).value for cl in state_cls], dtype=dtype)
+            vals |= table[idx % r.num_states] << shift
+            idx //= r.num_states
+            shift += len(state_cls[0])
+
+        return vals, num_var
+
+    def bucket_probs(self, probs, vals, care):
+        '''
+        group the entries by the rounded prob, skip prob = 1
+        the keys and the cubes keep the order of the entries
+        '''
+        keep = np.flatnonzero(probs != 1)
+        if len(keep) == 0:
+            return {}
+        probs = probs[keep]
+        vals = vals[keep]
+
+        uniq, first, inverse = np.unique(probs, return_index=True, return_inverse=True)
+        # several values can be rounded to the same key
+        key2id = {}
+        key_first = []
+        key_id = np.empty(len(uniq), dtype=np.int64)
+        for u, p in enumerate(uniq.tolist()):
+            key = round(p, self.digit)
+            k = key2id.get(key)
+            if k is None:
+                k = len(key2id)
+                key2id[key] = k
+                key_first.append(first[u])
+            else:
+                key_first[k] = min(key_first[k], first[u])
+            key_id[u] = k
+        entry_key = key_id[inverse.ravel()]
+
+        # stable sort keeps the entry order inside each key
+        order = np.argsort(entry_key, kind='stable')
+        ends = np.cumsum(np.bincount(entry_key, minlength=len(key2id))).tolist()
+        starts = [0] + ends[:-1]
+        sorted_vals = vals[order].tolist()
 
+        keys = list(key2id.keys())
+        merge_list = {}
+        for k in sorted(range(len(keys)), key=lambda k: key_first[k]):
+            merge_list[keys[k]] = list(map(Cube._make, zip(itertools.repeat(care), sorted_vals[starts[k]:ends[k]])))
         return merge_list
 
     def util2merge_list(self, n):
@@ -2239,7 +2672,7 @@ class SSATEncoder:
             if prob == 1:
                 continue
 
-            pat = self.assign2pattern(state_cls + base_cl)
+            pat = assign2cube(state_cls + base_cl)
 
             # find variables with same probability to share
             pats = merge_list.get(round(prob, self.digit))
@@ -2250,55 +2683,111 @@ class SSATEncoder:
 
         return merge_list
 
-    def simplify_merge_list(self, merge_list):
+    def check_merge_list(self, merge_list, vars):
+        '''
+        the cubes are minterms over vars before simplification
+        '''
+        for pats in merge_list.values():
+            assert pats[0].care == (1 << len(vars)) - 1, (pats[0], len(vars))
+
+    def simplify_merge_list(self, merge_list, num_vars, dc=[]):
+        '''
+        num_vars: number of variables of the cubes
+        dc: the cubes not constrained by the table, used by esp_multi
+        '''
         if self.opt == 'none':
             return merge_list
 
+        if self.opt == 'esp_multi':
+            # one output per prob, the others are its offset
+            covers = self.memo_simplify(list(merge_list.values()), num_vars, dc)
+            return dict(zip(merge_list.keys(), covers))
+
         new_merge_list = {}
         for (prob, pats) in merge_list.items():
-            if self.opt == 'qm':
-                onset = self.qm_simplify(pats)
-            elif self.opt == 'esp':
-                onset = self.esp_simplify(pats)
-            new_merge_list[prob] = onset
+            new_merge_list[prob] = self.memo_simplify(pats, num_vars)
 
         return new_merge_list
 
-    def qm_simplify(self, patterns):
-        if len(patterns) == 0:
+    def memo_simplify(self, cubes, num_vars, dc=[]):
+        '''
+        simplify the cubes (the onsets for esp_multi) through self.min_memo,
+        the cubes are sorted to be the same key and the same result in any order,
+        a copy of the cached cover is returned so the callers may extend it
+        '''
+        if self.min_memo is None or (len(cubes) <= 1 and self.opt != 'esp_multi'):
+            return self.simplify(cubes, num_vars, dc)
+
+        if self.opt == 'esp_multi':
+            cubes = [sorted(on) for on in cubes]
+        else:
+            cubes = sorted(cubes)
+        key = cache_key(ENCODER_DIGEST, self.opt, num_vars, cubes, dc)
+        res = self.min_memo.get(key)
+        if res is None:
+            res = self.simplify(cubes, num_vars, dc)
+            self.min_memo.put(key, res)
+        if self.opt == 'esp_multi':
+            return [list(cover) for cover in res]
+        return list(res)
+
+    def simplify(self, cubes, num_vars, dc=[]):
+        if self.opt == 'qm':
+            return self.qm_simplify(cubes, num_vars)
+        elif self.opt == 'esp':
+            return self.esp_simplify(cubes, num_vars)
+        elif self.opt == 'esp_multi':
+            return espresso_multi(cubes, num_vars, dc)
+        elif self.opt == 'esp_bin':
+            return self.esp_bin_simplify(cubes, num_vars)
+
+    def cpt_dc(self, n):
+        '''
+        the cubes of the redundant state codes of the family of n (log_state),
+        excluded by the state clauses and free for any prob of the cpt
+        the layout of cpt2merge_list, n takes the lowest bits and the last parent the next
+        '''
+        if self.causal or self.share_val:
             return []
 
-        num_vars = len(patterns[0])
+        dc = []
+        shift = 0
+        for m in [n] + n.parents[::-1]:
+            state_cls = self.node_id2state_cls_full[m.id]
+            num_var = len(state_cls[0])
+            care = ((1 << num_var) - 1) << shift
+            for cl in state_cls[m.num_states:]:
+                dc.append(Cube(care, assign2cube([-v for v in cl]).value << shift))
+            shift += num_var
+        return dc
+
+    def qm_simplify(self, cubes, num_vars):
+        if len(cubes) == 0:
+            return []
 
-        nums = []
-        for pat in patterns:
-            nums.append(self.pat2num(pat))
+        # the cubes are minterms
+        nums = [c.value for c in cubes]
 
         res = QuineMcCluskey().simplify(nums, num_bits=num_vars)
-        return list(res)
-
-    def esp_simplify(self, patterns):
-        if len(patterns) == 0:
-            return []
+        return [pattern2cube(pat) for pat in res]
 
-        if len(patterns) == 1:
-            return patterns
+    def esp_simplify(self, cubes, num_vars):
+        if len(cubes) <= 1:
+            return cubes
 
-        num_input = len(patterns[0])
-        new_pats = [pat+'1' for pat in patterns]
+        return espresso(cubes, num_vars)
 
-        stamp = str(os.getpid()) + '-' + str(datetime.datetime.now().timestamp())
+    def esp_bin_simplify(self, cubes, num_vars):
+        if len(cubes) <= 1:
+            return cubes
 
-        self.write_pla(num_input, 1, new_pats, 'pat-%s.pla' % stamp)
-        cmd = './espresso pat-%s.pla > out_pat-%s.pla' % (stamp, stamp)
-        os.system(cmd)
-        opt_onset = self.read_pla('out_pat-%s.pla' % stamp)
-        os.system('rm pat-%s.pla out_pat-%s.pla' % (stamp, stamp))
-        patterns = [pat[:num_input] for pat in opt_onset]
-        return patterns
+        num_input = num_vars
+        new_pats = [cube2pattern(c, num_input)+'1' for c in cubes]
 
-    def pat2num(self, pat):
-        return int(pat, 2)
+        self.write_pla(num_input, 1, new_pats, self.scratch_file('pat.pla'))
+        self.run_tools(['./espresso %s > %s' % (self.scratch_file('pat.pla'), self.scratch_file('out_pat.pla'))])
+        opt_onset = self.read_pla(self.scratch_file('out_pat.pla'))
+        return [pattern2cube(pat[:num_input]) for pat in opt_onset]
 
     def encode_merge_list(self, n, merge_list, vars, sel_var=None, share_neg=False):
         base_cl = []
@@ -2312,13 +2801,13 @@ class SSATEncoder:
 
         var_pool = {}
         for prob, pats in merge_list.items():
-            assert len(vars) == len(pats[0])
+            assert (pats[0].care >> len(vars)) == 0
 
             if prob > 1 - self.min_val / 2:
                 continue
             elif prob < self.min_val / 2:
                 for pat in pats:
-                    alpha = self.pattern2clause(pat, vars)
+                    alpha = cube2clause(pat, vars)
                     self.clauses.append(base_cl+alpha)
                     if sel_var is not None:
                         self.clauses.append(base_cl+alpha+[sel_var])
@@ -2352,7 +2841,7 @@ class SSATEncoder:
                             va = id
 
                 for pat in pats:
-                    alpha = self.pattern2clause(pat, vars)
+                    alpha = cube2clause(pat, vars)
                     self.clauses.append(base_cl+alpha + [va])
                     if sel_var is not None:
                         self.clauses.append(base_cl+alpha+[sel_var])
@@ -2404,7 +2893,7 @@ class SSATEncoder:
             if pats is None:
                 continue
             for pat in pats:
-                alpha = self.pattern2clause(pat, vars)
+                alpha = cube2clause(pat, vars)
                 if imply_rand:
                     self.clauses.append(alpha + [bit_vars[i]] + sel_combs[i])
                 else:
@@ -2422,7 +2911,7 @@ class SSATEncoder:
             if pats is None:
                 continue
             for pat in pats:
-                alpha = self.pattern2clause(pat, vars)
+                alpha = cube2clause(pat, vars)
                 if imply_rand:
                     self.clauses.append(alpha + sel_combs[i])
 
@@ -2454,9 +2943,9 @@ class SSATEncoder:
 
     def check_pats_orthogonal(self, pats1, vars1,  pats2, vars2):
         for pat1 in pats1:
-            alpha1 = self.pattern2clause(pat1, vars1)
+            alpha1 = cube2clause(pat1, vars1)
             for pat2 in pats2:
-                alpha2 = self.pattern2clause(pat2, vars2)
+                alpha2 = cube2clause(pat2, vars2)
                 if not self.check_orthogonal(alpha1, alpha2):
                     return False
         return True
@@ -2468,3 +2957,45 @@ class SSATEncoder:
             elif -l in alpha2:
                 return True
         return False
+
+
+def cpt_size(cpt):
+    '''
+    the number of entries of a cpt (state_comb x num_states)
+    '''
+    return len(cpt) * len(cpt[0]) if len(cpt) > 0 else 0
+
+
+def encode_cpt_job(job):
+    '''
+    encode a cpt by a new encoder of its family only, in a worker process
+    job: SSATEncoder.cpt_job
+    return (the block of encode_cpt_block, None if not relocatable or failed; the tool_time of the encoder)
+    '''
+    settings, members, node_id, parent_ids, cpt = job
+    net = Network(kind='BN')
+    for (id, kind, num_states, states, dec) in members:
+        m = Node(id, kind)
+        m.num_states = num_states
+        m.states = states
+        net.nodes.append(m)
+        net.id2node[id] = m
+    n = net.id2node[node_id]
+    n.parents = [net.id2node[id] for id in parent_ids]
+    n.cpt = cpt
+
+    # the errors are raised again by encoding the cpt in order
+    with contextlib.redirect_stdout(io.StringIO()):
+        encoder = SSATEncoder(net, **settings)
+        for (id, kind, num_states, states, dec) in members:
+            encoder.encode_states(net.id2node[id], dec=dec)
+        encoder.cpt_blocks = {}
+        try:
+            encoder.encode_cpt_block(n)
+        except Exception:
+            return None, encoder.tool_time
+        finally:
+            if encoder.scratch is not None:
+                encoder.scratch.cleanup()
+    blocks = list(encoder.cpt_blocks.values())
+    return (blocks[0] if len(blocks) > 0 else None), encoder.tool_time
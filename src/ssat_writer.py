@@ -1,39 +1,202 @@
+import io
 import os
 
+MAX_TABLE_VAR = 1 << 19     # cache the strings of the literals up to this var id
+
 
 class SSATWriter:
     def __init__(self, encoder):
         self.encoder = encoder
         self.net = encoder.net
+        self.var_roles = {}
 
     def write_ssat(self, filename):
+        self.write_all([filename])
+
+    def write_wcnf(self, filename):
+        self.write_all([filename])
+
+    def write_cnf(self, filename):
+        self.write_all([filename])
+
+    def write_mc2021(self, filename):
+        self.write_all([filename])
+
+    def write_all(self, targets):
+        '''
+        targets(list of str): the output files, the format is decided by the extension
+        the clauses are formatted once and written to all the files,
+        the messages of each file are printed in the order of targets
+        '''
+        self.var_roles = {}
+        parts = []
+        for filename in targets:
+            part = self.build(filename)
+            if part is not None:
+                parts.append((filename, part))
+
+        files = []
+        for (filename, (head, tail, log)) in parts:
+            f = open(filename, 'wb')
+            f.write(head.encode())
+            files.append(f)
+
+        for block in self.clause_blocks():
+            for f in files:
+                f.write(block)
+
+        for f, (filename, (head, tail, log)) in zip(files, parts):
+            f.write(tail.encode())
+            f.close()
+
+        for (filename, (head, tail, log)) in parts:
+            for msg in log:
+                print(*msg)
+
+    def clause_blocks(self):
+        '''
+        the clauses in dimacs format, a block of bytes per block of the clause sink
+        '''
+        table = None
+        num_vars = self.encoder.var_id
+        if num_vars <= MAX_TABLE_VAR:
+            # table[v] = '%d ' % v, negative v indexes from the end
+            table = ['0\n'] + ['%d ' % i for i in range(1, num_vars + 1)] + \
+                ['%d ' % i for i in range(-num_vars, 0)]
+        for lits in self.encoder.clauses.blocks():
+            # a literal beyond the table would be written as another one
+            if len(lits) > 0 and (max(lits) > num_vars or min(lits) < -num_vars):
+                raise ValueError('Literal out of the range of the vars', max(lits), min(lits), num_vars)
+            yield format_clauses(lits, table).encode()
+
+    def roles(self, pair='abs'):
+        '''
+        the role of each var id in the prefix, built once per encoding and shared by the formats
+        pair: which state vars of a node with two represent its state
+            'abs': the second one if the two are the literals of the same var, else both
+            'len': always the second one (build_ssat_re)
+        return (role, vars)
+            role: list indexed by var id, 'evid', 'map', 'unobserved', 'ob' or None
+            vars: dict of role -> the vars of the role in the order of the prefix
+        '''
+        if pair in self.var_roles:
+            return self.var_roles[pair]
+
+        role = [None] * (self.encoder.var_id + 1)
+        vars = {'evid': [], 'map': [], 'unobserved': [], 'ob': []}
+
+        def add(r, node_id):
+            node_vars = self.encoder.node_id2state_vars[node_id]
+            if len(node_vars) == 2 and (pair == 'len' or abs(node_vars[0]) == abs(node_vars[1])):
+                node_vars = node_vars[1:]
+            for id in node_vars:
+                role[id] = r
+            vars[r] += node_vars
+
+        query = self.net.query if self.net.kind == 'BN' else None
+        query_var = set(self.net.query_var) if query == 'MAP' else set()
+        for (node_id, state) in self.net.evids if self.net.kind != 'ID' else []:
+            if node_id in query_var:
+                continue
+            if not self.net.id2node[node_id].cared:
+                continue
+            add('evid', node_id)
+
+        if query == 'MAP':
+            for node_id in self.net.query_var:
+                add('map', node_id)
+
+        if query == 'SDP':
+            unobserved = set(self.net.unobserved)
+            for n in self.net.nodes:    # topological order
+                if n.depend and n.id in unobserved:
+                    add('unobserved', n.id)
+
+        if self.net.kind == 'ID':
+            for l in range(self.net.max_dec_level, 0, -1):
+                for n in self.net.level2dec[l][::-1]:
+                    for (id, p) in self.encoder.node_id2ob_vars[n.id]:
+                        role[id] = 'ob'
+                        vars['ob'].append(id)
+
+        self.var_roles[pair] = (role, vars)
+        return role, vars
+
+    def prefix(self):
+        '''
+        the prefix of the ssat formula (as in .sdimacs)
+        return list of (quantifier 'e', 'r' or 't', var id, probability or threshold, None for 'e')
+        '''
+        head, tail, log = self.build('prefix.sdimacs')
+        prefix = []
+        for line in head.splitlines()[1:]:
+            pars = line.split()
+            p = float(pars[1]) if len(pars) > 3 else None
+            prefix.append((pars[0], abs(int(pars[-2])), p))
+        return prefix
+
+    def quantifier_blocks(self):
+        '''
+        the vars in the prefix of the ssat formula (as in .sdimacs), grouped by quantifier
+        return list of (quantifier 'e', 'r' or 't', list of var ids in the order of the prefix)
+        '''
+        blocks = []
+        for (q, id, p) in self.prefix():
+            if len(blocks) == 0 or blocks[-1][0] != q:
+                blocks.append((q, []))
+            blocks[-1][1].append(id)
+        return blocks
+
+    def scale_exponent(self, filename):
+        '''
+        the exponent of the scale printed for the formula of filename,
+        the answer is the value of the formula times 2 ** exponent
+        '''
+        head, tail, log = self.build(filename)
+        for msg in log:
+            if 'Scale' in str(msg[0]):
+                return msg[1]
+        return 0
+
+    def build(self, filename):
+        '''
+        return (text before the clauses, text after the clauses, messages to print)
+        '''
+        name, ext = os.path.splitext(filename)
+        if ext == '.wcnf':
+            return self.build_wcnf(filename)
+        elif ext == '.cnf':
+            return self.build_cnf(filename)
+        elif ext == '.mc2021':
+            return self.build_mc2021(filename)
+
         if self.net.kind == 'BN':
             if self.net.query == 'PE':
-                self.write_ssat_re(filename)
+                return self.build_ssat_re(filename)
             elif self.net.query == 'MPE':
-                self.write_ssat_mpe_er(filename)
+                return self.build_ssat_mpe_er(filename)
             elif self.net.query == 'MAP':
-                self.write_ssat_map_er(filename)
+                return self.build_ssat_map_er(filename)
             elif self.net.query == 'SDP':
-                self.write_ssat_sdp_rer(filename)
+                return self.build_ssat_sdp_rer(filename)
 
         elif self.net.kind == 'ID':
-            self.write_ssat_id(filename)
+            return self.build_ssat_id(filename)
 
         elif self.net.kind == 'CPT':
-            self.write_ssat_re(filename)
+            return self.build_ssat_re(filename)
 
         else:
             raise ValueError('Unknown net type', self.net.kind)
 
-    def write_ssat_re(self, filename):
+    def build_ssat_re(self, filename):
         name, ext = os.path.splitext(filename)
         if ext != '.ssat' and ext != '.sdimacs':
             raise ValueError('Unknown extension %s' % (ext))
 
-        print('Filename =', filename)
+        log = [('Filename =', filename)]
 
-        f = open(filename, 'w')
+        f = io.StringIO()
         var_num = len(self.encoder.state_vars) + \
             len(self.encoder.rand_vars) + len(self.encoder.intro_vars)
         clause_num = len(self.encoder.clauses)
@@ -44,18 +207,13 @@ class SSATWriter:
         elif ext == '.sdimacs':
             f.write('p cnf %d %d\n' % (var_num, clause_num))
 
-        evid_vars = []
-        for (node_id, state) in self.net.evids:
-            vars = self.encoder.node_id2state_vars[node_id]
-            if len(vars) == 2:
-                evid_vars.append(vars[1])
-            else:
-                evid_vars += vars
+        role, vars = self.roles('len')
+        evid_vars = vars['evid']
 
         r1 = 0
         var_scale = 0
         for id in self.encoder.state_vars:
-            if id not in evid_vars:
+            if role[id] != 'evid':
                 write_rand_var(f, id, 0.5, ext)
                 r1 += 1
                 var_scale += 1
@@ -75,29 +233,25 @@ class SSATWriter:
             write_exist_var(f, id, ext)
             e1 += 1
 
-        print('Total Scale = 2^', var_scale, ', ', 2**(var_scale))
+        log.append(('Total Scale = 2^', var_scale, ', ', 2**(var_scale)))
 
         for id in self.encoder.intro_vars:
             write_exist_var(f, id, ext)
             e1 += 1
 
-        for cl in self.encoder.clauses:
-            for id in cl:
-                f.write('%d ' % (id))
-            f.write('0\n')
-        f.close()
+        log.append(('(var, cls, r, e) = (%d, %d, %d, %d)' % (var_num, clause_num, r1, e1),))
+        log.append(('---------------------',))
 
-        print('(var, cls, r, e) = (%d, %d, %d, %d)' % (var_num, clause_num, r1, e1))
-        print('---------------------')
+        return f.getvalue(), '', log
 
-    def write_wcnf(self, filename):  # weighted model counting
+    def build_wcnf(self, filename):  # weighted model counting
         name, ext = os.path.splitext(filename)
         if ext != '.wcnf':
             raise ValueError('Unknown extension %s' % (ext))
 
-        print('Filename =', filename)
+        log = [('Filename =', filename)]
 
-        f = open(filename, 'w')
+        f = io.StringIO()
         var_num = len(self.encoder.state_vars) + \
             len(self.encoder.rand_vars) + len(self.encoder.intro_vars) + 0
         clause_num = len(self.encoder.clauses)
@@ -106,10 +260,8 @@ class SSATWriter:
         f.write('p cnf %d %d\n' % (var_num, clause_num))
 
         # clauses
-        for cl in self.encoder.clauses:
-            for id in cl:
-                f.write('%d ' % (id))
-            f.write('0\n')
+        head = f.getvalue()
+        f = io.StringIO()
 
         r1 = 0
         scale = 0
@@ -123,20 +275,12 @@ class SSATWriter:
 
         # print('Scale for sel vars = 2^', scale, ', ', 2**scale)
 
-        evid_vars = []
-        for (node_id, state) in self.net.evids:
-            vars = self.encoder.node_id2state_vars[node_id]
-            if len(vars) == 2:
-                if abs(vars[0]) == abs(vars[1]):
-                    evid_vars.append(vars[1])
-                else:
-                    evid_vars += vars
-            else:
-                evid_vars += vars
+        role, vars = self.roles()
+        evid_vars = vars['evid']
 
         var_scale = 0 + scale
         for id in self.encoder.state_vars:
-            if id not in evid_vars:
+            if role[id] != 'evid':
                 f.write('w %d -1\n' % (id))
                 r1 += 1
                 # var_scale += 1
@@ -146,25 +290,25 @@ class SSATWriter:
             f.write('w %d -1\n' % (id))
             e1 += 1
 
-        print('Total Scale = 2^', var_scale, ', ', 2**var_scale)
+        log.append(('Total Scale = 2^', var_scale, ', ', 2**var_scale))
 
         for id in self.encoder.intro_vars:
             f.write('w %d -1\n' % (id))
             e1 += 1
 
-        f.close()
+        log.append(('(var, cls, r, e) = (%d, %d, %d, %d)' % (var_num, clause_num, r1, e1),))
+        log.append(('---------------------',))
 
-        print('(var, cls, r, e) = (%d, %d, %d, %d)' % (var_num, clause_num, r1, e1))
-        print('---------------------')
+        return head, f.getvalue(), log
 
-    def write_cnf(self, filename):  # (projected) model counting
+    def build_cnf(self, filename):  # (projected) model counting
         name, ext = os.path.splitext(filename)
         if ext != '.cnf':
             raise ValueError('Unknown extension %s' % (ext))
 
-        print('Filename =', filename)
+        log = [('Filename =', filename)]
 
-        f = open(filename, 'w')
+        f = io.StringIO()
         f.write('c ind ')
 
         r1 = 0
@@ -178,26 +322,17 @@ class SSATWriter:
 
         # print('Scale for sel vars = 2^', scale, ', ', 2**scale)
 
-        evid_vars = []
-        for (node_id, state) in self.net.evids:
-            vars = self.encoder.node_id2state_vars[node_id]
-            if len(vars) == 2:
-                if abs(vars[0]) == abs(vars[1]):
-                    evid_vars.append(vars[1])
-                else:
-                    evid_vars += vars
-            else:
-                evid_vars += vars
+        role, vars = self.roles()
 
         var_scale = 0 + scale
         for id in self.encoder.state_vars:
-            if id not in evid_vars:
+            if role[id] != 'evid':
                 f.write('%d ' % (id))
                 var_scale += 1
                 r1 += 1
         f.write('0\n')
 
-        print('Total Scale = 2^', var_scale, ', ', 2**var_scale)
+        log.append(('Total Scale = 2^', var_scale, ', ', 2**var_scale))
 
         var_num = len(self.encoder.state_vars) + \
             len(self.encoder.rand_vars) + len(self.encoder.intro_vars) + 0
@@ -206,26 +341,20 @@ class SSATWriter:
         # header
         f.write('p cnf %d %d\n' % (var_num, clause_num))
 
-        # clauses
-        for cl in self.encoder.clauses:
-            for id in cl:
-                f.write('%d ' % (id))
-            f.write('0\n')
-
-        f.close()
-
         e1 = var_num - r1
-        print('(var, cls, r, e) = (%d, %d, %d, %d)' % (var_num, clause_num, r1, e1))
-        print('---------------------')
+        log.append(('(var, cls, r, e) = (%d, %d, %d, %d)' % (var_num, clause_num, r1, e1),))
+        log.append(('---------------------',))
 
-    def write_mc2021(self, filename):
+        return f.getvalue(), '', log
+
+    def build_mc2021(self, filename):
         name, ext = os.path.splitext(filename)
         if ext != '.mc2021':
             raise ValueError('Unknown extension %s' % (ext))
 
-        print('Filename =', filename)
+        log = [('Filename =', filename)]
 
-        f = open(filename, 'w')
+        f = io.StringIO()
         var_num = len(self.encoder.state_vars) + \
             len(self.encoder.rand_vars) + len(self.encoder.intro_vars) + 0
         clause_num = len(self.encoder.clauses)
@@ -247,20 +376,12 @@ class SSATWriter:
 
         # print('Scale for sel vars = 2^', scale, ', ', 2**scale)
 
-        evid_vars = []
-        for (node_id, state) in self.net.evids:
-            vars = self.encoder.node_id2state_vars[node_id]
-            if len(vars) == 2:
-                if abs(vars[0]) == abs(vars[1]):
-                    evid_vars.append(vars[1])
-                else:
-                    evid_vars += vars
-            else:
-                evid_vars += vars
+        role, vars = self.roles()
+        evid_vars = vars['evid']
 
         var_scale = 0 + scale
         for id in self.encoder.state_vars:
-            if id not in evid_vars:
+            if role[id] != 'evid':
                 # f.write('w %d 0.5\n' % (id))
                 r1 += 1
                 # var_scale += 1
@@ -270,31 +391,25 @@ class SSATWriter:
             # f.write('c p %d -1\n' % (id))
             e1 += 1
 
-        print('Total Scale = 2^', var_scale, ', ', 2**var_scale)
+        log.append(('Total Scale = 2^', var_scale, ', ', 2**var_scale))
 
         for id in self.encoder.intro_vars:
             # f.write('c p %d -1\n' % (id))
             e1 += 1
 
-        # clauses
-        for cl in self.encoder.clauses:
-            for id in cl:
-                f.write('%d ' % (id))
-            f.write('0\n')
-
-        f.close()
+        log.append(('(var, cls, r, e) = (%d, %d, %d, %d)' % (var_num, clause_num, r1, e1),))
+        log.append(('---------------------',))
 
-        print('(var, cls, r, e) = (%d, %d, %d, %d)' % (var_num, clause_num, r1, e1))
-        print('---------------------')
+        return f.getvalue(), '', log
 
-    def write_ssat_mpe_er(self, filename):
+    def build_ssat_mpe_er(self, filename):
         name, ext = os.path.splitext(filename)
         if ext != '.ssat' and ext != '.sdimacs':
             raise ValueError('Unknown extension %s' % (ext))
 
-        print('Filename =', filename)
+        log = [('Filename =', filename)]
 
-        f = open(filename, 'w')
+        f = io.StringIO()
         var_num = len(self.encoder.state_vars) + \
             len(self.encoder.rand_vars) + len(self.encoder.intro_vars)
         clause_num = len(self.encoder.clauses)
@@ -305,17 +420,12 @@ class SSATWriter:
         elif ext == '.sdimacs':
             f.write('p cnf %d %d\n' % (var_num, clause_num))
 
-        evid_vars = []
-        for (node_id, state) in self.net.evids:
-            vars = self.encoder.node_id2state_vars[node_id]
-            if len(vars) == 2 and not self.encoder.log_state:
-                evid_vars.append(vars[1])
-            else:
-                evid_vars += vars
+        role, vars = self.roles()
+        evid_vars = vars['evid']
 
         e1 = 0
         for id in self.encoder.state_vars:
-            if id not in evid_vars:
+            if role[id] != 'evid':
                 write_exist_var(f, id, ext)
                 e1 += 1
 
@@ -328,7 +438,7 @@ class SSATWriter:
             else:
                 write_rand_var(f, id, p, ext)
             r1 += 1
-        print('Scale for state vars = 2^', scale, ', ', 2**scale)
+        log.append(('Scale for state vars = 2^', scale, ', ', 2**scale))
 
         for id in evid_vars:
             write_exist_var(f, id, ext)
@@ -339,49 +449,30 @@ class SSATWriter:
             write_exist_var(f, id, ext)
             e2 += 1
 
-        for cl in self.encoder.clauses:
-            for id in cl:
-                f.write('%d ' % (id))
-            f.write('0\n')
-        f.close()
+        log.append(('(var, cls, e1, r, e2) = (%d, %d, %d, %d, %d)' % (var_num, clause_num, e1, r1, e2),))
+        log.append(('---------------------',))
 
-        print('(var, cls, e1, r, e2) = (%d, %d, %d, %d, %d)' % (var_num, clause_num, e1, r1, e2))
-        print('---------------------')
+        return f.getvalue(), '', log
 
-    def write_ssat_map_er(self, filename):
+    def build_ssat_map_er(self, filename):
         name, ext = os.path.splitext(filename)
         if ext != '.ssat' and ext != '.sdimacs':
             raise ValueError('Unknown extension %s' % (ext))
 
-        print('Filename =', filename)
+        log = [('Filename =', filename)]
 
         # collect information
         var_num = len(self.encoder.state_vars) + \
             len(self.encoder.rand_vars) + len(self.encoder.intro_vars)
         clause_num = len(self.encoder.clauses)
 
-        # evidence
-        evid_vars = []
-        for (node_id, state) in self.net.evids:
-            if node_id in self.net.query_var:
-                continue
-            vars = self.encoder.node_id2state_vars[node_id]
-            if len(vars) == 2 and not self.encoder.log_state:
-                evid_vars.append(vars[1])
-            else:
-                evid_vars += vars
-
-        # map
-        map_vars = []
-        for node_id in self.net.query_var:
-            vars = self.encoder.node_id2state_vars[node_id]
-            if len(vars) == 2 and not self.encoder.log_state:
-                map_vars.append(vars[1])
-            else:
-                map_vars += vars
+        # evidence (not in the query) and map
+        role, vars = self.roles()
+        evid_vars = vars['evid']
+        map_vars = vars['map']
 
         # write file
-        f = open(filename, 'w')
+        f = io.StringIO()
 
         if ext == '.ssat':
             f.write('%d\n' % (var_num))
@@ -401,7 +492,7 @@ class SSATWriter:
 
         # states
         for id in self.encoder.state_vars:
-            if id not in evid_vars and id not in map_vars:
+            if role[id] is None:
                 write_rand_var(f, id, 0.5, ext)
                 scale += 1
                 r1 += 1
@@ -415,7 +506,7 @@ class SSATWriter:
                 write_rand_var(f, id, p, ext)
             r1 += 1
 
-        print('Scale for state vars = 2^', scale, ', ', 2**scale)
+        log.append(('Scale for state vars = 2^', scale, ', ', 2**scale))
 
         # second exist
         e2 = 0
@@ -427,22 +518,17 @@ class SSATWriter:
             write_exist_var(f, id, ext)
             e2 += 1
 
-        # clauses
-        for cl in self.encoder.clauses:
-            for id in cl:
-                f.write('%d ' % (id))
-            f.write('0\n')
-        f.close()
+        log.append(('(var, cls, e1, r, e2) = (%d, %d, %d, %d, %d)' % (var_num, clause_num, e1, r1, e2),))
+        log.append(('---------------------',))
 
-        print('(var, cls, e1, r, e2) = (%d, %d, %d, %d, %d)' % (var_num, clause_num, e1, r1, e2))
-        print('---------------------')
+        return f.getvalue(), '', log
 
-    def write_ssat_sdp_rer(self, filename):
+    def build_ssat_sdp_rer(self, filename):
         name, ext = os.path.splitext(filename)
         if ext != '.ssat' and ext != '.sdimacs':
             raise ValueError('Unknown extension %s' % (ext))
 
-        print('Filename =', filename)
+        log = [('Filename =', filename)]
 
         # variable order
         # self.net.nodes.sort(key=lambda n: len(n.cpt)*len(n.cpt[0]))
@@ -452,32 +538,13 @@ class SSATWriter:
             len(self.encoder.rand_vars) + len(self.encoder.intro_vars) + 1
         clause_num = len(self.encoder.clauses)
 
-        # evidence
-        evid_vars = []
-        for (node_id, state) in self.net.evids:
-            if not self.net.id2node[node_id].cared:
-                continue
-            vars = self.encoder.node_id2state_vars[node_id]
-            if len(vars) == 2 and not self.encoder.log_state:
-                evid_vars.append(vars[1])
-            else:
-                evid_vars += vars
-
-        # unobserved
-        unobserved_vars = []
-        for n in self.net.nodes:    # topological order
-            if not n.depend:
-                continue
-            node_id = n.id
-            if node_id in self.net.unobserved:
-                vars = self.encoder.node_id2state_vars[node_id]
-                if len(vars) == 2 and not self.encoder.log_state:
-                    unobserved_vars.append(vars[1])
-                else:
-                    unobserved_vars += vars
+        # evidence (cared) and unobserved
+        role, vars = self.roles()
+        evid_vars = vars['evid']
+        unobserved_vars = vars['unobserved']
 
         # write file
-        f = open(filename, 'w')
+        f = io.StringIO()
 
         if ext == '.ssat':
             f.write('%d\n' % (var_num))
@@ -505,7 +572,8 @@ class SSATWriter:
             if not n.depend:
                 continue
             for id in self.encoder.node_id2state_vars[n.id]:
-                if id not in unobserved_vars and id not in evid_vars:
+                # -v of a binary state is not in the prefix yet
+                if id <= 0 or role[id] is None:
                     write_rand_var(f, id, 0.5, ext, True)
                     scale += 1
                     r2 += 1
@@ -519,7 +587,7 @@ class SSATWriter:
                 write_rand_var(f, id, p, ext)
             r2 += 1
 
-        print('Scale for state vars = 2^', scale, ', ', 2**scale)
+        log.append(('Scale for state vars = 2^', scale, ', ', 2**scale))
 
         # second exist
         e2 = 0
@@ -531,23 +599,19 @@ class SSATWriter:
             write_exist_var(f, id, ext)
             e2 += 1
 
-        # clauses
-        for cl in self.encoder.clauses:
-            for id in cl:
-                f.write('%d ' % (id))
-            f.write('0\n')
-        f.close()
+        log.append(('(var, cls, r1, e1, r2, e2) = (%d, %d, %d, %d, %d, %d)' %
+                    (var_num, clause_num, r1, e1, r2, e2),))
+        log.append(('---------------------',))
 
-        print('(var, cls, r1, e1, r2, e2) = (%d, %d, %d, %d, %d, %d)' %
-              (var_num, clause_num, r1, e1, r2, e2))
-        print('---------------------')
+        return f.getvalue(), '', log
 
-    def write_ssat_id(self, filename):
+    def build_ssat_id(self, filename):
         name, ext = os.path.splitext(filename)
         if ext != '.ssat' and ext != '.sdimacs':
             raise ValueError('Unknown extension %s' % (ext))
 
-        f = open(filename, 'w')
+        log = []
+        f = io.StringIO()
         var_num = len(self.encoder.state_vars) + len(self.encoder.rand_vars)
         var_num += len(self.encoder.intro_vars)
         var_num += len(self.encoder.dec_vars) + len(self.encoder.ob_vars)
@@ -564,7 +628,7 @@ class SSATWriter:
 
         ssat_level = 0
         var_num_l = []
-        all_ob_vars = []
+        role, vars = self.roles()
         # decisions
         for level in range(self.net.max_dec_level):
             l = self.net.max_dec_level - level
@@ -587,13 +651,11 @@ class SSATWriter:
                 ssat_level += 1
             var_num_l.append(d_cnt)
             ssat_level += 1
-            for (v, p) in ob_vars:
-                all_ob_vars.append(v)
 
         num_r = 0
         scale = 0
         for id in self.encoder.state_vars:
-            if id not in all_ob_vars:
+            if role[id] != 'ob':
                 scale += 1
                 num_r += 1
                 write_rand_var(f, id, 0.5, ext)
@@ -603,7 +665,7 @@ class SSATWriter:
             num_r += 1
             write_rand_var(f, id, 0.5, ext)
 
-        print('Scale for state vars = 2^', scale)
+        log.append(('Scale for state vars = 2^', scale))
 
         for (id, p) in self.encoder.util_vars:
             num_r += 1
@@ -618,18 +680,27 @@ class SSATWriter:
             num_e += 1
             write_exist_var(f, id, ext)
 
-        for cl in self.encoder.clauses:
-            for id in cl:
-                f.write('%d ' % (id))
-            f.write('0\n')
-        f.close()
-
         var_num_l.append(num_r)
         var_num_l.append(num_e)
         ssat_level += 2
 
-        print('(var, cls) = (%d, %d)' % (var_num, clause_num))
-        print('(level, per level) = (%d, %s)' % (ssat_level, var_num_l))
+        log.append(('(var, cls) = (%d, %d)' % (var_num, clause_num),))
+        log.append(('(level, per level) = (%d, %s)' % (ssat_level, var_num_l),))
+
+        return f.getvalue(), '', log
+
+
+def format_clauses(lits, table=None):
+    '''
+    0-terminated literals to dimacs lines
+        [1, -2, 0, 0, 3, 0] -> '1 -2 0\n0\n3 0\n'
+    table: the text of each literal, see SSATWriter.clause_blocks
+    '''
+    if table is not None:
+        return ''.join(map(table.__getitem__, lits))
+    # the leading space makes every 0 of an empty clause a ' 0' token
+    text = ' ' + ' '.join(map(str, lits))
+    return text.replace(' 0', ' 0\n').replace('\n ', '\n')[1:]
 
 
 def write_exist_var(f, id, ext):
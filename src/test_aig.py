@@ -0,0 +1,101 @@
+import pytest
+
+from aig import AIG
+from conftest import encode_files, sdimacs_value
+from cube import Cube, pattern2cube, cube2pattern
+from logic_min import exact_cover
+from ssat_encoder import SSATEncoder
+
+
+def exact_espresso(cmds):
+    '''
+    run_tools of the espresso commands of bit_sop ('./espresso in.pla > out.pla') by an exact minimizer,
+    the PLAs have one output
+    '''
+    for cmd in cmds:
+        binary, pla, redirect, out = cmd.split()
+        assert binary == './espresso'
+        f = open(pla)
+        lines = f.readlines()
+        f.close()
+        num_input = int(lines[0].split()[1])
+        onset = [pattern2cube(line.split()[0]) for line in lines if line[0] != '.' and line.split()[1] == '1']
+        # the cubes of the PLA are split into minterms
+        full = (1 << num_input) - 1
+        minterms = set()
+        for c in onset:
+            sub = free = full & ~c.care
+            while True:
+                minterms.add(c.value | sub)
+                if sub == 0:
+                    break
+                sub = (sub - 1) & free
+        cover = exact_cover([Cube(full, m) for m in minterms], [], num_input)
+        f = open(out, 'w')
+        f.write('.i %d\n.o 1\n' % (num_input))
+        for c in cover:
+            f.write('%s 1\n' % (cube2pattern(c, num_input)))
+        f.write('.e\n')
+        f.close()
+
+
+def test_bit_aig_value(monkeypatch, tmp_path, net_two):
+    monkeypatch.setattr(SSATEncoder, 'run_tools', lambda self, cmds: exact_espresso(cmds))
+    uai_file, evid_file = net_two
+    values = {}
+    for method in ['bit_sop', 'bit_aig']:
+        name = str(tmp_path / method)
+        files, writer = encode_files(uai_file, evid_file, name, exts=['.sdimacs'], encode=method)
+        values[method] = sdimacs_value(files['.sdimacs']) * 2**writer.scale_exponent(name + '.sdimacs')
+    assert values['bit_aig'] == pytest.approx(values['bit_sop'])
+    # the probabilities are rounded to the bits
+    assert values['bit_aig'] == pytest.approx(0.59 * 0.485, rel=1e-3)
+
+
+def test_constants():
+    aig = AIG(2)
+    a = aig.input(0)
+    b = aig.input(1)
+    assert aig.and_(0, a) == 0
+    assert aig.and_(a, 1) == a
+    assert aig.and_(a, a) == a
+    assert aig.and_(a, a ^ 1) == 0
+    assert aig.or_(a, 1) == 1
+    assert aig.or_(0, b) == b
+    assert aig.or_(b, b ^ 1) == 1
+    assert aig.and_all([]) == 1
+    assert aig.and_all([a, b, 0]) == 0
+    assert aig.or_all([a, b, a ^ 1]) == 1
+    # the cube of no literal and the empty cover
+    assert aig.sop(['--']) == 1
+    assert aig.sop([]) == 0
+    # no AND node for any of them
+    assert len(aig.fanins) == 3
+
+
+def test_hash_consing():
+    aig = AIG(3)
+    a, b, c = [aig.input(i) for i in range(3)]
+    ab = aig.and_(a, b)
+    assert aig.and_(b, a) == ab
+    assert len(aig.fanins) == 5
+    abc = aig.and_all([a, b, c])
+    assert aig.and_all([c, a, b, a]) == abc
+    assert aig.cube('111') == abc
+    num_nodes = len(aig.fanins)
+    # a b c' | a b c: a b is shared, the OR of c' and c is a constant
+    assert aig.sop(['110', '111']) == ab
+    assert len(aig.fanins) == num_nodes
+
+    # the clauses of a shared node are added once
+    clauses = []
+    next_var = [10]
+
+    def new_var():
+        next_var[0] += 1
+        return next_var[0]
+
+    lits = aig.tseitin([abc, ab, ab ^ 1, 1], [1, 2, 3], new_var, clauses)
+    assert lits[1] == -lits[2]
+    assert lits[3] is True
+    assert len(clauses) == 3 * 2
@@ -0,0 +1,39 @@
+import pytest
+
+from PGM import Network
+from batch_encoder import BatchEncoder
+from conftest import NET_ABC, NET_TWO, write_file, encode_files
+from ssat_writer import SSATWriter
+
+EXTS = ['.sdimacs', '.ssat', '.wcnf']
+
+# the evidence of each query, the same nodes left for some of them
+EVIDS = {NET_ABC: ['1 2 1\n', '1 2 2\n', '1 1 0\n', '0\n', '1 2 1\n'],
+         NET_TWO: ['2 1 0 3 1\n', '1 3 1\n', '2 1 1 3 0\n', '1 1 0\n', '2 0 1 3 1\n', '2 1 0 3 1\n']}
+
+
+@pytest.mark.parametrize('net_text', [NET_ABC, NET_TWO])
+@pytest.mark.parametrize('query', ['PE', 'MAP'])
+@pytest.mark.parametrize('relevance', [False, True])
+@pytest.mark.parametrize('condition_evid', [False, True])
+def test_batch_same_as_alone(tmp_path, net_text, query, relevance, condition_evid):
+    uai_file = write_file(tmp_path / 'net.uai', net_text)
+    write_file(tmp_path / 'net.uai.map', '1 0\n')
+    args = dict(encode='bklm16', query=query, log_state=True, opt='none', relevance=relevance,
+                condition_evid=condition_evid)
+
+    net = Network(kind='BN', query=query)
+    net.read_network(uai_file, snapshot=False)
+    batch = BatchEncoder(net, uai_file, **args)
+    for i, evid in enumerate(EVIDS[net_text]):
+        evid_file = write_file(tmp_path / ('q%d.evid' % (i)), evid)
+        alone, writer = encode_files(uai_file, evid_file, str(tmp_path / ('alone%d' % (i))), exts=EXTS, **args)
+
+        encoder = batch.encode(evid_file)
+        name = str(tmp_path / ('batch%d' % (i)))
+        SSATWriter(encoder).write_all([name + ext for ext in EXTS])
+        for ext in EXTS:
+            f = open(name + ext, 'rb')
+            assert f.read() == alone[ext], (i, ext)
+            f.close()
+    assert batch.num_reused > 0
@@ -0,0 +1,49 @@
+import random
+from array import array
+
+import pytest
+
+import clause_sink
+from clause_sink import new_clause_sink, ChainClauseSink
+from conftest import encode_files
+
+
+def random_clauses(rnd, num):
+    return [[rnd.choice([-1, 1]) * rnd.randint(1, 50) for i in range(rnd.randint(0, 12))] for k in range(num)]
+
+
+@pytest.mark.parametrize('kind', ['memory', 'disk'])
+def test_sink_clauses(monkeypatch, kind):
+    # blocks shorter than some clauses
+    monkeypatch.setattr(clause_sink, 'BLOCK_SIZE', 8)
+    rnd = random.Random(0)
+    clauses = random_clauses(rnd, 300)
+
+    sink = new_clause_sink(kind)
+    for cl in clauses[:100]:
+        sink.append(cl)
+    sink += clauses[100:200]
+    lits = array('i')
+    for cl in clauses[200:]:
+        lits.extend(cl + [0])
+    sink.append_block(lits, 100)
+
+    assert len(sink) == len(clauses)
+    # the iteration can be repeated
+    assert list(sink) == clauses
+    assert list(sink) == clauses
+    assert sum([b for b in sink.blocks()], []) == [v for cl in clauses for v in cl + [0]]
+
+    chain = ChainClauseSink(sink)
+    chain.append([7, -8])
+    assert len(chain) == len(clauses) + 1
+    assert list(chain) == clauses + [[7, -8]]
+    assert list(sink) == clauses
+
+
+@pytest.mark.parametrize('method', ['bklm16', 'val', 'sbk05'])
+def test_disk_sink_same_formula(net_two, tmp_path, method):
+    uai_file, evid_file = net_two
+    memory, writer = encode_files(uai_file, evid_file, str(tmp_path / 'memory'), encode=method)
+    disk, writer = encode_files(uai_file, evid_file, str(tmp_path / 'disk'), encode=method, clause_sink='disk')
+    assert disk == memory
@@ -0,0 +1,33 @@
+import os
+import argparse
+
+import pytest
+
+from conftest import read_net, encode_files, sdimacs_value
+from components import read_manifest, combine
+from encode import encode_components
+
+
+@pytest.mark.parametrize('query', ['PE', 'MPE'])
+def test_components_combine(net_two, tmp_path, query):
+    uai_file, evid_file = net_two
+    files, writer = encode_files(uai_file, evid_file, str(tmp_path / 'whole'), exts=['.sdimacs'], query=query)
+    whole = sdimacs_value(files['.sdimacs']) * 2**writer.scale_exponent('whole.sdimacs')
+
+    name = str(tmp_path / 'two')
+    args = argparse.Namespace(net_type='BN', query=query, method='bklm16', preprocess=False, renumber='none')
+    encoder_args = dict(encode='bklm16', query=query, log_state=True, opt='none')
+    encode_components(read_net(uai_file, evid_file, query), name, args, encoder_args)
+
+    manifest = read_manifest(name + '.components.json')
+    assert len(manifest['components']) == 2
+    results = []
+    for c in manifest['components']:
+        sdimacs = [f for f in c['files'] if f.endswith('.sdimacs')][0]
+        f = open(os.path.join(str(tmp_path), sdimacs), 'rb')
+        results.append((sdimacs_value(f.read()), c['files'][sdimacs]))
+        f.close()
+    value, log_value = combine(manifest, results)
+    assert value == pytest.approx(whole)
+    # P(e) or the max of P(A, B = 0) times the max of P(C, D = 1)
+    assert value == pytest.approx(0.59 * 0.485 if query == 'PE' else 0.56 * 0.375)
@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import encode_files
+from cube import Cube
+from disk_cache import DiskCache, MemoCache
+
+
+def test_disk_cache(tmp_path):
+    cache = DiskCache(str(tmp_path / 'cache'))
+    assert cache.get(('a', 1)) is None
+    cache.put(('a', 1), [1, 2, 3])
+    assert DiskCache(str(tmp_path / 'cache')).get(('a', 1)) == [1, 2, 3]
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    # the least recently used are removed over the cap
+    small = DiskCache(str(tmp_path / 'small'), max_size=1000)
+    for i in range(20):
+        small.put(i, bytes(100))
+    assert small.size <= 1000
+    assert small.get(19) == bytes(100)
+    assert small.get(0) is None
+
+
+def test_disk_cache_overwrite(tmp_path):
+    # a key put again counts the size of its file once
+    cache = DiskCache(str(tmp_path / 'cache'))
+    for n in [10, 1000, 10]:
+        cache.put('a', np.zeros(n, dtype=np.int32))
+    assert cache.size == sum([size for (mtime, size, f) in cache.files()])
+    assert len(cache) == 1
+
+
+def test_disk_cache_plain_values(tmp_path):
+    cache = DiskCache(str(tmp_path / 'cache'))
+    # a cpt block, the scale and the cubes wider than 64 bits
+    block = {'num_vars': 5, 'lits': np.array([1, -2, 0, 3, 0], dtype=np.int32), 'rand_vars': [(4, 0.3), (5, 0.1)],
+             'scale': 3 ** 50, 'log': 'c x\n'}
+    cubes = [Cube(7, 5), Cube(1 << 80 | 1, 1 << 80)]
+    cache.put('block', block)
+    cache.put('cubes', cubes)
+    cache.put('multi', [cubes, []])
+
+    value = DiskCache(str(tmp_path / 'cache')).get('block')
+    assert value['lits'].dtype == np.int32 and list(value['lits']) == [1, -2, 0, 3, 0]
+    assert value['rand_vars'] == [[4, 0.3], [5, 0.1]]
+    assert dict([(k, v) for k, v in value.items() if k not in ['lits', 'rand_vars']]) == \
+        {'num_vars': 5, 'scale': 3 ** 50, 'log': 'c x\n'}
+    value = cache.get('cubes')
+    assert value == cubes and all([type(c) is Cube for c in value])
+    assert cache.get('multi') == [cubes, []]
+
+    # no pickle in the files, and a broken file is a miss
+    assert all([f.endswith('.npz') for f in os.listdir(str(tmp_path / 'cache'))])
+    with open(cache.file('cubes'), 'wb') as f:
+        f.write(b'broken')
+    assert cache.get('cubes') is None
+    with pytest.raises(TypeError):
+        cache.put('object', np.array([1 << 80], dtype=object))
+
+
+def test_memo_cache_lru():
+    memo = MemoCache(2)
+    memo.put('a', 1)
+    memo.put('b', 2)
+    assert memo.get('a') == 1
+    memo.put('c', 3)
+    assert memo.get('b') is None
+    assert (memo.get('a'), memo.get('c')) == (1, 3)
+
+
+@pytest.mark.parametrize('method, opt', [('bklm16', 'none'), ('bklm16', 'esp'), ('val', 'none')])
+def test_cpt_cache_hits(net_two, tmp_path, method, opt):
+    uai_file, evid_file = net_two
+    plain, writer = encode_files(uai_file, evid_file, str(tmp_path / 'plain'), encode=method, opt=opt)
+
+    cache = DiskCache(str(tmp_path / 'cache'))
+    first, writer = encode_files(uai_file, evid_file, str(tmp_path / 'first'), encode=method, opt=opt,
+                                 cpt_cache=cache)
+    assert cache.hits == 0 and cache.misses > 0
+
+    cache = DiskCache(str(tmp_path / 'cache'))
+    second, writer = encode_files(uai_file, evid_file, str(tmp_path / 'second'), encode=method, opt=opt,
+                                  cpt_cache=cache)
+    assert cache.hits > 0 and cache.misses == 0
+    assert first == plain
+    assert second == plain
@@ -0,0 +1,143 @@
+import math
+import random
+
+import pytest
+
+from conftest import write_file, read_net
+from elim_order import HEURISTICS, moral_graph, elim_order
+
+# A -> C <- B, C -> D -> E, the states 2, 3, 2, 4, 2
+NET_V = '''BAYES
+5
+2 3 2 4 2
+5
+1 0
+1 1
+3 0 1 2
+2 2 3
+2 3 4
+
+2
+0.5 0.5
+3
+0.2 0.3 0.5
+12
+0.5 0.5
+0.5 0.5
+0.5 0.5
+0.5 0.5
+0.5 0.5
+0.5 0.5
+8
+0.25 0.25 0.25 0.25
+0.25 0.25 0.25 0.25
+8
+0.5 0.5
+0.5 0.5
+0.5 0.5
+0.5 0.5
+'''
+
+
+def score(adj, weights, v, heuristic):
+    ns = sorted(adj[v])
+    if heuristic == 'mindeg':
+        return len(ns)
+    if heuristic == 'minwidth':
+        return sum([math.log2(weights[u]) for u in ns + [v]])
+    fill = [(a, b) for i, a in enumerate(ns) for b in ns[i + 1:] if b not in adj[a]]
+    if heuristic == 'wminfill':
+        return sum([weights[a] * weights[b] for (a, b) in fill])
+    return len(fill)
+
+
+def greedy_orders(adj, weights, heuristic):
+    '''
+    the orders of the greedy elimination with any tie break, by recomputing all the scores
+    '''
+    if len(adj) == 0:
+        return set([()])
+    scores = dict([(v, score(adj, weights, v, heuristic)) for v in adj])
+    best = min(scores.values())
+    orders = set()
+    for v in adj:
+        if not math.isclose(scores[v], best):
+            continue
+        rest = dict([(u, set(ns) - {v}) for u, ns in adj.items() if u != v])
+        for a in adj[v]:
+            rest[a] |= adj[v] - {a}
+        orders |= set([(v,) + o for o in greedy_orders(rest, weights, heuristic)])
+    return orders
+
+
+def induced_width(adj, order):
+    adj = dict([(v, set(ns)) for v, ns in adj.items()])
+    width = 0
+    for v in order:
+        ns = adj.pop(v)
+        width = max(width, len(ns))
+        for a in ns:
+            adj[a] |= ns - {a}
+            adj[a].discard(v)
+    return width
+
+
+def test_moral_graph(tmp_path):
+    net = read_net(write_file(tmp_path / 'v.uai', NET_V))
+    adj, weights = moral_graph(net)
+    # the parents A and B of C are married
+    assert adj == {0: {1, 2}, 1: {0, 2}, 2: {0, 1, 3}, 3: {2, 4}, 4: {3}}
+    assert weights == {0: 2, 1: 3, 2: 2, 3: 4, 4: 2}
+
+
+def test_expected_order(tmp_path):
+    adj, weights = moral_graph(read_net(write_file(tmp_path / 'v.uai', NET_V)))
+    for seed in range(5):
+        # A, B or E first, and no fill edge at all: the neighbours eliminated later form a clique
+        order, width = elim_order(adj, weights, 'minfill', seed)
+        assert order[0] in [0, 1, 4]
+        for i, v in enumerate(order):
+            later = [u for u in order[i + 1:] if u in adj[v]]
+            assert all([b in adj[a] for a in later for b in later if a != b])
+        assert width == 2
+        # E of one neighbour, then D of one neighbour
+        order, width = elim_order(adj, weights, 'mindeg', seed)
+        assert order[:2] == [4, 3]
+        assert width == 2
+        # the smallest clique: E (with D) is 8 states, A (with B and C) 12
+        order, width = elim_order(adj, weights, 'minwidth', seed)
+        assert order[0] == 4
+
+
+@pytest.mark.parametrize('heuristic', HEURISTICS)
+def test_greedy_reference(heuristic):
+    rnd = random.Random(3)
+    for k in range(30):
+        num_nodes = rnd.randint(1, 7)
+        adj = dict([(v, set()) for v in range(num_nodes)])
+        for a in range(num_nodes):
+            for b in range(a + 1, num_nodes):
+                if rnd.random() < 0.4:
+                    adj[a].add(b)
+                    adj[b].add(a)
+        weights = dict([(v, rnd.randint(2, 5)) for v in adj])
+        order, width = elim_order(adj, weights, heuristic, seed=k)
+        assert tuple(order) in greedy_orders(adj, weights, heuristic)
+        assert width == induced_width(adj, order)
+
+
+def test_time_limit_permutation():
+    rnd = random.Random(4)
+    adj = dict([(v, set()) for v in range(40)])
+    for a in range(40):
+        for b in range(a + 1, 40):
+            if rnd.random() < 0.15:
+                adj[a].add(b)
+                adj[b].add(a)
+    weights = dict([(v, 2) for v in adj])
+    first, first_width = elim_order(adj, weights, 'minfill', seed=1)
+    # the retries cut at the best width keep a full order
+    order, width = elim_order(adj, weights, 'minfill', seed=1, time_limit=0.3)
+    assert sorted(order) == list(range(40))
+    assert width <= first_width
+    assert width == induced_width(adj, order)
@@ -0,0 +1,77 @@
+import pytest
+
+from conftest import NET_ABC, NET_TWO, write_file, read_net, encode_files, sdimacs_value
+from evidence import condition_evidence
+
+# Z -> Y, P(Z = 0) = 0 and P(Y = 1 | Z = 1) = 0
+NET_ZERO = '''BAYES
+2
+2 3
+2
+1 0
+2 0 1
+
+2
+0.0 1.0
+6
+0.5 0.5 0.0
+0.2 0.0 0.8
+'''
+
+
+def value(uai_file, evid_file, name, query, **encoder_args):
+    files, writer = encode_files(uai_file, evid_file, name, exts=['.sdimacs'], query=query, **encoder_args)
+    return sdimacs_value(files['.sdimacs']) * 2**writer.scale_exponent(name + '.sdimacs')
+
+
+# (network, evidence, P(e), MAP var, max over the MAP var of P(var, e))
+CASES = [(NET_ABC, '1 2 1\n', 0.5, 0, 0.25),
+         (NET_TWO, '2 1 0 3 1\n', 0.59 * 0.485, 0, 0.56 * 0.485),
+         # evidence on the root A
+         (NET_TWO, '2 0 1 3 1\n', 0.7 * 0.485, 1, 0.7 * 0.8 * 0.485),
+         (NET_ZERO, '1 1 2\n', 0.8, 0, 0.8),
+         # zero-probability evidence on the root and on a child
+         (NET_ZERO, '1 0 0\n', 0.0, 1, 0.0),
+         (NET_ZERO, '1 1 1\n', 0.0, 0, 0.0)]
+
+
+@pytest.mark.parametrize('net, evid, pe, map_var, map_value', CASES)
+@pytest.mark.parametrize('query', ['PE', 'MAP'])
+def test_condition_evidence_value(tmp_path, net, evid, pe, map_var, map_value, query):
+    uai_file = write_file(tmp_path / 'net.uai', net)
+    evid_file = write_file(tmp_path / 'net.evid', evid)
+    write_file(tmp_path / 'net.uai.map', '1 %d\n' % (map_var))
+    expected = pe if query == 'PE' else map_value
+    assert value(uai_file, evid_file, str(tmp_path / 'plain'), query) == pytest.approx(expected)
+    assert value(uai_file, evid_file, str(tmp_path / 'cond'), query, condition_evid=True) == pytest.approx(expected)
+    assert value(uai_file, evid_file, str(tmp_path / 'both'), query, condition_evid=True,
+                 relevance=True) == pytest.approx(expected)
+
+
+def test_root_evidence_factor(tmp_path):
+    uai_file = write_file(tmp_path / 'two.uai', NET_TWO)
+    net = read_net(uai_file, write_file(tmp_path / 'two.evid', '2 0 1 3 1\n'))
+    num_edges, num_collapsed, num_constant, removed = condition_evidence(net)
+    # A is cut from B and folded into the factor, D is kept with its two states
+    assert (num_edges, num_collapsed, num_constant) == (1, 0, 1)
+    assert net.evid_factor == pytest.approx(0.7)
+    assert not net.id2node[0].depend
+    assert net.collapsed_evids == [(0, 1)]
+
+    # all05 keeps the root evidence as a node
+    net = read_net(uai_file, str(tmp_path / 'two.evid'))
+    assert condition_evidence(net, constant=False)[2] == 0
+    assert net.evid_factor == 1
+    assert net.id2node[0].depend
+
+
+def test_collapse_evidence(tmp_path):
+    uai_file = write_file(tmp_path / 'abc.uai', NET_ABC)
+    net = read_net(uai_file, write_file(tmp_path / 'abc.evid', '1 2 1\n'))
+    assert condition_evidence(net)[1] == 1
+    # C = 1 against the other states, P(C = 1 | A) is the second column
+    c = net.id2node[2]
+    assert c.num_states == 2
+    assert [list(row) for row in c.cpt] == [[0.5, 0.5], [0.5, 0.5]]
+    assert net.evids == [(2, 1)]
+    assert net.collapsed_evids == [(2, 1)]
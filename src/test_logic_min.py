@@ -0,0 +1,108 @@
+import os
+import random
+import shutil
+import subprocess
+
+import pytest
+
+from cube import Cube
+from logic_min import espresso, espresso_multi
+
+
+def covered(F, m):
+    return any([(m ^ c.value) & c.care == 0 for c in F])
+
+
+def check_cover(F, onset, dc, num_vars):
+    '''
+    F covers every minterm of the onset and no minterm outside onset + dc
+    '''
+    on = set([c.value for c in onset])
+    free = set([c.value for c in dc])
+    for m in range(1 << num_vars):
+        if m in on:
+            assert covered(F, m), m
+        elif m not in free:
+            assert not covered(F, m), m
+
+
+def random_function(rnd, num_vars, p_dc):
+    full = (1 << num_vars) - 1
+    onset = []
+    dc = []
+    for m in range(1 << num_vars):
+        x = rnd.random()
+        if x < p_dc:
+            dc.append(Cube(full, m))
+        elif x < (1 + p_dc) / 2:
+            onset.append(Cube(full, m))
+    return onset, dc
+
+
+def test_espresso_cover():
+    rnd = random.Random(0)
+    for k in range(200):
+        num_vars = rnd.randint(1, 7)
+        onset, dc = random_function(rnd, num_vars, rnd.choice([0, 0.2]))
+        F = espresso(onset, num_vars, dc)
+        check_cover(F, onset, dc, num_vars)
+        assert len(F) <= len(onset)
+
+
+def binary_num_cubes(onset, dc, num_vars, path):
+    '''
+    the number of cubes of the cover of the espresso binary (./espresso or on the path),
+    the same minimizer wrapped by pyeda if there is no binary
+    '''
+    rows = [(c.value, '1') for c in onset] + [(c.value, '-') for c in dc]
+    binary = './espresso' if os.path.exists('./espresso') else shutil.which('espresso')
+    if binary is None:
+        E = pytest.importorskip('pyeda.boolalg.espresso')
+        cover = set([(tuple([2 if m >> (num_vars - 1 - i) & 1 else 1 for i in range(num_vars)]),
+                      (1 if out == '1' else 2,)) for (m, out) in rows])
+        return len(E.espresso(num_vars, 1, cover, intype=E.FTYPE | E.DTYPE))
+
+    f = open(path, 'w')
+    f.write('.i %d\n.o 1\n.type fd\n' % (num_vars))
+    for (m, out) in rows:
+        f.write('%s %s\n' % (format(m, '0%db' % (num_vars)), out))
+    f.write('.e\n')
+    f.close()
+    out = subprocess.run([binary, path], stdout=subprocess.PIPE, check=True).stdout.decode()
+    return len([l for l in out.splitlines() if l and l[0] != '.'])
+
+
+def test_espresso_binary_cubes(tmp_path):
+    # never more cubes than the binary on random functions
+    rnd = random.Random(2)
+    for k in range(200):
+        num_vars = rnd.randint(3, 8)
+        onset, dc = random_function(rnd, num_vars, rnd.choice([0, 0.2, 0.4]))
+        if len(onset) == 0:
+            continue
+        F = espresso(onset, num_vars, dc)
+        check_cover(F, onset, dc, num_vars)
+        assert len(F) <= binary_num_cubes(onset, dc, num_vars, str(tmp_path / 'f.pla')), (num_vars, k)
+
+
+def test_espresso_known():
+    # x1 x2' + x2 x3, the consensus x1 x3 is redundant
+    onset = [Cube(0b111, m) for m in [0b100, 0b101, 0b011, 0b111]]
+    assert len(espresso(onset, 3)) == 2
+    # the parity of 3 vars has no smaller cover than its minterms
+    onset = [Cube(0b111, m) for m in range(8) if bin(m).count('1') % 2]
+    assert len(espresso(onset, 3)) == 4
+
+
+def test_espresso_multi_cover():
+    rnd = random.Random(1)
+    for k in range(50):
+        num_vars = rnd.randint(2, 6)
+        num_out = rnd.randint(2, 4)
+        full = (1 << num_vars) - 1
+        onsets = [[] for i in range(num_out)]
+        for m in range(1 << num_vars):
+            onsets[rnd.randrange(num_out)].append(Cube(full, m))
+        covers = espresso_multi(onsets, num_vars)
+        for F, on in zip(covers, onsets):
+            check_cover(F, on, [], num_vars)
@@ -0,0 +1,15 @@
+import pytest
+
+from conftest import encode_files, sdimacs_value
+from disk_cache import MemoCache
+
+
+@pytest.mark.parametrize('opt', ['esp', 'esp_multi'])
+def test_memo_same_formula(net_abc, tmp_path, opt):
+    uai_file, evid_file = net_abc
+    plain, writer = encode_files(uai_file, evid_file, str(tmp_path / 'plain'), opt=opt)
+    memo, writer = encode_files(uai_file, evid_file, str(tmp_path / 'memo'), opt=opt, min_memo=MemoCache(10))
+    assert memo == plain
+
+    value = sdimacs_value(memo['.sdimacs']) * 2**writer.scale_exponent('memo.sdimacs')
+    assert value == pytest.approx(0.5)
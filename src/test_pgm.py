@@ -0,0 +1,106 @@
+import os
+import sys
+import random
+
+import numpy as np
+import pytest
+
+import encode
+from PGM import Network, Node, TableView
+from conftest import read_net, write_file, encode_files
+
+
+def test_table_view():
+    cpt = TableView(np.arange(6, dtype=float), 3)
+    assert len(cpt) == 2
+    assert cpt[1] == [3.0, 4.0, 5.0]
+    assert cpt[1][2] == 5.0
+    # each row is converted once
+    assert cpt[0] is cpt[0]
+    assert list(cpt) == [[0.0, 1.0, 2.0], [3.0, 4.0, 5.0]]
+    assert np.array_equal(np.asarray(cpt), [[0, 1, 2], [3, 4, 5]])
+
+
+def network_summary(net):
+    return [(n.id, n.num_states, [p.id for p in n.parents], [c.id for c in n.children], np.asarray(n.cpt).tolist())
+            for n in net.nodes]
+
+
+def test_snapshot_round_trip(net_two, tmp_path, monkeypatch):
+    uai_file, evid_file = net_two
+    plain = read_net(uai_file, evid_file)
+    assert not os.path.exists(uai_file + '.npz')
+    saved = read_net(uai_file, evid_file, snapshot=True)
+    assert os.path.exists(uai_file + '.npz')
+    assert network_summary(saved) == network_summary(plain)
+
+    # read from the snapshot only
+    def fail(*args):
+        raise AssertionError('the uai file is parsed again')
+    monkeypatch.setattr(Network, 'read_uai', fail)
+    loaded = read_net(uai_file, evid_file, snapshot=True)
+    assert network_summary(loaded) == network_summary(plain)
+    monkeypatch.undo()
+
+    files, writer = encode_files(uai_file, evid_file, str(tmp_path / 'plain'))
+    snap_files, writer = encode_files(uai_file, evid_file, str(tmp_path / 'snap'), snapshot=True)
+    assert snap_files == files
+
+
+def test_snapshot_opt_in(net_two, monkeypatch):
+    uai_file, evid_file = net_two
+    net = Network(kind='BN', query='PE')
+    net.read(uai_file, evid_file)
+    assert not os.path.exists(uai_file + '.npz')
+
+    monkeypatch.setattr(sys, 'argv', ['encode.py', '-i', uai_file, '-e', evid_file, '-n', 'BN', '-m', 'bklm16'])
+    encode.main()
+    assert not os.path.exists(uai_file + '.npz')
+    monkeypatch.setattr(sys, 'argv', sys.argv + ['--snapshot'])
+    encode.main()
+    assert os.path.exists(uai_file + '.npz')
+
+
+def test_snapshot_stale(net_two):
+    uai_file, evid_file = net_two
+    read_net(uai_file, evid_file, snapshot=True)
+
+    # the same size, another value and mtime
+    f = open(uai_file, 'r')
+    text = f.read()
+    f.close()
+    write_file(uai_file, text.replace('0.3 0.7', '0.4 0.6'))
+    st = os.stat(uai_file)
+    os.utime(uai_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    net = read_net(uai_file, evid_file, snapshot=True)
+    assert np.asarray(net.nodes[0].cpt).tolist() == [[0.4, 0.6]]
+
+
+def chain_net(num_nodes, seed=0):
+    '''
+    a chain with a second parent among the previous ten nodes, listed in a random order
+    '''
+    rnd = random.Random(seed)
+    net = Network(kind='BN', query='PE')
+    nodes = [Node(i, 'chance') for i in range(num_nodes)]
+    for i in range(1, num_nodes):
+        for p in sorted(set([i - 1, rnd.randint(max(0, i - 10), i - 1)])):
+            nodes[i].parents.append(nodes[p])
+            nodes[p].children.append(nodes[i])
+    net.id2node = {n.id: n for n in nodes}
+    net.nodes = nodes[:]
+    rnd.shuffle(net.nodes)
+    net.query_var = [num_nodes - 1]
+    return net
+
+
+@pytest.mark.parametrize('method', [0, 1, 2])
+def test_deep_graph(method):
+    # deeper than the recursion limit
+    net = chain_net(20000)
+    net.mark_redundent()
+    assert all([n.depend for n in net.nodes])
+    net.topo_sort(method=method)
+    pos = {n.id: i for i, n in enumerate(net.nodes)}
+    assert all([pos[p.id] < pos[n.id] for n in net.nodes for p in n.parents])
+    assert net.find_connected_components() == 1
@@ -0,0 +1,119 @@
+import pytest
+
+import simplify_ssat
+from conftest import NET_ABC, NET_TWO, write_file, read_net, encode_files, sdimacs_value
+from preprocess import Preprocessor, preprocess
+from ssat_encoder import SSATEncoder
+from ssat_writer import SSATWriter
+
+
+def formula_text(clauses, prefix):
+    '''
+    the .sdimacs text of clauses quantified by prefix, a list of (quantifier, var, probability)
+    '''
+    lines = []
+    for (q, v, p) in prefix:
+        lines.append('r %r %d 0' % (p, v) if q == 'r' else '%s %d 0' % (q, v))
+    lines += [' '.join([str(l) for l in cl]) + ' 0' for cl in clauses]
+    return '\n'.join(lines).encode()
+
+
+def check_value(clauses, prefix, frozen=()):
+    '''
+    the value of the formula is the scale times the value of the clauses left
+    return the Preprocessor
+    '''
+    pre = Preprocessor(clauses, prefix, frozen)
+    pre.run()
+    left = [(q, v, p) for (q, v, p) in prefix if v not in pre.removed]
+    assert pre.scale * sdimacs_value(formula_text(pre.result(), left)) == \
+        pytest.approx(sdimacs_value(formula_text(clauses, prefix)))
+    return pre
+
+
+def encode_value(uai_file, evid_file, name, query, pre):
+    encoder = SSATEncoder(read_net(uai_file, evid_file, query), encode='bklm16', query=query, log_state=True,
+                          opt='none')
+    encoder.tossat()
+    if pre:
+        assert not preprocess(encoder).unsat
+    writer = SSATWriter(encoder)
+    writer.write_all([name + '.sdimacs'])
+    f = open(name + '.sdimacs', 'rb')
+    text = f.read()
+    f.close()
+    return sdimacs_value(text) * 2**writer.scale_exponent(name + '.sdimacs')
+
+
+@pytest.mark.parametrize('net, evid, value', [(NET_ABC, '1 2 1\n', {'PE': 0.5, 'MPE': 0.125, 'MAP': 0.25}),
+                                              (NET_TWO, '2 1 0 3 1\n', {'PE': 0.59 * 0.485, 'MPE': 0.56 * 0.375,
+                                                                         'MAP': 0.56 * 0.485})])
+@pytest.mark.parametrize('query', ['PE', 'MPE', 'MAP'])
+def test_preprocess_value(tmp_path, net, evid, value, query):
+    uai_file = write_file(tmp_path / 'net.uai', net)
+    evid_file = write_file(tmp_path / 'net.evid', evid)
+    # MAP over the first var
+    write_file(tmp_path / 'net.uai.map', '1 0\n')
+    plain = encode_value(uai_file, evid_file, str(tmp_path / 'plain'), query, False)
+    pre = encode_value(uai_file, evid_file, str(tmp_path / 'pre'), query, True)
+    assert pre == pytest.approx(plain)
+    assert plain == pytest.approx(value[query])
+
+
+def test_unit_random_scale():
+    prefix = [('r', 1, 0.3), ('r', 2, 0.6), ('e', 3, None)]
+    pre = check_value([[1], [-2], [-1, 2, 3], [1, -3]], prefix)
+    assert pre.removed >= {1, 2}
+    # P(x1) P(-x2)
+    assert pre.scale == pytest.approx(0.3 * 0.4)
+
+
+def test_substitute_same_or_inner_block():
+    # x3 == x1, the inner exist var is replaced by the outer one
+    prefix = [('e', 1, None), ('r', 2, 0.3), ('e', 3, None), ('r', 4, 0.6)]
+    pre = check_value([[-1, 3], [1, -3], [2, 3, 4], [-2, -3, -4]], prefix)
+    assert pre.stats['equivalent'] == 1
+    assert 3 in pre.removed and 1 not in pre.removed
+
+    # x1 == x2, an outer exist var is not replaced by an inner random var, nor the random var
+    prefix = [('e', 1, None), ('r', 2, 0.3), ('r', 3, 0.6)]
+    pre = check_value([[-1, 2], [1, -2], [1, 3], [-1, -3]], prefix)
+    assert pre.stats['equivalent'] == 0
+    assert 1 not in pre.removed and 2 not in pre.removed
+
+
+def test_eliminate_innermost_block():
+    prefix = [('e', 1, None), ('r', 2, 0.3), ('r', 3, 0.6), ('e', 4, None)]
+    pre = check_value([[1, 2], [-1, 3], [2, 4], [-4, 3]], prefix)
+    assert 4 in pre.removed
+    assert 1 not in pre.removed
+
+    # no exist block after the random vars
+    prefix = [('e', 1, None), ('r', 2, 0.3), ('r', 3, 0.6)]
+    pre = check_value([[1, 2], [-1, 3]], prefix)
+    assert pre.stats['eliminated'] == 0
+
+
+def test_threshold_and_frozen_kept():
+    prefix = [('t', 1, 0.5), ('r', 2, 0.3), ('e', 3, None)]
+    pre = Preprocessor([[1], [2], [-1, -2, 3], [1, 2, -3]], prefix, frozen=[2])
+    pre.run()
+    assert 1 not in pre.removed and 2 not in pre.removed
+    assert [1] in pre.result() and [2] in pre.result()
+    assert pre.scale == 1.0
+
+
+def test_simplify_ssat(net_two, tmp_path, capsys):
+    uai_file, evid_file = net_two
+    name = str(tmp_path / 'two')
+    files, writer = encode_files(uai_file, evid_file, name, exts=['.ssat'])
+    simplify_ssat.main(['simplify_ssat.py', name + '.ssat'])
+    scale = [float(line.split()[-1]) for line in capsys.readouterr().out.splitlines() if line.startswith('Scale')][0]
+
+    def value(filename):
+        num_vars, num_cls, var_str, cls_str = simplify_ssat.read_ssat(filename)
+        return sdimacs_value(formula_text([[int(l) for l in line.split()[:-1]] for line in cls_str if line.strip()],
+                                          simplify_ssat.read_prefix(var_str)))
+
+    assert scale * value(name + '-min.ssat') == pytest.approx(value(name + '.ssat'))
+    assert value(name + '.ssat') * 2**writer.scale_exponent(name + '.ssat') == pytest.approx(0.59 * 0.485)
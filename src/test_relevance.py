@@ -0,0 +1,97 @@
+import pytest
+
+from conftest import write_file, read_net, encode_files, sdimacs_value
+from relevance import prune_relevance
+
+# the chain A -> E -> D -> B of binary nodes
+NET_CHAIN = '''BAYES
+4
+2 2 2 2
+4
+1 0
+2 0 1
+2 1 2
+2 2 3
+
+2
+0.3 0.7
+4
+0.1 0.9
+0.6 0.4
+4
+0.2 0.8
+0.5 0.5
+4
+0.9 0.1
+0.4 0.6
+'''
+
+
+@pytest.fixture
+def net_chain(tmp_path):
+    '''
+    (uai file, evid file of E = 0), the MAP var is A and the SDP decision is D given E = 0
+    '''
+    uai_file = write_file(tmp_path / 'chain.uai', NET_CHAIN)
+    write_file(tmp_path / 'chain.uai.map', '1 0\n')
+    write_file(tmp_path / 'chain.uai.sdp', '2\n0\n1 1 0\n0.5\n')
+    return uai_file, write_file(tmp_path / 'chain.evid', '1 1 0\n')
+
+
+def value(uai_file, evid_file, name, query, **encoder_args):
+    files, writer = encode_files(uai_file, evid_file, name, exts=['.sdimacs'], query=query, **encoder_args)
+    return sdimacs_value(files['.sdimacs']) * 2**writer.scale_exponent(name + '.sdimacs')
+
+
+@pytest.mark.parametrize('query', ['PE', 'MPE', 'MAP'])
+@pytest.mark.parametrize('net', ['net_abc', 'net_two', 'net_chain'])
+def test_relevance_value(request, tmp_path, net, query):
+    uai_file, evid_file = request.getfixturevalue(net)
+    write_file(uai_file + '.map', '1 0\n')
+    plain = value(uai_file, evid_file, str(tmp_path / 'plain'), query)
+    assert value(uai_file, evid_file, str(tmp_path / 'rel'), query, relevance=True) == pytest.approx(plain)
+
+
+def removed(net):
+    return sorted([n.id for n in net.nodes if not n.depend])
+
+
+def test_evidence_edges_and_barren(net_chain):
+    uai_file, evid_file = net_chain
+    net = read_net(uai_file, evid_file, 'PE')
+    stats = prune_relevance(net)
+    # E -> D is cut and the row of E = 0 is left in the cpt of D
+    assert net.removed_edges == [(1, 2, 0)]
+    assert net.id2node[2].parents == []
+    assert list(net.id2node[2].cpt[0]) == pytest.approx([0.2, 0.8])
+    assert stats['evidence edges'] == (1, 2)
+    # D and B are not above the evidence
+    assert removed(net) == [2, 3]
+    assert stats['barren'][0] == 2
+
+
+def test_mpe_keeps_barren(net_chain):
+    uai_file, evid_file = net_chain
+    net = read_net(uai_file, evid_file, 'MPE')
+    stats = prune_relevance(net)
+    assert 'barren' not in stats
+    assert removed(net) == []
+
+
+def test_map_keeps_query(net_chain, tmp_path):
+    uai_file, evid_file = net_chain
+    # no evidence, only the MAP var A and its ancestors are cared
+    net = read_net(uai_file, write_file(tmp_path / 'none.evid', '0\n'), 'MAP')
+    prune_relevance(net)
+    assert removed(net) == [1, 2, 3]
+
+
+def test_d_separation(net_chain):
+    uai_file, evid_file = net_chain
+    net = read_net(uai_file, '', 'SDP')
+    stats = prune_relevance(net)
+    # B is barren, A and E are d-separated from D once the edge out of E is cut
+    assert stats['barren'][0] == 1
+    assert stats['d-separation'][0] == 2
+    assert removed(net) == [0, 1, 3]
+    assert not net.id2node[1].cared
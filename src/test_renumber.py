@@ -0,0 +1,126 @@
+import pytest
+
+from conftest import read_net, encode_files, sdimacs_value
+from elim_order import HEURISTICS
+from renumber import renumber
+from ssat_encoder import SSATEncoder
+from ssat_writer import SSATWriter
+
+# written by the encoder before renumber.py for the network of net_two
+PE_BKLM16 = '''p cnf 20 18
+r 0.5 1 0
+r 0.5 2 0
+r 0.5 4 0
+r 0.2 6 0
+r 0.5 7 0
+r 0.3 8 0
+r 0.6 9 0
+r 0.25 10 0
+r 0.9 11 0
+r 0.4 12 0
+r 0.75 13 0
+r 0.1 14 0
+r 0.3 15 0
+r 0.7 16 0
+r 0.1 17 0
+r 0.8 18 0
+r 0.9 19 0
+r 0.2 20 0
+e 5 0
+e 3 0
+1 2 0
+-1 -2 6 0
+-1 2 7 0
+1 -2 8 0
+-1 -2 -3 9 0
+-1 2 -3 10 0
+1 -2 -3 11 0
+-1 -2 3 12 0
+-1 2 3 13 0
+1 -2 3 14 0
+-4 15 0
+4 16 0
+-4 -5 17 0
+4 -5 18 0
+-4 5 19 0
+4 5 20 0
+5 0
+-3 0
+'''
+
+MPE_VAL = '''p cnf 20 18
+e 1 0
+e 2 0
+e 4 0
+r 0.2 6 0
+r 0.5 7 0
+r 0.3 8 0
+r 0.6 9 0
+r 0.4 10 0
+r 0.25 11 0
+r 0.75 12 0
+r 0.9 13 0
+r 0.1 14 0
+r 0.3 15 0
+r 0.7 16 0
+r 0.1 17 0
+r 0.9 18 0
+r 0.8 19 0
+r 0.2 20 0
+e 5 0
+e 3 0
+1 2 0
+-1 -2 6 0
+-1 2 7 0
+1 -2 8 0
+-1 -2 -3 9 0
+-1 -2 3 10 0
+-1 2 -3 11 0
+-1 2 3 12 0
+1 -2 -3 13 0
+1 -2 3 14 0
+-4 15 0
+4 16 0
+-4 -5 17 0
+-4 5 18 0
+4 -5 19 0
+4 5 20 0
+5 0
+-3 0
+'''
+
+
+def shape(text):
+    '''
+    the header, the sorted quantifiers and probs of the prefix and the sorted clause lengths
+    '''
+    lines = text.splitlines()
+    prefix = sorted([l.split()[:-2] for l in lines[1:] if l[0] in 'er'])
+    clauses = sorted([len(l.split()) for l in lines[1:] if l[0] not in 'er'])
+    return lines[0], prefix, clauses
+
+
+@pytest.mark.parametrize('query, method, expected', [('PE', 'bklm16', PE_BKLM16), ('MPE', 'val', MPE_VAL)])
+def test_renumber_off_same_formula(net_two, tmp_path, query, method, expected):
+    uai_file, evid_file = net_two
+    files, writer = encode_files(uai_file, evid_file, str(tmp_path / 'out'), exts=['.sdimacs'], query=query,
+                                 encode=method)
+    assert files['.sdimacs'].decode() == expected
+
+
+@pytest.mark.parametrize('heuristic', HEURISTICS)
+def test_renumber_same_value(net_two, tmp_path, heuristic):
+    uai_file, evid_file = net_two
+    encoder = SSATEncoder(read_net(uai_file, evid_file), encode='bklm16', query='PE', log_state=True, opt='none')
+    encoder.tossat()
+    renumber(encoder, heuristic)
+    writer = SSATWriter(encoder)
+    writer.write_all([str(tmp_path / 'out.sdimacs')])
+    f = open(tmp_path / 'out.sdimacs', 'rb')
+    text = f.read()
+    f.close()
+
+    # the same prefix and clauses up to the renaming
+    assert shape(text.decode()) == shape(PE_BKLM16)
+    value = sdimacs_value(text) * 2**writer.scale_exponent('out.sdimacs')
+    assert value == pytest.approx(0.59 * 0.485)
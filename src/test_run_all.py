@@ -0,0 +1,142 @@
+import os
+import time
+
+import pytest
+
+from conftest import write_file
+from run_all import JobDB, Scheduler, order_jobs
+
+# appends its file to ran.log in the directory of the jobs
+LOG_SCRIPT = 'echo "$1" >> ran.log\n'
+
+# leaves a child in its group, then spins or sleeps
+SPIN_SCRIPT = 'sleep 60 &\necho $! > "$1.pid"\nwhile :; do :; done\n'
+SLEEP_SCRIPT = 'sleep 60 &\necho $! > "$1.pid"\nsleep 60\n'
+
+
+def make_jobs(tmp_path, sizes):
+    files = []
+    for name, size in sizes:
+        files.append(write_file(tmp_path / name, 'x' * size))
+    return files
+
+
+def ran(tmp_path):
+    f = open(str(tmp_path / 'ran.log'))
+    lines = f.read().split()
+    f.close()
+    return sorted(lines)
+
+
+def alive(pid):
+    try:
+        f = open('/proc/%d/stat' % (pid))
+    except FileNotFoundError:
+        return False
+    state = f.read().rsplit(')', 1)[1].split()[0]
+    f.close()
+    return state != 'Z'
+
+
+def run_pending(db, script, files, tmp_path, **limits):
+    scheduler = Scheduler(db, script, 2, cwd=str(tmp_path), **limits)
+    scheduler.run(order_jobs(db, db.pending(script, files)))
+
+
+def test_resume_unfinished(tmp_path):
+    files = make_jobs(tmp_path, [('a.txt', 3), ('b.txt', 2), ('c.txt', 1)])
+    script = write_file(tmp_path / 'log.sh', LOG_SCRIPT)
+    db_file = str(tmp_path / 'run_all.db')
+    db = JobDB(db_file)
+    db.add(script, files)
+    # interrupted with a done, b running and c not started
+    db.finish(script, files[0], 'done', 0, 1.0, 0, 1.0)
+    db.set_status(script, files[1], 'running')
+    db.conn.close()
+
+    db = JobDB(db_file)
+    db.add(script, files)
+    assert sorted([f for (f, size, cpu) in db.pending(script, files)]) == files[1:]
+    run_pending(db, script, files, tmp_path)
+    assert ran(tmp_path) == files[1:]
+    assert db.summary(script) == {'done': 3}
+
+    # nothing left to run
+    db.add(script, files)
+    assert db.pending(script, files) == []
+
+
+def test_changed_file_rescheduled(tmp_path):
+    files = make_jobs(tmp_path, [('a.txt', 3), ('b.txt', 2), ('c.txt', 1)])
+    script = write_file(tmp_path / 'log.sh', LOG_SCRIPT)
+    db = JobDB(str(tmp_path / 'run_all.db'))
+    db.add(script, files)
+    for f in files:
+        db.finish(script, f, 'done', 0, 1.0, 0, 1.0)
+
+    # a grows, b is edited in place with the same size
+    write_file(tmp_path / 'a.txt', 'x' * 10)
+    write_file(tmp_path / 'b.txt', 'yy')
+    st = os.stat(files[1])
+    os.utime(files[1], (st.st_atime, st.st_mtime + 10))
+    db.add(script, files)
+    pending = sorted(db.pending(script, files))
+    assert [(f, size) for (f, size, cpu) in pending] == [(files[0], 10), (files[1], 2)]
+
+
+def test_earlier_db_without_mtime(tmp_path):
+    files = make_jobs(tmp_path, [('a.txt', 3)])
+    db = JobDB(str(tmp_path / 'run_all.db'))
+    db.conn.execute('DROP TABLE jobs')
+    db.conn.execute('''CREATE TABLE jobs (
+            script TEXT, file TEXT, size INTEGER, status TEXT, exit_code INTEGER,
+            cpu_time REAL, max_rss INTEGER, wall_time REAL, finished REAL,
+            PRIMARY KEY (script, file))''')
+    db.conn.execute("INSERT INTO jobs (script, file, size, status) VALUES ('s', ?, 3, 'done')", (files[0],))
+    db.conn.commit()
+    db.conn.close()
+
+    # the same size is not run again, and the mtime is recorded
+    db = JobDB(str(tmp_path / 'run_all.db'))
+    db.add('s', files)
+    assert db.pending('s', files) == []
+    assert db.conn.execute('SELECT mtime FROM jobs').fetchone()[0] == os.stat(files[0]).st_mtime
+
+
+@pytest.mark.parametrize('script_text, limits', [(SPIN_SCRIPT, {'cpu_time': 1}),
+                                                 (SLEEP_SCRIPT, {'wall_time': 1})])
+def test_limit_timeout(tmp_path, script_text, limits):
+    files = make_jobs(tmp_path, [('a.txt', 1)])
+    script = write_file(tmp_path / 'job.sh', script_text)
+    db = JobDB(str(tmp_path / 'run_all.db'))
+    db.add(script, files)
+    start = time.time()
+    run_pending(db, script, files, tmp_path, **limits)
+    assert time.time() - start < 30
+    assert db.summary(script) == {'timeout': 1}
+
+    # the child left in the group of the job is killed too
+    f = open(files[0] + '.pid')
+    pid = int(f.read())
+    f.close()
+    for k in range(50):
+        if not alive(pid):
+            break
+        time.sleep(0.1)
+    assert not alive(pid)
+
+
+def test_order_jobs(tmp_path):
+    db = JobDB(str(tmp_path / 'run_all.db'))
+    jobs = [('a', 5, None), ('b', 30, 1.0), ('c', 20, None), ('d', 30, None)]
+    # largest file first, the ties by name
+    assert order_jobs(db, jobs) == [('b', 30), ('d', 30), ('c', 20), ('a', 5)]
+    # no job finished: the cpu time of an earlier run of the file, else the size
+    assert order_jobs(db, jobs, 'cost') == [('d', 30), ('c', 20), ('a', 5), ('b', 1.0)]
+
+    # 0.1 s per byte over the jobs done, the cpu time of an earlier run of the file first
+    files = make_jobs(tmp_path, [('e.txt', 100)])
+    db.add('s', files)
+    db.finish('s', files[0], 'done', 0, 10.0, 0, 10.0)
+    assert order_jobs(db, jobs, 'cost') == [('d', pytest.approx(3.0)), ('c', pytest.approx(2.0)),
+                                            ('b', 1.0), ('a', pytest.approx(0.5))]
@@ -0,0 +1,142 @@
+import random
+import itertools
+
+import pytest
+
+from conftest import write_file, read_net, encode_files
+from cube import Cube, assign2cube
+from ssat_encoder import SSATEncoder
+
+# C | A, B with 2, 3 and 3 states, probs of 1, repeated and equal once rounded
+NET_FAMILY = '''BAYES
+3
+2 3 3
+3
+1 0
+1 1
+3 0 1 2
+
+2
+0.3 0.7
+3
+0.2 0.30000000000000004 0.5
+18
+1.0 0.0 0.0
+0.3 0.30000000000000004 0.4
+0.2 0.3 0.5
+0.5 0.2 0.3
+0.4 0.3 0.3
+0.0 1.0 0.0
+'''
+
+
+@pytest.mark.parametrize('method, opt', [('bklm16', 'none'), ('bklm16', 'esp'), ('val', 'none'),
+                                         ('bklm16', 'esp_multi')])
+def test_parallel_same_formula(net_two, tmp_path, method, opt):
+    uai_file, evid_file = net_two
+    plain, writer = encode_files(uai_file, evid_file, str(tmp_path / 'plain'), encode=method, opt=opt)
+    parallel, writer = encode_files(uai_file, evid_file, str(tmp_path / 'parallel'), encode=method, opt=opt, jobs=2)
+    assert parallel == plain
+
+
+def pairwise_merge(clauses, dc_clauses=[]):
+    '''
+    the merging of merge_state_cls by comparing every pair of clauses
+    '''
+    remain_clauses = clauses.copy() + dc_clauses.copy()
+    final_clauses = []
+    while len(remain_clauses) > 0:
+        new_clauses = []
+        is_merged_id = []
+        for i, cl1 in enumerate(remain_clauses):
+            for j in range(i+1, len(remain_clauses)):
+                cl2 = remain_clauses[j]
+                if len(cl1) != len(cl2) or [abs(v) for v in cl1] != [abs(v) for v in cl2]:
+                    continue
+                diff = [k for k in range(len(cl1)) if cl1[k] != cl2[k]]
+                if len(diff) != 1:
+                    continue
+                for k in [i, j]:
+                    if k not in is_merged_id:
+                        is_merged_id.append(k)
+                new_clauses.append(cl1[:diff[0]] + cl1[diff[0]+1:])
+        for i, cl in enumerate(remain_clauses):
+            if i not in is_merged_id and cl not in final_clauses and cl not in dc_clauses:
+                final_clauses.append(cl)
+        remain_clauses = new_clauses
+    return final_clauses
+
+
+def test_merge_state_cls_pairwise():
+    rnd = random.Random(0)
+    for k in range(1000):
+        vars = sorted(rnd.sample(range(1, 9), rnd.randint(1, 5)))
+
+        def random_clause():
+            # most on all the vars, some on a subset
+            vs = vars if rnd.random() < 0.7 else sorted(rnd.sample(vars, rnd.randint(1, len(vars))))
+            return [v if rnd.random() < 0.5 else -v for v in vs]
+
+        clauses = [random_clause() for i in range(rnd.randint(0, 12))]
+        # duplicates, and don't cares also among the clauses
+        clauses += [list(cl) for cl in rnd.sample(clauses, min(len(clauses), 2))]
+        dc = [random_clause() for i in range(rnd.randint(0, 3))]
+        if len(clauses) > 0 and rnd.random() < 0.3:
+            dc.append(list(rnd.choice(clauses)))
+        expected = pairwise_merge([list(cl) for cl in clauses], [list(cl) for cl in dc])
+        assert SSATEncoder.merge_state_cls(None, clauses, dc) == expected, (clauses, dc)
+
+
+def reference_merge_list(encoder, n, seperate_state):
+    '''
+    the merge list of cpt2merge_list by a loop over the rows and states
+    '''
+    state_cls = encoder.node_id2state_cls[n.id]
+    combs = [sum([list(cl) for cl in c], []) for c in
+             itertools.product(*[encoder.node_id2state_cls[r.id] for r in n.parents])]
+    num_state_var = len(state_cls[0])
+    state_cubes = [assign2cube(encoder.implication(s, False)) for s in state_cls]
+    merge_list = [{} for i in range(n.num_states)] if seperate_state else {}
+    for j, comb in enumerate(combs):
+        base = assign2cube([-v for v in comb])
+        for i in range(n.num_states):
+            prob = float(n.cpt[j][i])
+            if prob == 1:
+                continue
+            pat = Cube((base.care << num_state_var) | state_cubes[i].care,
+                       (base.value << num_state_var) | state_cubes[i].value)
+            lists = merge_list[i] if seperate_state else merge_list
+            lists.setdefault(round(prob, encoder.digit), []).append(pat)
+    return merge_list
+
+
+def check_merge_list(encoder, n):
+    for seperate_state in [False, True]:
+        res = encoder.cpt2merge_list(n, seperate_state)
+        expected = reference_merge_list(encoder, n, seperate_state)
+        if not seperate_state:
+            res = [res]
+            expected = [expected]
+        for a, b in zip(res, expected):
+            # the keys in order, the cubes in order and of python ints
+            assert list(a.keys()) == list(b.keys())
+            assert a == b
+            assert all([type(c.value) is int for cubes in a.values() for c in cubes])
+
+
+@pytest.mark.parametrize('wide', [False, True])
+def test_cpt2merge_list(tmp_path, wide):
+    encoder = SSATEncoder(read_net(write_file(tmp_path / 'family.uai', NET_FAMILY)), encode='bklm16', query='PE',
+                          log_state=True, opt='none')
+    encoder.tossat()
+    if wide:
+        # the state clauses of the parents padded to 40 vars each, the cubes of C take 82 bits
+        for r in [0, 1]:
+            state_cls = encoder.node_id2state_cls[r]
+            encoder.node_id2state_cls[r] = [list(cl) + [(-1) ** (i + t) * (1000 + 100 * r + t)
+                                                        for t in range(40 - len(cl))]
+                                            for i, cl in enumerate(state_cls)]
+        row_vals, num_var = encoder.cpt_row_values(encoder.net.id2node[2])
+        assert row_vals.dtype == object and num_var == 80
+    for n in encoder.net.nodes:
+        check_merge_list(encoder, n)
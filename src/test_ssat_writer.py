@@ -0,0 +1,49 @@
+import pytest
+
+from conftest import read_net, sdimacs_value
+from ssat_encoder import SSATEncoder
+from ssat_writer import SSATWriter, format_clauses
+
+
+def read_bytes(filename):
+    f = open(filename, 'rb')
+    data = f.read()
+    f.close()
+    return data
+
+
+@pytest.mark.parametrize('query, method, exts', [
+    ('PE', 'bklm16', ['.sdimacs', '.ssat', '.wcnf']),
+    ('PE', 'all05', ['.sdimacs', '.ssat', '.wcnf', '.cnf']),
+    ('MPE', 'bklm16', ['.sdimacs', '.ssat']),
+])
+def test_write_all_same_as_each(net_two, tmp_path, query, method, exts):
+    uai_file, evid_file = net_two
+    encoder = SSATEncoder(read_net(uai_file, evid_file, query), encode=method, query=query, log_state=True, opt='none')
+    encoder.tossat()
+    writer = SSATWriter(encoder)
+    writer.write_all([str(tmp_path / ('all' + ext)) for ext in exts])
+    for ext in exts:
+        SSATWriter(encoder).write_all([str(tmp_path / ('one' + ext))])
+        assert read_bytes(tmp_path / ('all' + ext)) == read_bytes(tmp_path / ('one' + ext))
+
+    if method == 'bklm16' and query == 'PE':
+        value = sdimacs_value(read_bytes(tmp_path / 'all.sdimacs')) * 2**writer.scale_exponent('all.sdimacs')
+        assert value == pytest.approx(0.59 * 0.485)
+
+
+def test_format_clauses():
+    lits = [1, -2, 0, 0, 3, 0, -10, 10, 0]
+    text = '1 -2 0\n0\n3 0\n-10 10 0\n'
+    assert format_clauses(lits) == text
+    table = ['0\n'] + ['%d ' % i for i in range(1, 11)] + ['%d ' % i for i in range(-10, 0)]
+    assert format_clauses(lits, table) == text
+
+
+def test_literal_out_of_range(net_two, tmp_path):
+    uai_file, evid_file = net_two
+    encoder = SSATEncoder(read_net(uai_file, evid_file), encode='bklm16', query='PE', log_state=True, opt='none')
+    encoder.tossat()
+    encoder.clauses.append([encoder.var_id + 1])
+    with pytest.raises(ValueError):
+        SSATWriter(encoder).write_all([str(tmp_path / 'out.sdimacs')])